@@ -28,9 +28,15 @@ MQTT_USERNAME = config['NetworkSettings']['MQTT_USERNAME']
 MQTT_PASSWORD = config['NetworkSettings']['MQTT_PASSWORD']
 
 SENSOR_VALUES_TOPIC = config['NetworkSettings']['SENSOR_VALUES_TOPIC']
+EVENT_LOG_TOPIC = config['NetworkSettings']['EVENT_LOG_TOPIC']
 SET_TEMP_TOPIC = config['NetworkSettings']['SET_TEMP_TOPIC']
 COMMAND_TOPIC = config['NetworkSettings']['COMMAND_TOPIC']
 
+MQTT_KEEPALIVE = config['NetworkSettings']['MQTT_KEEPALIVE']
+MQTT_CONNECT_TIMEOUT = config['NetworkSettings']['MQTT_CONNECT_TIMEOUT']
+RECONNECT_MIN_DELAY = config['NetworkSettings']['RECONNECT_MIN_DELAY']
+RECONNECT_MAX_DELAY = config['NetworkSettings']['RECONNECT_MAX_DELAY']
+
 # ┌─────────────────────┐
 # │ Safety Limits       │
 # └─────────────────────┘
@@ -45,11 +51,42 @@ OUTPUT_SENSOR_BETA = config['SensorSettings']['OUTPUT_SENSOR_BETA']
 EXHAUST_SENSOR_TYPE = config['SensorSettings']['EXHAUST_SENSOR_TYPE']
 EXHAUST_SENSOR_BETA = config['SensorSettings']['EXHAUST_SENSOR_BETA']
 
+# ┌─────────────────────┐
+# │ Sampling Settings   │
+# └─────────────────────┘
+ADC_SAMPLE_PERIOD_MS = config['SamplingSettings']['ADC_SAMPLE_PERIOD_MS']
+ADC_BURST_SIZE = config['SamplingSettings']['ADC_BURST_SIZE']
+ADC_REDUCTION = config['SamplingSettings']['ADC_REDUCTION']
+ADC_TRIM_COUNT = config['SamplingSettings']['ADC_TRIM_COUNT']
+
+# ┌─────────────────────┐
+# │ Scheduler           │
+# └─────────────────────┘
+SENSOR_RATE_HZ = config['Scheduler']['SENSOR_RATE_HZ']
+CONTROL_RATE_HZ = config['Scheduler']['CONTROL_RATE_HZ']
+MONITOR_RATE_HZ = config['Scheduler']['MONITOR_RATE_HZ']
+NETWORK_RATE_HZ = config['Scheduler']['NETWORK_RATE_HZ']
+MQTT_POLL_RATE_HZ = config['Scheduler']['MQTT_POLL_RATE_HZ']
+FAN_RATE_HZ = config['Scheduler']['FAN_RATE_HZ']
+LIVENESS_PERIODS = config['Scheduler']['LIVENESS_PERIODS']
+LIVENESS_MIN_DEADLINE = config['Scheduler']['LIVENESS_MIN_DEADLINE']
+LIVENESS_CRITICAL = config['Scheduler']['LIVENESS_CRITICAL']
+
+# ┌─────────────────────┐
+# │ Sensor Filters      │
+# └─────────────────────┘
+OUTPUT_FILTER = config['SensorFilters']['OUTPUT_FILTER']
+EXHAUST_FILTER = config['SensorFilters']['EXHAUST_FILTER']
+
 # ┌─────────────────────┐
 # │ Temperature Control │
 # └─────────────────────┘
 TARGET_TEMP = config['TemperatureControl']['TARGET_TEMP']
 CONTROL_MAX_DELTA = config['TemperatureControl']['CONTROL_MAX_DELTA']
+CONTROL_MODE = config['TemperatureControl']['CONTROL_MODE']
+HEAT_KP = config['TemperatureControl']['HEAT_KP']
+HEAT_KI = config['TemperatureControl']['HEAT_KI']
+FUEL_AIR_MAP = config['TemperatureControl']['FUEL_AIR_MAP']
 
 # ┌─────────────────────┐
 # │ Fan Control         │
@@ -61,6 +98,13 @@ FAN_MAX_DUTY = config['FanControl']['FAN_MAX_DUTY']
 MIN_FAN_PERCENTAGE = config['FanControl']['MIN_FAN_PERCENTAGE']
 MAX_FAN_PERCENTAGE = config['FanControl']['MAX_FAN_PERCENTAGE']
 FAN_START_PERCENTAGE = config['FanControl']['FAN_START_PERCENTAGE']
+FAN_KP = config['FanControl']['FAN_KP']
+FAN_KI = config['FanControl']['FAN_KI']
+FAN_KD = config['FanControl']['FAN_KD']
+FAN_INTEGRAL_BAND = config['FanControl']['FAN_INTEGRAL_BAND']
+FAN_STALL_TIMEOUT_MS = config['FanControl']['FAN_STALL_TIMEOUT_MS']
+FAN_CURVE_POINTS = config['FanControl']['FAN_CURVE_POINTS']
+FAN_CURVE_SETTLE_TIME = config['FanControl']['FAN_CURVE_SETTLE_TIME']
 
 # ┌─────────────────────┐
 # │ Fuel Pump Control   │
@@ -68,11 +112,14 @@ FAN_START_PERCENTAGE = config['FanControl']['FAN_START_PERCENTAGE']
 MIN_PUMP_FREQUENCY = config['FuelPumpControl']['MIN_PUMP_FREQUENCY']
 MAX_PUMP_FREQUENCY = config['FuelPumpControl']['MAX_PUMP_FREQUENCY']
 PUMP_ON_TIME = config['FuelPumpControl']['PUMP_ON_TIME']
+PUMP_RAMP_RATE = config['FuelPumpControl']['PUMP_RAMP_RATE']
 
 # ┌─────────────────────┐
 # │ Emergency Handling  │
 # └─────────────────────┘
 EMERGENCY_STOP_TIMER = config['EmergencyHandling']['EMERGENCY_STOP_TIMER']
+EMERGENCY_REASSERT_PERIOD = config['EmergencyHandling']['EMERGENCY_REASSERT_PERIOD']
+EMERGENCY_RESET_INTERVAL = config['EmergencyHandling']['EMERGENCY_RESET_INTERVAL']
 
 # ┌─────────────────────┐
 # │ Startup Settings    │
@@ -80,7 +127,19 @@ EMERGENCY_STOP_TIMER = config['EmergencyHandling']['EMERGENCY_STOP_TIMER']
 STARTUP_TIME_LIMIT = config['StartupSettings']['STARTUP_TIME_LIMIT']
 FAILURE_STATE_RETRIES = config['StartupSettings']['FAILURE_STATE_RETRIES']
 GLOW_PLUG_HEAT_UP_TIME = config['StartupSettings']['GLOW_PLUG_HEAT_UP_TIME']
+GLOW_PLUG_MIN_HEAT_UP_TIME = config['StartupSettings']['GLOW_PLUG_MIN_HEAT_UP_TIME']
+GLOW_PLUG_COLD_TEMP = config['StartupSettings']['GLOW_PLUG_COLD_TEMP']
+GLOW_PLUG_WARM_TEMP = config['StartupSettings']['GLOW_PLUG_WARM_TEMP']
 INITIAL_FAN_SPEED_PERCENTAGE = config['StartupSettings']['INITIAL_FAN_SPEED_PERCENTAGE']
+STARTUP_EXHAUST_TEMP = config['StartupSettings']['STARTUP_EXHAUST_TEMP']
+RAMP_STEPS = config['StartupSettings']['RAMP_STEPS']
+RAMP_SAMPLE_COUNT = config['StartupSettings']['RAMP_SAMPLE_COUNT']
+RAMP_MIN_TEMP_RISE = config['StartupSettings']['RAMP_MIN_TEMP_RISE']
+RAMP_RISE_WINDOW = config['StartupSettings']['RAMP_RISE_WINDOW']
+RAMP_RISE_RATE = config['StartupSettings']['RAMP_RISE_RATE']
+RAMP_RISE_T = config['StartupSettings']['RAMP_RISE_T']
+RAMP_FAN_STEP_PERCENTAGE = config['StartupSettings']['RAMP_FAN_STEP_PERCENTAGE']
+RAMP_PUMP_STEP_FREQUENCY = config['StartupSettings']['RAMP_PUMP_STEP_FREQUENCY']
 
 # ┌─────────────────────┐
 # │ Shutdown Settings   │
@@ -89,9 +148,26 @@ SHUTDOWN_TIME_LIMIT = config['ShutdownSettings']['SHUTDOWN_TIME_LIMIT']
 COOLDOWN_MIN_TIME = config['ShutdownSettings']['COOLDOWN_MIN_TIME']
 EXHAUST_SHUTDOWN_TEMP = config['ShutdownSettings']['EXHAUST_SHUTDOWN_TEMP']
 
+# ┌─────────────────────┐
+# │ Autotune            │
+# └─────────────────────┘
+AUTOTUNE_CYCLES = config['Autotune']['AUTOTUNE_CYCLES']
+FAN_AUTOTUNE_AMPLITUDE = config['Autotune']['FAN_AUTOTUNE_AMPLITUDE']
+FAN_AUTOTUNE_HYSTERESIS = config['Autotune']['FAN_AUTOTUNE_HYSTERESIS']
+FAN_AUTOTUNE_TIMEOUT = config['Autotune']['FAN_AUTOTUNE_TIMEOUT']
+TEMP_AUTOTUNE_AMPLITUDE = config['Autotune']['TEMP_AUTOTUNE_AMPLITUDE']
+TEMP_AUTOTUNE_HYSTERESIS = config['Autotune']['TEMP_AUTOTUNE_HYSTERESIS']
+TEMP_AUTOTUNE_TIMEOUT = config['Autotune']['TEMP_AUTOTUNE_TIMEOUT']
+
 # ┌─────────────────────┐
 # │ Flame-out Detection │
 # └─────────────────────┘
+FLAME_OUT_DETECTOR = config['FlameOutDetection']['FLAME_OUT_DETECTOR']
+FLAME_OUT_WINDOW = config['FlameOutDetection']['FLAME_OUT_WINDOW']
+FLAME_OUT_SLOPE = config['FlameOutDetection']['FLAME_OUT_SLOPE']
+FLAME_OUT_FUEL_GAIN = config['FlameOutDetection']['FLAME_OUT_FUEL_GAIN']
+FLAME_OUT_FUEL_TAU = config['FlameOutDetection']['FLAME_OUT_FUEL_TAU']
+FLAME_OUT_T = config['FlameOutDetection']['FLAME_OUT_T']
 EXHAUST_TEMP_HISTORY_LENGTH = config['FlameOutDetection']['EXHAUST_TEMP_HISTORY_LENGTH']
 MIN_TEMP_DELTA = config['FlameOutDetection']['MIN_TEMP_DELTA']
 
@@ -100,17 +176,25 @@ MIN_TEMP_DELTA = config['FlameOutDetection']['MIN_TEMP_DELTA']
 # └─────────────────────┘
 LOG_LEVEL = config['LoggingLevel']['LOG_LEVEL']
 
+# ┌─────────────────────┐
+# │ Event Log           │
+# └─────────────────────┘
+EVENT_LOG_FILES = config['EventLog']['EVENT_LOG_FILES']
+EVENT_LOG_RECORDS = config['EventLog']['EVENT_LOG_RECORDS']
+
 # ┌─────────────────────┐
 # │ Global Variables    │
 # └─────────────────────┘
 pump_frequency = 0
+heat_demand = 0
 startup_attempts = 0
 startup_successful = True
+startup_time = 0  # Seconds the last successful startup took to reach RUNNING
 current_state = 'OFF'
 emergency_reason = None
 output_temp = 0
 exhaust_temp = 0
-heartbeat = utime.time()
+heartbeat = utime.ticks_ms()
 fan_speed_percentage = 0
 fan_rpm = 0
 
@@ -0,0 +1,120 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# Background ADC oversampling. A hardware timer takes a burst of reads from each
+# temperature ADC, reduces it to one value and publishes it for the sensor code.
+import utime
+from array import array
+from machine import Timer
+import hardwareConfig as config
+from lib import interrupts
+
+
+def log(message, level=1):
+    if config.LOG_LEVEL >= level:
+        print(f"[ADC Sampler] {message}")
+
+
+class BurstSampler:
+    def __init__(self, adc, burst_size, reduction, trim):
+        self.read = adc.read  # Bound once, so the timer callback doesn't allocate it every burst
+        self.samples = array('H', [0] * burst_size)
+        self.use_median = reduction == 'median'
+        # Never trim away the whole burst
+        self.trim = min(trim, (burst_size - 1) // 2)
+        self.value = -1  # Latest reduced ADC reading, -1 until the first burst is done
+        self.bursts = 0
+
+    def sample(self):
+        read = self.read
+        samples = self.samples
+        count = len(samples)
+
+        # Take the burst and insertion sort it in place, bursts are small
+        for i in range(count):
+            value = read()
+            j = i
+            while j > 0 and samples[j - 1] > value:
+                samples[j] = samples[j - 1]
+                j -= 1
+            samples[j] = value
+
+        if self.use_median:
+            middle = count >> 1
+            if count & 1:
+                value = samples[middle]
+            else:
+                value = (samples[middle - 1] + samples[middle]) >> 1
+        else:
+            total = 0
+            for i in range(self.trim, count - self.trim):
+                total += samples[i]
+            value = total // (count - 2 * self.trim)
+
+        # A single int store, so readers always see a whole value
+        self.value = value
+        self.bursts += 1
+
+
+output_sampler = BurstSampler(config.OUTPUT_TEMP_ADC, config.ADC_BURST_SIZE, config.ADC_REDUCTION,
+                              config.ADC_TRIM_COUNT)
+exhaust_sampler = BurstSampler(config.EXHAUST_TEMP_ADC, config.ADC_BURST_SIZE, config.ADC_REDUCTION,
+                               config.ADC_TRIM_COUNT)
+
+sample_timer = Timer(2)
+burst_us = 0  # utime.ticks_us() when the latest bursts were done
+burst_done = None  # trigger_ref of the interrupts.Deferred given to start(), called after every burst
+
+
+@interrupts.handler
+def sample_callback(_):
+    global burst_us
+    output_sampler.sample()
+    exhaust_sampler.sample()
+    burst_us = utime.ticks_us()
+    if burst_done is not None:
+        burst_done(0)
+
+
+def start(done=None):
+    """
+    Start sampling every ADC_SAMPLE_PERIOD_MS. done is an interrupts.Deferred to trigger
+    once both bursts are in, for whatever has to see every one of them.
+    """
+    global burst_done
+    log(f"Sampling {config.ADC_BURST_SIZE} reads every {config.ADC_SAMPLE_PERIOD_MS} ms ({config.ADC_REDUCTION})",
+        level=2)
+    if done is not None:
+        burst_done = done.trigger_ref
+    sample_callback(None)  # Have a value ready before the first sensor read
+    sample_timer.init(period=config.ADC_SAMPLE_PERIOD_MS, mode=Timer.PERIODIC, callback=sample_callback)
+
+
+def stop():
+    sample_timer.deinit()
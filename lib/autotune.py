@@ -0,0 +1,226 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# Relay feedback (Astrom-Hagglund) autotuning for the fan RPM and the output temperature
+# loops.
+#
+# While a tuner runs it takes over its loop's output and switches it between a low and a
+# high level whenever the measurement crosses the setpoint. The loop then oscillates at
+# its ultimate period Tu, and the size of the oscillation gives the ultimate gain Ku.
+# The gains worked out from them are applied right away and saved to config.json.
+import math
+import utime
+import hardwareConfig as config
+from lib import helpers
+
+
+def log(message, level=1):
+    if config.LOG_LEVEL >= level:
+        print(f"[Autotune] {message}")
+
+
+# The fan is only tuned while the burner is out, the relay swings the air by a lot
+FAN_TUNE_STATES = ('OFF', 'STANDBY')
+
+
+class RelayTuner:
+    def __init__(self, name, on_result):
+        self.name = name
+        self.on_result = on_result  # on_result(ku, tu) applies and saves gains, returns a status
+        self.running = False
+        self.status = "idle"
+
+    def begin(self, setpoint, low, high, hysteresis, cycles, timeout):
+        self.setpoint = setpoint
+        self.low = low
+        self.high = high
+        self.hysteresis = hysteresis
+        self.cycles = cycles
+        self.timeout_ms = int(timeout * 1000)
+        self.output = high
+        self.started = utime.ticks_ms()
+        self.cycle_started = None  # When the output last switched from high to low
+        self.peak_high = setpoint
+        self.peak_low = setpoint
+        self.recorded = -1  # The first full cycle still carries the start transient and isn't used
+        self.period_sum_ms = 0
+        self.amplitude_sum = 0.0
+        self.running = True
+        self.status = "running"
+        log(f"Tuning the {self.name} loop: setpoint {setpoint}, relay {low}..{high}")
+
+    def cancel(self, reason):
+        if self.running:
+            self.running = False
+            self.status = f"cancelled, {reason}"
+            log(f"{self.name} tuning cancelled: {reason}")
+
+    def _fail(self, reason):
+        self.running = False
+        self.status = f"failed, {reason}"
+        log(f"{self.name} tuning failed: {reason}", level=0)
+
+    def step(self, measurement, now_ms):
+        """
+        Returns the relay output for this measurement, or None once the experiment is
+        over and the loop's own controller should take back over.
+        """
+        if not self.running:
+            return None
+        if utime.ticks_diff(now_ms, self.started) > self.timeout_ms:
+            self._fail(f"no steady oscillation within {self.timeout_ms // 1000}s")
+            return None
+
+        if measurement > self.peak_high:
+            self.peak_high = measurement
+        if measurement < self.peak_low:
+            self.peak_low = measurement
+
+        if self.output == self.high and measurement > self.setpoint + self.hysteresis:
+            self.output = self.low
+            self._end_cycle(measurement, now_ms)
+        elif self.output == self.low and measurement < self.setpoint - self.hysteresis:
+            self.output = self.high
+        return self.output if self.running else None
+
+    def _end_cycle(self, measurement, now_ms):
+        if self.cycle_started is not None:
+            if self.recorded >= 0:
+                self.period_sum_ms += utime.ticks_diff(now_ms, self.cycle_started)
+                self.amplitude_sum += (self.peak_high - self.peak_low) / 2
+            self.recorded += 1
+            self.status = f"running, cycle {max(self.recorded, 0)} of {self.cycles}"
+        self.cycle_started = now_ms
+        self.peak_high = measurement
+        self.peak_low = measurement
+        if self.recorded >= self.cycles:
+            self._finish()
+
+    def _finish(self):
+        self.running = False
+        amplitude = self.amplitude_sum / self.recorded
+        tu = self.period_sum_ms / self.recorded / 1000
+        if amplitude <= self.hysteresis:
+            self._fail(f"oscillation of {amplitude:.1f} is within the hysteresis")
+            return
+        # Describing function of a relay with hysteresis
+        ku = 4 * (self.high - self.low) / 2 / (math.pi * math.sqrt(amplitude * amplitude - self.hysteresis * self.hysteresis))
+        self.status = self.on_result(ku, tu)
+        log(f"{self.name} tuning done, Ku={ku:.4f} Tu={tu:.1f}s: {self.status}")
+
+
+def fan_gains(ku, tu):
+    # Tyreus-Luyben PI, slower than Ziegler-Nichols but without the overshoot
+    from lib import fanPID
+    kp = round(ku / 3.2, 6)
+    ki = round(kp / (2.2 * tu), 6)
+    config.FAN_KP, config.FAN_KI, config.FAN_KD = kp, ki, 0.0
+    fanPID.pid.kp, fanPID.pid.ki, fanPID.pid.kd = kp, ki, 0.0
+    fanPID.pid.reset()
+    helpers.save_config({'FanControl': {'FAN_KP': kp, 'FAN_KI': ki, 'FAN_KD': 0.0}})
+    return f"done, FAN_KP={kp} FAN_KI={ki} FAN_KD=0.0"
+
+
+def temperature_gains(ku, tu):
+    if config.CONTROL_MODE == 'modulating':
+        # The relay swung the heat demand, so Ku is in percent per degree: Tyreus-Luyben PI
+        from states import control
+        kp = round(ku / 3.2, 4)
+        ki = round(kp / (2.2 * tu), 6)
+        config.HEAT_KP, config.HEAT_KI = kp, ki
+        control.heat_pid.kp, control.heat_pid.ki = kp, ki
+        helpers.save_config({'TemperatureControl': {'HEAT_KP': kp, 'HEAT_KI': ki}})
+        return f"done, HEAT_KP={kp} HEAT_KI={ki}"
+
+    # The proportional loop runs the pump MAX_PUMP_FREQUENCY / CONTROL_MAX_DELTA Hz per
+    # degree below target. Ziegler-Nichols puts a P controller at half the ultimate gain.
+    gain = ku / 2
+    max_delta = round(config.MAX_PUMP_FREQUENCY / gain, 2)
+    config.CONTROL_MAX_DELTA = max_delta
+    helpers.save_config({'TemperatureControl': {'CONTROL_MAX_DELTA': max_delta}})
+    return f"done, CONTROL_MAX_DELTA={max_delta}"
+
+
+fan = RelayTuner('fan', fan_gains)
+temperature = RelayTuner('temperature', temperature_gains)
+last = fan  # Whichever tuner ran last, for status()
+
+
+def start(loop):
+    """
+    Start tuning 'fan' or 'temperature'. Returns the status, or why it couldn't start.
+    """
+    global last
+    if fan.running or temperature.running:
+        return f"{last.name} tuning is already running"
+
+    if loop == 'fan':
+        from lib import fanPID
+        if not config.FAN_RPM_SENSOR:
+            return "the fan can only be tuned with FAN_RPM_SENSOR"
+        if config.current_state not in FAN_TUNE_STATES:
+            return "the fan can only be tuned in OFF or STANDBY"
+        if not fanPID.curve.learned:
+            return "the fan curve is still being learned"
+        setpoint = (config.MIN_FAN_RPM + config.MAX_FAN_RPM) / 2
+        center = fanPID.curve.duty_for(setpoint) or 50.0
+        amplitude = config.FAN_AUTOTUNE_AMPLITUDE
+        fan.begin(setpoint, max(center - amplitude, 0.0), min(center + amplitude, 100.0),
+                  config.FAN_AUTOTUNE_HYSTERESIS, config.AUTOTUNE_CYCLES, config.FAN_AUTOTUNE_TIMEOUT)
+        last = fan
+    elif loop == 'temperature':
+        if config.current_state != 'RUNNING':
+            return "the temperature loop can only be tuned while RUNNING"
+        # Around the middle of the pump range rather than across all of it, a full swing
+        # knocks the exhaust temperature down far enough to look like a flame-out
+        if config.CONTROL_MODE == 'modulating':
+            # The relay drives the heat demand, TEMP_AUTOTUNE_AMPLITUDE is still in pump Hertz
+            from states import control
+            low, high = 0.0, 100.0
+            center = 50.0
+            amplitude = config.TEMP_AUTOTUNE_AMPLITUDE / control.fuel_air_map.pump_per_demand()
+        else:
+            low, high = config.MIN_PUMP_FREQUENCY, config.MAX_PUMP_FREQUENCY
+            center = (low + high) / 2
+            amplitude = config.TEMP_AUTOTUNE_AMPLITUDE
+        temperature.begin(config.TARGET_TEMP, max(center - amplitude, low), min(center + amplitude, high),
+                          config.TEMP_AUTOTUNE_HYSTERESIS, config.AUTOTUNE_CYCLES, config.TEMP_AUTOTUNE_TIMEOUT)
+        last = temperature
+    else:
+        return f"unknown loop {loop}, use fan or temperature"
+    return status()
+
+
+def stop():
+    fan.cancel("stopped")
+    temperature.cancel("stopped")
+
+
+def status():
+    return f"{last.name} {last.status}"
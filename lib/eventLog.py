@@ -0,0 +1,226 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# Persistent event log. Fixed-size binary records go into a ring of EVENT_LOG_FILES
+# files of EVENT_LOG_RECORDS records each. Appending writes one record to the end of the
+# current file, and when it is full the oldest file is emptied and becomes the current
+# one, so an append is one small write whatever the log holds and the log never takes
+# more than EVENT_LOG_FILES * EVENT_LOG_RECORDS records of flash. Only the last record of
+# every file is read at boot to find where to carry on.
+#
+# A record is RECORD_FORMAT: sequence number, boot number, uptime in tenths of a second,
+# kind, a code whose meaning depends on the kind, and the output and exhaust temperatures
+# in tenths of a degree. tools/decode_events.py turns the files, or what GET /events and
+# the "events" MQTT command send, back into text.
+import os
+import struct
+import utime
+import hardwareConfig as config
+
+RECORD_FORMAT = '<IHIBBhh'
+RECORD_SIZE = struct.calcsize(RECORD_FORMAT)  # 16 bytes
+FILE_PREFIX = 'events'
+
+# Kinds
+BOOT = 1  # code: machine.reset_cause()
+STATE = 2  # code: index in STATES
+EMERGENCY = 3  # code: index in REASONS
+STARTUP_FAILED = 4  # code: startup attempts so far
+INTERLOCK = 5  # code: index in REASONS
+STALL = 6  # code: index in TASKS, a task missed its liveness deadline
+EMERGENCY_RESET = 7  # code: index in REASONS of what had tripped
+FLAME_OUT = 8  # code: startup attempts so far
+RESTART = 9  # Restart asked for on the web page
+KINDS = ('', 'boot', 'state', 'emergency', 'startup failed', 'interlock', 'stall', 'emergency reset',
+         'flame out', 'restart')
+
+STATES = ('OFF', 'STARTING', 'RUNNING', 'STOPPING', 'STANDBY', 'FAILURE', 'EMERGENCY_STOP')
+# Emergency and interlock reasons by how they start, 0 is anything else
+REASONS = ('other', 'Shutdown took too long', 'No heartbeat detected', 'Output over', 'Exhaust over',
+           'Output sensor open or shorted', 'Exhaust sensor open or shorted')
+TASKS = ('sensors', 'control', 'monitor', 'network', 'fan', 'mqtt')  # Codes are kept, new tasks go at the end
+RESET_CAUSES = {1: 'power on', 2: 'hard reset', 3: 'watchdog', 4: 'deep sleep', 5: 'soft reset'}
+UNKNOWN = 255
+
+
+def log(message, level=1):
+    if config.LOG_LEVEL >= level:
+        print(f"[Event Log] {message}")
+
+
+def reason_code(reason):
+    for index in range(1, len(REASONS)):
+        if reason.startswith(REASONS[index]):
+            return index
+    return 0
+
+
+def index_of(names, name):
+    return names.index(name) if name in names else UNKNOWN
+
+
+def tenths(value):
+    return max(-32768, min(int(value * 10), 32767))
+
+
+class EventLog:
+    def __init__(self, prefix, files, records_per_file):
+        self.prefix = prefix
+        self.files = files
+        self.records_per_file = records_per_file
+        self.buffer = bytearray(RECORD_SIZE)
+        self.uptime_ms = 0  # Added up, ticks_ms wraps around after days
+        self.last_ms = utime.ticks_ms()
+        self.current = 0  # File being appended to
+        self.count = 0  # Records in it
+        self.seq = 0  # Of the next record
+        self.boot = 0
+        self.errors = 0
+        self.last_state = None
+        self._find_end()
+
+    def path(self, index):
+        return f"{self.prefix}{index}.bin"
+
+    def _size(self, index):
+        try:
+            return os.stat(self.path(index))[6]
+        except OSError:
+            return -1
+
+    def _last_record(self, index, size):
+        with open(self.path(index), 'rb') as f:
+            f.seek((size // RECORD_SIZE - 1) * RECORD_SIZE)
+            return struct.unpack(RECORD_FORMAT, f.read(RECORD_SIZE))
+
+    def _find_end(self):
+        newest = None
+        for index in range(self.files):
+            size = self._size(index)
+            if size < RECORD_SIZE:
+                continue
+            try:
+                seq, boot = self._last_record(index, size)[:2]
+            except (OSError, ValueError):
+                continue
+            if newest is None or seq > newest[0]:
+                newest = (seq, boot, index, size)
+        if newest is None:
+            self._start_file(0)
+            return
+        seq, boot, index, size = newest
+        self.seq = seq + 1
+        self.boot = boot + 1
+        self.current = index
+        self.count = size // RECORD_SIZE
+        if size % RECORD_SIZE:
+            # Power went while a record was written, carry on in a clean file
+            self._start_file((index + 1) % self.files)
+
+    def _start_file(self, index):
+        self.current = index
+        self.count = 0
+        with open(self.path(index), 'wb'):
+            pass
+
+    def record(self, kind, code=0):
+        """
+        Append one record, with the temperatures as they are now. Never raises, a full or
+        broken filesystem must not stop the heater.
+        """
+        try:
+            if self.count >= self.records_per_file:
+                self._start_file((self.current + 1) % self.files)
+            struct.pack_into(RECORD_FORMAT, self.buffer, 0, self.seq & 0xFFFFFFFF, self.boot & 0xFFFF,
+                             self.uptime() // 100, kind, code & 0xFF,
+                             tenths(config.output_temp), tenths(config.exhaust_temp))
+            with open(self.path(self.current), 'ab') as f:
+                f.write(self.buffer)
+            self.count += 1
+            self.seq += 1
+        except (OSError, ValueError) as e:
+            self.errors += 1
+            log(f"Couldn't write event {KINDS[kind] if kind < len(KINDS) else kind}: {e}")
+
+    def uptime(self):
+        now = utime.ticks_ms()
+        self.uptime_ms += utime.ticks_diff(now, self.last_ms)
+        self.last_ms = now
+        return self.uptime_ms
+
+    def state(self, new_state):
+        # Called every control run, which also keeps uptime() from missing a ticks_ms wrap.
+        # Only changes are written.
+        self.uptime()
+        if new_state != self.last_state:
+            self.last_state = new_state
+            self.record(STATE, index_of(STATES, new_state))
+
+    def chunks(self):
+        """
+        Yield the files' contents, oldest first, for HTTP and MQTT.
+        """
+        for step in range(1, self.files + 1):
+            index = (self.current + step) % self.files
+            try:
+                with open(self.path(index), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                continue
+            if data:
+                yield data
+
+    def status(self):
+        return {"records": self.seq, "boot": self.boot, "file": self.current, "errors": self.errors}
+
+
+def unpack(data):
+    """
+    Records in data as tuples, in RECORD_FORMAT order. A partly written record at the end
+    is left out.
+    """
+    return [struct.unpack_from(RECORD_FORMAT, data, offset)
+            for offset in range(0, len(data) - RECORD_SIZE + 1, RECORD_SIZE)]
+
+
+def describe(kind, code):
+    if kind == BOOT:
+        return f"boot, {RESET_CAUSES.get(code, f'reset cause {code}')}"
+    if kind == STATE:
+        return f"state {STATES[code] if code < len(STATES) else code}"
+    if kind in (EMERGENCY, INTERLOCK, EMERGENCY_RESET):
+        return f"{KINDS[kind]}, {REASONS[code] if code < len(REASONS) else code}"
+    if kind == STALL:
+        return f"stall, {TASKS[code] if code < len(TASKS) else f'task {code}'}"
+    if kind in (STARTUP_FAILED, FLAME_OUT):
+        return f"{KINDS[kind]}, attempt {code}"
+    return KINDS[kind] if kind < len(KINDS) else f"kind {kind} code {code}"
+
+
+events = EventLog(FILE_PREFIX, config.EVENT_LOG_FILES, config.EVENT_LOG_RECORDS)
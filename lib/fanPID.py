@@ -30,40 +30,110 @@
 import utime
 import hardwareConfig as config
 import machine
+from array import array
+from lib import interrupts, autotune
+from lib.pid import PIDController
 
-# Initialize global variables
-rpm_interrupt_count = 0
-last_measurement_time = 0
+PULSES_PER_REVOLUTION = 2  # Hall Effect sensor pulses per fan revolution
+RPM_EDGE_BUFFER = 16  # Edge timestamps kept for the RPM measurement, a power of two
 
 
-# Interrupt handler function for the Hall Effect sensor
-def rpm_interrupt_handler(pin):
-    global rpm_interrupt_count
-    rpm_interrupt_count += 1
+def log(message, level=2):
+    if config.LOG_LEVEL >= level:
+        print(f"[Fan] {message}")
 
 
+# Hall Effect sensor pulses, timestamped in a hard interrupt
+rpm_edges = interrupts.EdgeTimer(RPM_EDGE_BUFFER)
+
 # Initialize the interrupt for the Hall Effect Sensor
 if config.FAN_RPM_SENSOR:
-    config.FAN_RPM_PIN.irq(trigger=machine.Pin.IRQ_RISING, handler=rpm_interrupt_handler)
-
-
-class PIDController:
-    def __init__(self, kp, ki, kd):
-        self.kp = kp
-        self.ki = ki
-        self.kd = kd
-        self.prev_error = 0
-        self.integral = 0
-
-    def calculate(self, setpoint, current_value):
-        error = setpoint - current_value
-        self.integral += error
-        derivative = error - self.prev_error
-
-        output = self.kp * error + self.ki * self.integral + self.kd * derivative
-        self.prev_error = error
-
-        return output
+    config.FAN_RPM_PIN.irq(trigger=machine.Pin.IRQ_RISING, handler=rpm_edges.edge, hard=True)
+
+
+def read_rpm():
+    """
+    Fan RPM from the average time between the sensor pulses since the last reading, or
+    between the last two pulses when fewer came in. 0 once no pulse came in for
+    FAN_STALL_TIMEOUT_MS.
+    """
+    new_edges = rpm_edges.take()
+    if rpm_edges.valid < 2:
+        return 0.0
+    since_last = utime.ticks_diff(utime.ticks_us(), rpm_edges.newest())
+    if since_last > config.FAN_STALL_TIMEOUT_MS * 1000:
+        rpm_edges.clear()
+        return 0.0
+
+    intervals = max(1, min(new_edges, rpm_edges.valid - 1))
+    period = rpm_edges.span_us(intervals) / intervals
+    if period <= 0:
+        return 0.0
+    # The fan is slowing down if the next pulse is already later than a period
+    if since_last > period:
+        period = since_last
+    return 60000000 / (PULSES_PER_REVOLUTION * period)
+
+
+class FanCurve:
+    """
+    The fan's RPM at a few duty cycles, measured at boot by stepping the fan through
+    them. duty_for() interpolates the duty cycle for an RPM, for the PID's feed-forward.
+    """
+    __slots__ = ('duties', 'rpms', 'index', 'step_started', 'settle_ms', 'learned', 'valid')
+
+    def __init__(self, points, settle_time):
+        self.duties = array('f', [100.0 * (i + 1) / points for i in range(points)])
+        self.rpms = array('f', [0.0] * points)
+        self.settle_ms = int(settle_time * 1000)
+        self.index = 0
+        self.step_started = None
+        self.learned = False
+        self.valid = False
+
+    def learn_step(self, rpm, now_ms):
+        """
+        Feed the latest RPM reading while learning, returns the duty cycle in percent to
+        drive the fan at.
+        """
+        if self.step_started is None:
+            self.step_started = now_ms
+        elif utime.ticks_diff(now_ms, self.step_started) >= self.settle_ms:
+            self.rpms[self.index] = rpm
+            self.index += 1
+            self.step_started = now_ms
+            if self.index == len(self.duties):
+                self._finish()
+                return 0.0
+        return self.duties[self.index]
+
+    def _finish(self):
+        self.learned = True
+        # A fan doesn't slow down with more duty, smooth out reading noise
+        for i in range(1, len(self.rpms)):
+            if self.rpms[i] < self.rpms[i - 1]:
+                self.rpms[i] = self.rpms[i - 1]
+        self.valid = self.rpms[-1] >= config.MIN_FAN_RPM
+        points = ", ".join(f"{d:.0f}%={r:.0f}" for d, r in zip(self.duties, self.rpms))
+        if self.valid:
+            log(f"Learned duty to RPM curve: {points}")
+        else:
+            log(f"Fan didn't reach MIN_FAN_RPM, running without feed-forward: {points}", level=1)
+
+    def duty_for(self, rpm):
+        if not self.valid:
+            return 0.0
+        rpms = self.rpms
+        duties = self.duties
+        if rpm <= rpms[0]:
+            return duties[0] * rpm / rpms[0] if rpms[0] > 0 else 0.0
+        for i in range(1, len(rpms)):
+            if rpm <= rpms[i]:
+                span = rpms[i] - rpms[i - 1]
+                if span <= 0:
+                    return duties[i - 1]
+                return duties[i - 1] + (duties[i] - duties[i - 1]) * (rpm - rpms[i - 1]) / span
+        return duties[-1]
 
 
 def set_fan_duty_cycle(duty_cycle):
@@ -72,34 +142,52 @@ def set_fan_duty_cycle(duty_cycle):
     config.air_pwm.duty(duty_cycle)
 
 
-def fan_control_thread():
-    pid = PIDController(kp=1.0, ki=0.1, kd=0.01)  # Initialize your PID controller with appropriate constants
+pid = PIDController(kp=config.FAN_KP, ki=config.FAN_KI, kd=config.FAN_KD, integral_band=config.FAN_INTEGRAL_BAND)
+curve = FanCurve(config.FAN_CURVE_POINTS, config.FAN_CURVE_SETTLE_TIME)
+last_measurement_time = utime.ticks_ms()
+
+
+# One fan control step, runs at FAN_RATE_HZ
+def fan_control_step():
+    global last_measurement_time
 
-    global rpm_interrupt_count, last_measurement_time
+    # Read current RPM from sensor
+    current_time = utime.ticks_ms()
+    dt = utime.ticks_diff(current_time, last_measurement_time) / 1000.0  # Convert to seconds
+    if dt <= 0:
+        return
+    current_rpm = read_rpm()
+    last_measurement_time = current_time
 
-    while True:
-        # Read current RPM from sensor
-        current_time = utime.ticks_ms()
-        elapsed_time = utime.ticks_diff(current_time, last_measurement_time) / 1000.0  # Convert to seconds
-        current_rpm = (rpm_interrupt_count / 2) / (elapsed_time / 60)
-        rpm_interrupt_count = 0
-        last_measurement_time = current_time
+    # Write the current RPM to config
+    config.fan_rpm = current_rpm
 
-        # Write the current RPM to config
-        config.fan_rpm = current_rpm
+    if not curve.learned:
+        duty_percentage = curve.learn_step(current_rpm, current_time)
+        set_fan_duty_cycle(int((duty_percentage / 100) * config.FAN_MAX_DUTY))
+        return
 
-        # Calculate target RPM based on config.fan_speed_percentage
-        target_rpm = config.MIN_FAN_RPM + (
-                config.fan_speed_percentage * (config.MAX_FAN_RPM - config.MIN_FAN_RPM) / 100)
+    if autotune.fan.running:
+        if config.current_state not in autotune.FAN_TUNE_STATES:
+            autotune.fan.cancel(f"heater went to {config.current_state}")
+        else:
+            duty_percentage = autotune.fan.step(current_rpm, current_time)
+            if duty_percentage is not None:
+                set_fan_duty_cycle(int((duty_percentage / 100) * config.FAN_MAX_DUTY))
+                return
 
-        # Calculate the PID output
-        pid_output = pid.calculate(target_rpm, current_rpm)
+    # 0% is off, not MIN_FAN_RPM
+    if config.fan_speed_percentage == 0:
+        pid.reset()
+        set_fan_duty_cycle(0)
+        return
 
-        # Calculate the new duty cycle
-        new_duty_cycle = int((pid_output / 100) * config.FAN_MAX_DUTY)
+    # Calculate target RPM based on config.fan_speed_percentage
+    target_rpm = config.MIN_FAN_RPM + (
+            config.fan_speed_percentage * (config.MAX_FAN_RPM - config.MIN_FAN_RPM) / 100)
 
-        # Use the PID output to set the fan speed
-        set_fan_duty_cycle(new_duty_cycle)
+    # The PID output is the duty cycle in percent
+    pid_output = pid.calculate(target_rpm, current_rpm, dt, curve.duty_for(target_rpm))
 
-        # Sleep for a bit before the next iteration
-        utime.sleep(0.2)  # 200 ms
+    # Use the PID output to set the fan speed
+    set_fan_duty_cycle(int((pid_output / 100) * config.FAN_MAX_DUTY))
@@ -0,0 +1,225 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# Temperature filter stages and the chains built from them.
+# A chain is described by a string such as "median:5,ema:0.3", see CONFIG_README.md.
+# Every stage allocates its storage up front and reports the delay it adds, in samples.
+import math
+from array import array
+from lib.ringbuffer import RingBuffer
+
+
+def _length(length):
+    length = int(length)
+    if length < 1:
+        raise ValueError("Window length must be at least 1")
+    return length
+
+
+class MovingAverage:
+    def __init__(self, length):
+        self.history = RingBuffer(_length(length))
+
+    def update(self, value):
+        self.history.push(value)
+        return self.history.mean()
+
+    def group_delay(self):
+        return (self.history.capacity - 1) / 2
+
+
+class Ema:
+    def __init__(self, alpha):
+        self.alpha = float(alpha)
+        if not 0 < self.alpha <= 1:
+            raise ValueError("EMA alpha must be between 0 and 1")
+        self.value = None
+
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+        else:
+            self.value += self.alpha * (value - self.value)
+        return self.value
+
+    def group_delay(self):
+        return (1 - self.alpha) / self.alpha
+
+
+class Median:
+    def __init__(self, length):
+        length = _length(length)
+        self.window = RingBuffer(length)
+        self.ordered = array('f', [0.0] * length)  # The window's samples kept sorted
+
+    def update(self, value):
+        window = self.window
+        ordered = self.ordered
+        count = len(window)
+
+        # Take the sample that is about to drop out of the window out of the sorted copy
+        if window.is_full():
+            oldest = window.oldest()
+            i = 0
+            while i < count - 1 and ordered[i] != oldest:
+                i += 1
+            while i < count - 1:
+                ordered[i] = ordered[i + 1]
+                i += 1
+            count -= 1
+
+        window.push(value)
+        value = window.latest()
+
+        # Insert the new sample in order
+        i = count
+        while i > 0 and ordered[i - 1] > value:
+            ordered[i] = ordered[i - 1]
+            i -= 1
+        ordered[i] = value
+        count += 1
+
+        middle = count >> 1
+        if count & 1:
+            return ordered[middle]
+        return (ordered[middle - 1] + ordered[middle]) / 2
+
+    def group_delay(self):
+        return (self.window.capacity - 1) / 2
+
+
+class Kalman:
+    """
+    1-D Kalman filter for a slowly wandering temperature.
+
+    process_noise is how much the temperature may move between samples and
+    measurement_noise how noisy a single reading is, both as variances in C^2.
+    """
+
+    def __init__(self, process_noise, measurement_noise):
+        self.q = float(process_noise)
+        self.r = float(measurement_noise)
+        if self.q <= 0 or self.r <= 0:
+            raise ValueError("Kalman noise values must be above 0")
+        self.estimate = None
+        self.p = self.r
+
+    def update(self, value):
+        if self.estimate is None:
+            self.estimate = value
+            return value
+        p = self.p + self.q
+        gain = p / (p + self.r)
+        self.estimate += gain * (value - self.estimate)
+        self.p = (1 - gain) * p
+        return self.estimate
+
+    def group_delay(self):
+        # Once settled it behaves like an EMA with the steady state gain
+        p = (self.q + math.sqrt(self.q * self.q + 4 * self.q * self.r)) / 2
+        gain = p / (p + self.r)
+        return (1 - gain) / gain
+
+
+class RateLimit:
+    def __init__(self, max_rate, sample_period):
+        self.max_step = float(max_rate) * sample_period  # max_rate is in C per second
+        if self.max_step <= 0:
+            raise ValueError("Rate limit must be above 0")
+        self.value = None
+
+    def update(self, value):
+        if self.value is None:
+            self.value = value
+        elif value > self.value + self.max_step:
+            self.value += self.max_step
+        elif value < self.value - self.max_step:
+            self.value -= self.max_step
+        else:
+            self.value = value
+        return self.value
+
+    def group_delay(self):
+        # Only lags behind steps bigger than max_rate, normal changes pass straight through
+        return 0
+
+
+class FilterChain:
+    def __init__(self, stages, sample_period):
+        self.stages = stages
+        self.sample_period = sample_period
+
+    def update(self, value):
+        for stage in self.stages:
+            value = stage.update(value)
+        return value
+
+    def group_delay(self):
+        """
+        Total delay added by the chain, in samples.
+        """
+        delay = 0
+        for stage in self.stages:
+            delay += stage.group_delay()
+        return delay
+
+    def group_delay_seconds(self):
+        return self.group_delay() * self.sample_period
+
+
+def build_chain(spec, sample_period):
+    """
+    Build a FilterChain from a spec string like "median:5,ema:0.3".
+
+    Stages are run in the order given. Raises ValueError for unknown stages or bad arguments.
+    """
+    stages = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item or item == 'none':
+            continue
+        parts = item.split(':')
+        name = parts[0].strip().lower()
+        args = parts[1:]
+        try:
+            if name == 'mean':
+                stages.append(MovingAverage(args[0]))
+            elif name == 'ema':
+                stages.append(Ema(args[0]))
+            elif name == 'median':
+                stages.append(Median(args[0]))
+            elif name == 'kalman':
+                stages.append(Kalman(args[0], args[1]))
+            elif name == 'rate':
+                stages.append(RateLimit(args[0], sample_period))
+            else:
+                raise ValueError(f"Unknown filter stage '{name}'")
+        except IndexError:
+            raise ValueError(f"Missing arguments for filter stage '{item}'")
+    return FilterChain(stages, sample_period)
@@ -0,0 +1,129 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# Flame-out detection from the exhaust temperature while RUNNING.
+#
+# SlopeDetector fits a least-squares line through the last few exhaust readings and the
+# fuel that went with them, updated in constant time per reading. The exhaust follows
+# the pump with a lag, so the fuel is lagged the same way before it is fitted. It calls a
+# flame-out when the exhaust falls faster than the fuel going in can explain, and the
+# fall stands out from the scatter of the readings around the line. ConsecutiveDrops is
+# the older rule: every reading in the history lower than the one before by more than
+# MIN_TEMP_DELTA.
+import hardwareConfig as config
+from lib.linefit import LineFit
+
+
+def log(message, level=1):
+    if config.LOG_LEVEL >= level:
+        print(f"[Flame] {message}")
+
+
+class SlopeDetector:
+    """
+    Sliding-window line fits of exhaust temperature and lagged pump frequency.
+    """
+
+    def __init__(self, window, sample_period, slope_per_hz, fuel_gain, fuel_tau, t_threshold):
+        if window < 3:
+            raise ValueError("Flame-out window needs at least 3 readings")
+        self.sample_period = sample_period
+        self.slope_per_hz = slope_per_hz  # C/s of fall per Hz of fuel that counts as a flame-out
+        self.fuel_gain = fuel_gain  # C of exhaust per Hz of fuel, what turning the fuel down explains
+        self.fuel_step = sample_period / (fuel_tau + sample_period)  # Lag filter, stable for any tau
+        self.t_threshold = t_threshold  # How many standard errors the fall has to be
+        self.exhaust = LineFit(window)
+        self.fuel = LineFit(window)
+        self.reset()
+
+    def reset(self):
+        self.exhaust.reset()
+        self.fuel.reset()
+        self.lagged_fuel = None
+        self.rate = 0.0  # Exhaust C/s not explained by the fuel, of the last full window
+        self.t = 0.0
+
+    def update(self, exhaust_temp, pump_frequency):
+        """
+        Add one reading, returns True when it shows a flame-out.
+        """
+        if self.lagged_fuel is None:
+            self.lagged_fuel = pump_frequency
+        self.lagged_fuel += (pump_frequency - self.lagged_fuel) * self.fuel_step
+        self.exhaust.push(exhaust_temp)
+        self.fuel.push(self.lagged_fuel)
+        if not self.exhaust.is_full():
+            return False
+
+        unexplained = self.exhaust.slope() - self.fuel_gain * self.fuel.slope()
+        self.t = unexplained / self.exhaust.slope_error()
+        self.rate = unexplained / self.sample_period
+        return self.t <= -self.t_threshold and self.rate <= -self.slope_per_hz * self.fuel.mean()
+
+
+class ConsecutiveDrops:
+    """
+    Flame-out when each of the last length - 1 readings fell by more than min_delta.
+    """
+
+    def __init__(self, length, min_delta):
+        self.length = length
+        self.min_delta = min_delta
+        self.reset()
+
+    def reset(self):
+        self.last = None
+        self.readings = 0
+        self.falling = 0  # Readings in a row that dropped by more than min_delta
+
+    def update(self, exhaust_temp, pump_frequency):
+        if self.last is not None and self.last - exhaust_temp > self.min_delta:
+            self.falling += 1
+        else:
+            self.falling = 0
+        self.last = exhaust_temp
+        self.readings += 1
+        return self.readings >= self.length and self.falling >= self.length - 1
+
+
+def make_detector(kind=None):
+    """
+    The detector FLAME_OUT_DETECTOR asks for, 'slope' or 'drops'.
+    """
+    kind = kind or config.FLAME_OUT_DETECTOR
+    if kind == 'drops':
+        return ConsecutiveDrops(config.EXHAUST_TEMP_HISTORY_LENGTH, config.MIN_TEMP_DELTA)
+    if kind != 'slope':
+        log(f"Unknown FLAME_OUT_DETECTOR '{kind}', using slope", level=0)
+    window = config.FLAME_OUT_WINDOW
+    if window < 3:
+        log(f"FLAME_OUT_WINDOW {window} is too short to fit a line, using 3", level=0)
+        window = 3
+    return SlopeDetector(window, 1 / config.CONTROL_RATE_HZ, config.FLAME_OUT_SLOPE,
+                         config.FLAME_OUT_FUEL_GAIN, config.FLAME_OUT_FUEL_TAU, config.FLAME_OUT_T)
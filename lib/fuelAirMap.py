@@ -0,0 +1,96 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# Fuel/air ratio map: heat demand in percent to pump frequency and fan percentage
+#
+# The map is given as points "demand:pump_hz:fan_percentage" separated by commas, e.g.
+# "0:1.0:20,50:3.0:40,100:5.0:60". Between points the pump and fan are interpolated
+# linearly, so the mixture changes smoothly with the demand.
+
+
+class FuelAirMap:
+    def __init__(self, spec):
+        """
+        Raises ValueError for points that don't parse, fewer than two points or demands
+        that don't go up.
+        """
+        self.demands = []
+        self.pumps = []
+        self.fans = []
+        for item in spec.split(','):
+            item = item.strip()
+            if not item:
+                continue
+            parts = item.split(':')
+            if len(parts) != 3:
+                raise ValueError(f"Fuel/air map point '{item}' isn't demand:pump_hz:fan_percentage")
+            demand, pump, fan = float(parts[0]), float(parts[1]), float(parts[2])
+            if self.demands and demand <= self.demands[-1]:
+                raise ValueError("Fuel/air map demands must go up")
+            self.demands.append(demand)
+            self.pumps.append(pump)
+            self.fans.append(fan)
+        if len(self.demands) < 2:
+            raise ValueError("Fuel/air map needs at least two points")
+
+    def _segment(self, demand):
+        # Index i of the segment demands[i]..demands[i + 1] that demand falls in
+        demands = self.demands
+        for i in range(len(demands) - 2):
+            if demand < demands[i + 1]:
+                return i
+        return len(demands) - 2
+
+    def lookup(self, demand):
+        """
+        Return (pump frequency, fan percentage) for a heat demand, clamped to the map.
+        """
+        demands = self.demands
+        demand = max(demands[0], min(demand, demands[-1]))
+        i = self._segment(demand)
+        fraction = (demand - demands[i]) / (demands[i + 1] - demands[i])
+        pump = self.pumps[i] + (self.pumps[i + 1] - self.pumps[i]) * fraction
+        fan = self.fans[i] + (self.fans[i + 1] - self.fans[i]) * fraction
+        return pump, fan
+
+    def demand_for_pump(self, pump):
+        """
+        The lowest demand that runs the pump at this frequency, for starting the
+        controller where the pump already is.
+        """
+        pumps = self.pumps
+        for i in range(len(pumps) - 1):
+            low, high = pumps[i], pumps[i + 1]
+            if low <= pump <= high and high > low:
+                return self.demands[i] + (self.demands[i + 1] - self.demands[i]) * (pump - low) / (high - low)
+        return self.demands[0] if pump < pumps[0] else self.demands[-1]
+
+    def pump_per_demand(self):
+        # Average pump Hertz per percent of demand, end to end
+        return (self.pumps[-1] - self.pumps[0]) / (self.demands[-1] - self.demands[0])
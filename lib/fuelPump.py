@@ -0,0 +1,141 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# Fuel pump pulse train. One one-shot hardware timer is reprogrammed on every edge: the
+# pump turns on at an exact deadline, off PUMP_ON_TIME later, and the next deadline is
+# one period after the previous one, so timer rounding and interrupt latency never add up.
+# That's two interrupts per pulse and none while the pump is stopped.
+import utime
+from machine import Timer
+import hardwareConfig as config
+from lib import interrupts
+
+# Stop pumping when the control loop hasn't been seen for this long
+HEARTBEAT_TIMEOUT_MS = 10000
+
+
+def log(message, level=1):
+    if config.LOG_LEVEL >= level:
+        print(f"[Fuel Pump] {message}")
+
+
+class PulseGenerator:
+    """
+    Frequencies are kept in integer millihertz and times in microseconds, so the timer
+    callbacks stick to small int arithmetic.
+    """
+
+    def __init__(self, pin, timer, on_time_s, ramp_hz_per_s, start_hz):
+        self.pin = pin
+        self.timer = timer
+        self.on_time_us = int(on_time_s * 1000000)
+        self.ramp_mhz_per_s = int(ramp_hz_per_s * 1000)
+        self.start_mhz = int(start_hz * 1000)
+        self.target_mhz = 0
+        self.current_mhz = 0
+        self.next_on_us = 0
+        self.running = False
+        self.pulses = 0  # Pulses delivered since boot
+        # Bound once, so reprogramming the timer doesn't allocate a new bound method
+        self._on_edge = self.on_edge
+        self._off_edge = self.off_edge
+
+    def set_frequency(self, frequency):
+        """
+        Set the pump rate in Hertz. Pulsing starts right away, changes are ramped at
+        PUMP_RAMP_RATE, 0 stops the pump before its next pulse.
+        """
+        self.target_mhz = int(frequency * 1000) if frequency > 0 else 0
+        if self.target_mhz == 0:
+            if self.running:
+                self.stop()
+        elif not self.running:
+            self.running = True
+            self.current_mhz = min(self.target_mhz, self.start_mhz) if self.start_mhz > 0 else self.target_mhz
+            self.next_on_us = utime.ticks_us()
+            self.on_edge(None)
+
+    def stop(self):
+        self.timer.deinit()
+        self.pin.off()
+        self.running = False
+        self.current_mhz = 0
+
+    def frequency(self):
+        # The rate the pump is actually running at, while ramping
+        return self.current_mhz / 1000
+
+    def _schedule(self, delay_us, callback):
+        # Timers count whole milliseconds, round to the nearest one
+        delay_ms = (delay_us + 500) // 1000
+        self.timer.init(period=delay_ms if delay_ms > 0 else 1, mode=Timer.ONE_SHOT, callback=callback)
+
+    @interrupts.handler
+    def on_edge(self, _):
+        if self.target_mhz == 0 or config.pump_frequency <= 0 or \
+                utime.ticks_diff(utime.ticks_ms(), config.heartbeat) > HEARTBEAT_TIMEOUT_MS:
+            self.stop()
+            return
+        self.pin.on()
+        self.pulses += 1
+        self._schedule(self.on_time_us, self._off_edge)
+
+    @interrupts.handler
+    def off_edge(self, _):
+        self.pin.off()
+        period_us = 1000000000 // self.current_mhz
+
+        # Move toward the target by at most what the ramp allows over one period
+        step = self.ramp_mhz_per_s * (period_us // 1000) // 1000
+        difference = self.target_mhz - self.current_mhz
+        if self.ramp_mhz_per_s <= 0:
+            self.current_mhz = self.target_mhz
+        elif difference > step:
+            self.current_mhz += step
+        elif difference < -step:
+            self.current_mhz -= step
+        else:
+            self.current_mhz = self.target_mhz
+
+        self.next_on_us = utime.ticks_add(self.next_on_us, period_us)
+        delay_us = utime.ticks_diff(self.next_on_us, utime.ticks_us())
+        if delay_us < 0:
+            # Fell behind by more than a pulse, start counting from now instead of catching up
+            self.next_on_us = utime.ticks_us()
+            delay_us = 0
+        self._schedule(delay_us, self._on_edge)
+
+
+pump = PulseGenerator(config.FUEL_PIN, Timer(0), config.PUMP_ON_TIME, config.PUMP_RAMP_RATE,
+                      config.MIN_PUMP_FREQUENCY)
+
+
+def update():
+    # Called by the control task after the state machine has set config.pump_frequency
+    pump.set_frequency(config.pump_frequency)
@@ -28,6 +28,7 @@
 ####################################################################
 
 # Common helper functions
+import json
 import hardwareConfig as config
 
 
@@ -57,3 +58,30 @@ def set_fan_percentage(speed_percentage):
         # Calculate the fan duty and set it
         fan_duty = int((config.fan_speed_percentage / 100) * config.FAN_MAX_DUTY)
         config.air_pwm.duty(fan_duty)
+
+
+# Custom pretty-print function for JSON-like dictionaries
+def pretty_print_json(data, indent=4, level=0):
+    if not isinstance(data, dict):  # if the data is not a dictionary, just return it as a string
+        return str(data)
+    items = []
+    for key, value in data.items():
+        items.append(' ' * (level * indent) + f'"{key}": ' + (
+            pretty_print_json(value, indent, level + 1) if isinstance(value, dict) else json.dumps(value)))
+    return "{\n" + ",\n".join(items) + "\n" + ' ' * (level - 1) * indent + "}"
+
+
+def save_config(updates):
+    """
+    Write settings to config.json, keeping everything else in it.
+
+    :param updates: {section: {key: value}} to change.
+    """
+    with open('config.json', 'r') as f:
+        params = json.load(f)
+    for section, settings in updates.items():
+        if section not in params:
+            params[section] = {}
+        params[section].update(settings)
+    with open('config.json', 'w') as f:
+        f.write(pretty_print_json(params))
@@ -0,0 +1,114 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# Over-temperature interlock. Deferred from the ADC sampler's timer after every burst, so it
+# reacts within ADC_SAMPLE_PERIOD_MS whatever the scheduler tasks and the state machine are
+# doing. It checks the temperatures of the bursts as they are, before the sensor filter
+# chains, which would take several readings to pass a step on. On a trip the fuel pump and
+# glow plug are cut right here, the state is latched to EMERGENCY_STOP, and the control task
+# hands over to emergencyStop on its next run. With IS_SIMULATION there are no bursts, and
+# main.py checks the simulated readings in the sensors task instead.
+import utime
+import hardwareConfig as config
+from lib import fuelPump, thermistor, eventLog, interrupts, adcSampler, sensors
+
+
+def log(message, level=1):
+    if config.LOG_LEVEL >= level:
+        print(f"[Interlock] {message}")
+
+
+reason = None  # Why the interlock tripped, None while it hasn't
+burst_to_cut_us = 0  # From the ADC burst that showed the fault to the fuel being cut
+checks = 0
+
+
+def fault(output_temp, exhaust_temp):
+    """
+    Return why these readings aren't safe, or None.
+    """
+    if output_temp == thermistor.INVALID_TEMP:
+        return "Output sensor open or shorted"
+    if exhaust_temp == thermistor.INVALID_TEMP:
+        return "Exhaust sensor open or shorted"
+    if output_temp > config.OUTPUT_SAFE_TEMP:
+        return f"Output over {config.OUTPUT_SAFE_TEMP}C"
+    if exhaust_temp > config.EXHAUST_SAFE_TEMP:
+        return f"Exhaust over {config.EXHAUST_SAFE_TEMP}C"
+    return None
+
+
+def check(output_temp, exhaust_temp, sampled_us):
+    """
+    Check the latest unfiltered readings against the SafetyLimits. sampled_us is
+    utime.ticks_us() of the ADC burst they came from, burst_to_cut_us is counted from there.
+    """
+    global reason, burst_to_cut_us, checks
+    checks += 1
+    if reason is not None:
+        return
+    found = fault(output_temp, exhaust_temp)
+    if found is None:
+        return
+
+    # Outputs first, the bookkeeping can wait
+    fuelPump.pump.stop()
+    config.FUEL_PIN.off()
+    config.GLOW_PIN.off()
+    config.pump_frequency = 0
+    burst_to_cut_us = utime.ticks_diff(utime.ticks_us(), sampled_us)
+
+    reason = found
+    config.current_state = 'EMERGENCY_STOP'
+    config.emergency_reason = found
+    log(f"Tripped: {found} (output {output_temp}C, exhaust {exhaust_temp}C), fuel cut {burst_to_cut_us} us after the ADC burst that showed it")
+    eventLog.events.record(eventLog.INTERLOCK, eventLog.reason_code(found))
+
+
+def check_bursts():
+    # Once tripped there's nothing left to cut, and an open sensor would log every burst
+    if reason is not None:
+        return
+    check(sensors.convert(adcSampler.output_sampler.value, sensors.output_table),
+          sensors.convert(adcSampler.exhaust_sampler.value, sensors.exhaust_table),
+          adcSampler.burst_us)
+
+
+# Handed to adcSampler.start(), runs check_bursts() after every burst
+burst_check = interrupts.Deferred(check_bursts)
+
+
+def clear():
+    # Called by emergencyStop.reset() once the readings are safe again
+    global reason
+    reason = None
+
+
+def status():
+    return {"reason": reason, "burst_to_cut_us": burst_to_cut_us, "checks": checks}
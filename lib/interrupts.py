@@ -0,0 +1,130 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# Everything that runs in a timer or pin interrupt goes through here.
+#
+# Rules for interrupt handlers: no allocation. That means no print or log, no f-strings
+# or string building, no floats (literals or "/"), no lists, dicts or tuples, and no
+# bound methods created on the fly (bind them once in __init__). Integer arithmetic,
+# attribute and array access, pin and timer calls are fine. Anything else is deferred
+# to the main context with Deferred, which goes through micropython.schedule.
+#
+# Mark every handler with @handler. tools/check_isr.py checks the marked functions, and
+# everything they call, for allocations, and flags callbacks that aren't marked.
+import machine
+import micropython
+import utime
+from array import array
+
+# Room for the traceback of an exception raised inside a handler
+micropython.alloc_emergency_exception_buf(100)
+
+
+def handler(function):
+    # Marks an interrupt handler for tools/check_isr.py, changes nothing at runtime
+    return function
+
+
+class EdgeTimer:
+    """
+    Timestamps pin edges with ticks_us in a hard interrupt, into a ring that keeps the
+    last size edges (a power of two). take() hands the main context a consistent view:
+    how many edges came in since the last take, and the ring up to the newest of them.
+    """
+
+    def __init__(self, size=16):
+        self.times = array('l', [0] * size)
+        self.mask = size - 1
+        self.head = 0  # Where the next edge goes
+        self.count = 0  # Edges since the last take()
+        self.taken_head = 0
+        # Timestamps in the ring that belong to the current run of edges. One slot is never
+        # counted, it's where an edge that comes in while the ring is being read goes.
+        self.valid = 0
+
+    @handler
+    def edge(self, pin):
+        self.times[self.head] = utime.ticks_us()
+        self.head = (self.head + 1) & self.mask
+        self.count += 1
+
+    def take(self):
+        state = machine.disable_irq()
+        count = self.count
+        self.count = 0
+        self.taken_head = self.head
+        machine.enable_irq(state)
+        self.valid = min(self.valid + count, self.mask)
+        return count
+
+    def clear(self):
+        # Forget the edges so far, e.g. after a stall, so a restart isn't timed against them
+        self.valid = 0
+
+    def newest(self):
+        return self.times[(self.taken_head - 1) & self.mask]
+
+    def span_us(self, intervals):
+        """
+        Time across the last intervals edge to edge intervals up to the newest edge.
+        Needs intervals < valid.
+        """
+        newest = (self.taken_head - 1) & self.mask
+        return utime.ticks_diff(self.times[newest], self.times[(newest - intervals) & self.mask])
+
+
+class Deferred:
+    """
+    Runs function() in the main context soon after a handler calls trigger().
+    Triggers while a run is already queued are merged into it.
+    """
+
+    def __init__(self, function):
+        self.function = function
+        self.pending = False
+        self.dropped = 0  # Triggers lost because the schedule queue was full
+        # Bound once, so trigger() doesn't allocate a bound method
+        self._run_ref = self._run
+        self.trigger_ref = self.trigger
+
+    @handler
+    def trigger(self, arg=None):
+        if self.pending:
+            return
+        self.pending = True
+        try:
+            micropython.schedule(self._run_ref, 0)
+        except RuntimeError:
+            # Schedule queue full, the next trigger tries again
+            self.pending = False
+            self.dropped += 1
+
+    def _run(self, _):
+        self.pending = False
+        self.function()
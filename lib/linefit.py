@@ -0,0 +1,138 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+import math
+from array import array
+
+# Scatter assumed even when the values sit exactly on the line. Keeps a perfectly smooth
+# but gentle trend from counting as significant.
+MIN_RESIDUAL_VARIANCE = 0.01
+
+
+class LineFit:
+    """
+    Least-squares line through the last window values, x being the value's index.
+
+    push() is constant time: the sums slide along with the window instead of being
+    recomputed. They are kept relative to an offset near the window's mean, so single
+    precision floats don't lose the slope to the size of the values, and they are rebuilt
+    once per lap so rounding can't build up.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = array('f', [0.0] * window)
+        self.reset()
+
+    def reset(self):
+        self.head = 0
+        self.count = 0
+        self.offset = 0.0
+        self.sum_y = 0.0
+        self.sum_xy = 0.0
+        self.sum_yy = 0.0
+
+    def push(self, value):
+        window = self.window
+        head = self.head
+        if self.count == 0:
+            self.offset = value
+        y = value - self.offset
+
+        if self.count == window:
+            # Drop the oldest value, every other one moves one step closer to x = 0
+            old = self.values[head] - self.offset
+            self.sum_y -= old
+            self.sum_xy -= self.sum_y
+            self.sum_yy -= old * old
+            x = window - 1
+        else:
+            x = self.count
+            self.count += 1
+
+        self.values[head] = value
+        self.sum_y += y
+        self.sum_xy += x * y
+        self.sum_yy += y * y
+
+        head += 1
+        if head == window:
+            head = 0
+            if self.count == window:
+                self._resum()
+        self.head = head
+
+    def _resum(self):
+        # head is back at 0, so the oldest value is at index 0 and x is the index
+        window = self.window
+        self.offset += self.sum_y / window
+        sum_y = sum_xy = sum_yy = 0.0
+        for x in range(window):
+            y = self.values[x] - self.offset
+            sum_y += y
+            sum_xy += x * y
+            sum_yy += y * y
+        self.sum_y, self.sum_xy, self.sum_yy = sum_y, sum_xy, sum_yy
+
+    def __len__(self):
+        return self.count
+
+    def is_full(self):
+        return self.count == self.window
+
+    def mean(self):
+        return self.offset + self.sum_y / self.count if self.count else 0.0
+
+    def _sxx(self):
+        # Sum of (x - mean x)² for x = 0..count-1
+        count = self.count
+        return count * (count * count - 1) / 12
+
+    def slope(self):
+        """
+        Change per value of the fitted line, 0.0 with fewer than two values.
+        """
+        count = self.count
+        if count < 2:
+            return 0.0
+        mean_x = (count - 1) / 2
+        return (self.sum_xy - mean_x * self.sum_y) / self._sxx()
+
+    def slope_error(self):
+        """
+        Standard error of slope() from the scatter around the line, needs three values.
+        """
+        count = self.count
+        if count < 3:
+            return math.inf
+        sxx = self._sxx()
+        slope = self.slope()
+        residual = self.sum_yy - self.sum_y * self.sum_y / count - slope * slope * sxx
+        variance = max(residual / (count - 2), MIN_RESIDUAL_VARIANCE)
+        return math.sqrt(variance / sxx)
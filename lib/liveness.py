@@ -0,0 +1,129 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# Liveness registry. Every task registers with a deadline and checks in whenever it has
+# done its work; main.monitor() only feeds the hardware watchdog while every critical task
+# has checked in within its deadline. The longest gap between check-ins is kept per task,
+# so a stall that nearly tripped the watchdog still shows up in the telemetry.
+from array import array
+import utime
+import hardwareConfig as config
+from lib import eventLog
+
+MAX_ENTRIES = 8
+
+
+def log(message, level=1):
+    if config.LOG_LEVEL >= level:
+        print(f"[Liveness] {message}")
+
+
+class Liveness:
+    """
+    Fixed table of entries, preallocated in register(), so check_in() doesn't allocate and
+    can be called from anywhere in the main context.
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.names = []
+        self.deadlines_ms = array('l', [0] * max_entries)
+        self.critical = array('B', [0] * max_entries)
+        self.last_ms = array('l', [0] * max_entries)
+        self.worst_ms = array('l', [0] * max_entries)
+        self.check_ins = array('L', [0] * max_entries)
+        self.misses = array('L', [0] * max_entries)  # Times it was found past its deadline
+        self.late = array('B', [0] * max_entries)  # Past its deadline right now
+
+    def register(self, name, deadline_ms, critical=True):
+        if len(self.names) >= len(self.deadlines_ms):
+            raise ValueError(f"no room for '{name}', at most {len(self.deadlines_ms)} entries")
+        if deadline_ms <= 0:
+            raise ValueError(f"'{name}' needs a deadline above 0 ms, not {deadline_ms}")
+        index = len(self.names)
+        self.names.append(name)
+        self.deadlines_ms[index] = int(deadline_ms)
+        self.critical[index] = 1 if critical else 0
+        self.last_ms[index] = utime.ticks_ms()
+        return index
+
+    def check_in(self, index):
+        now = utime.ticks_ms()
+        gap = utime.ticks_diff(now, self.last_ms[index])
+        if gap > self.worst_ms[index]:
+            self.worst_ms[index] = gap
+        self.last_ms[index] = now
+        self.check_ins[index] += 1
+        self.late[index] = 0
+
+    def stalled(self):
+        """
+        Return the name of the first critical entry past its deadline, or None. Entries
+        that have just gone past it are counted and logged once.
+        """
+        now = utime.ticks_ms()
+        found = None
+        for index in range(len(self.names)):
+            age = utime.ticks_diff(now, self.last_ms[index])
+            if age <= self.deadlines_ms[index]:
+                continue
+            if not self.late[index]:
+                self.late[index] = 1
+                self.misses[index] += 1
+                log(f"{self.names[index]} hasn't checked in for {age} ms, deadline {self.deadlines_ms[index]} ms"
+                    f"{'' if self.critical[index] else ' (not critical)'}", level=0)
+                eventLog.events.record(eventLog.STALL, eventLog.index_of(eventLog.TASKS, self.names[index]))
+            if self.critical[index] and found is None:
+                found = self.names[index]
+        return found
+
+    def stats(self):
+        """
+        Per entry, for telemetry: deadline, time since the last check-in and the longest
+        gap between two check-ins, in milliseconds.
+        """
+        now = utime.ticks_ms()
+        result = {}
+        for index in range(len(self.names)):
+            result[self.names[index]] = {
+                "deadline_ms": self.deadlines_ms[index],
+                "age_ms": utime.ticks_diff(now, self.last_ms[index]),
+                "worst_ms": self.worst_ms[index],
+                "misses": self.misses[index],
+                "critical": bool(self.critical[index]),
+            }
+        return result
+
+
+def critical_names():
+    # LIVENESS_CRITICAL from config.json, a comma separated list of task names
+    return [name.strip() for name in config.LIVENESS_CRITICAL.split(',') if name.strip()]
+
+
+# The firmware's tasks register through scheduler.Scheduler.add()
+registry = Liveness()
@@ -30,14 +30,80 @@
 import hardwareConfig as config
 import utime
 import json
+import errno
+import random
 import network
-from umqtt.simple import MQTTClient
+import usocket
+import uselect
+from umqtt.simple import MQTTClient, MQTTException
+from lib import scheduler, fuelPump, autotune, interlock, liveness, eventLog
+from states import emergencyStop, stateMachine
 
 # Initialize global variables
 wlan = None
 mqtt_client = None
 wifi_initialized = False
 mqtt_initialized = False
+wifi_connecting = False
+wifi_connect_started = 0
+
+# MQTT session, see connect_mqtt()
+session_up = False
+broker_address = None  # Looked up once per WiFi connection, see resolve_broker()
+probe = None  # Non-blocking TCP connection that checks the broker answers before umqtt.simple connects
+probe_started = 0
+last_sent = 0  # ticks_ms of the last packet to the broker, for the keepalive pings
+poller = None  # Watches the session's socket for incoming messages, see poll_mqtt()
+events_requested = False  # The event log is published by run_networking, not from the callback
+
+# Counters, published under "mqtt"
+wifi_attempts = 0
+mqtt_attempts = 0
+sessions = 0
+drops = 0
+subscribes = 0
+pings = 0
+received = 0  # Packets handled by poll_mqtt()
+dns_lookups = 0
+dns_ms = 0  # Time the last lookup of MQTT_SERVER blocked for
+connect_ms = 0  # Time umqtt.simple's connect and the subscriptions blocked for, last session
+connect_ms_max = 0
+publish_us = 0  # Time the last sensor values publish blocked for
+publish_us_max = 0
+
+# Give a WiFi connection attempt this long before starting another one
+WIFI_CONNECT_TIMEOUT_MS = 30000
+MQTT_PORT = 1883
+MAX_MESSAGES_PER_POLL = 4  # So a burst of messages can't hold up the other tasks
+
+
+class Backoff:
+    """
+    Exponential backoff with jitter between connection attempts. Every failure doubles the
+    delay, from RECONNECT_MIN_DELAY up to RECONNECT_MAX_DELAY, and the wait is somewhere
+    between half the delay and the full delay, so heaters that lost the same access point
+    or broker don't all come back at the same moment.
+    """
+    def __init__(self):
+        self.delay_ms = 0
+        self.next_ms = utime.ticks_ms()
+
+    def due(self, now):
+        return utime.ticks_diff(now, self.next_ms) >= 0
+
+    def failed(self, now):
+        self.delay_ms = min(max(self.delay_ms * 2, config.RECONNECT_MIN_DELAY), config.RECONNECT_MAX_DELAY)
+        half = self.delay_ms // 2
+        wait_ms = half + random.getrandbits(24) % (half + 1)
+        self.next_ms = utime.ticks_add(now, wait_ms)
+        return wait_ms
+
+    def succeeded(self):
+        self.delay_ms = 0
+
+
+wifi_backoff = Backoff()
+mqtt_backoff = Backoff()
 
 
 # Initialize WiFi
@@ -47,41 +113,183 @@ def init_wifi():
     wlan.active(True)
 
 
-# Initialize MQTT with authentication
+# Initialize MQTT with authentication. The client is kept for good, a new session reuses it
 def init_mqtt():
     global mqtt_client
-    mqtt_client = MQTTClient(config.MQTT_CLIENT_ID, config.MQTT_SERVER, user=config.MQTT_USERNAME,
-                             password=config.MQTT_PASSWORD)
+    mqtt_client = MQTTClient(config.MQTT_CLIENT_ID, config.MQTT_SERVER, port=MQTT_PORT, user=config.MQTT_USERNAME,
+                             password=config.MQTT_PASSWORD, keepalive=config.MQTT_KEEPALIVE)
+    mqtt_client.set_callback(mqtt_callback)
 
 
-# Connect to WiFi
-def connect_wifi():
-    if wlan and not wlan.isconnected():
-        print('Attempting WiFi connection...')
+# Connect to WiFi, without waiting for it. run_networking checks back on the next call
+def connect_wifi(now):
+    global wifi_connecting, wifi_connect_started, wifi_attempts
+    if wifi_connecting:
+        if utime.ticks_diff(now, wifi_connect_started) < WIFI_CONNECT_TIMEOUT_MS:
+            return
+        wifi_connecting = False
+        wlan.disconnect()
+        print(f'WiFi connection timed out, next attempt in {wifi_backoff.failed(now) // 1000}s')
+        return
+    if not wifi_backoff.due(now):
+        return
+    print('Attempting WiFi connection...')
+    wifi_attempts += 1
+    try:
         wlan.connect(config.SSID, config.PASSWORD)
-        while not wlan.isconnected():
-            utime.sleep(1)
-        print(f'WiFi connected! IP Address: {wlan.ifconfig()[0]}')
+    except OSError as e:
+        print(f'WiFi connect failed: {e}, next attempt in {wifi_backoff.failed(now) // 1000}s')
+        return
+    wifi_connecting = True
+    wifi_connect_started = now
 
 
-# Connect to MQTT
-def connect_mqtt():
-    global mqtt_client
-    if not mqtt_client:
-        init_mqtt()
+def close_probe():
+    global probe
+    try:
+        probe.close()
+    except OSError:
+        pass
+    probe = None
+
+
+def close_socket():
+    # umqtt.simple leaves the socket of a failed or dropped session open
+    try:
+        mqtt_client.sock.close()
+    except (OSError, AttributeError):
+        pass
+
+
+def mqtt_failed(now, why):
+    print(f'Failed to connect to MQTT: {why}, next attempt in {mqtt_backoff.failed(now) // 1000}s')
+
+
+def is_ip_address(host):
+    parts = host.split('.')
+    return len(parts) == 4 and all(part.isdigit() for part in parts)
+
+
+def resolve_broker():
+    """
+    Find MQTT_SERVER's address. getaddrinfo blocks until the DNS server answers, so a name
+    is only looked up on the first attempt after WiFi connects, and an IP address not at
+    all. umqtt.simple would look the server up again on every connect, so it gets the address.
+    """
+    global broker_address, dns_lookups, dns_ms
+    if is_ip_address(config.MQTT_SERVER):
+        broker_address = (config.MQTT_SERVER, MQTT_PORT)
+    else:
+        dns_lookups += 1
+        started = utime.ticks_ms()
+        try:
+            broker_address = usocket.getaddrinfo(config.MQTT_SERVER, MQTT_PORT)[0][-1]
+        finally:
+            dns_ms = utime.ticks_diff(utime.ticks_ms(), started)
+        print(f'{config.MQTT_SERVER} is at {broker_address[0]}, looked up in {dns_ms}ms')
+    mqtt_client.server = broker_address[0]
+
+
+def start_probe(now):
+    global probe, probe_started, mqtt_attempts
+    mqtt_attempts += 1
+    try:
+        if broker_address is None:
+            resolve_broker()
+        probe = usocket.socket()
+        probe.setblocking(False)
+    except OSError as e:
+        mqtt_failed(now, e)
+        return
+    probe_started = now
+    try:
+        probe.connect(broker_address)
+    except OSError as e:
+        if e.args[0] != errno.EINPROGRESS:
+            close_probe()
+            mqtt_failed(now, e)
+
+
+def probe_answered(now):
+    """
+    True once the broker has accepted the probe. Until then the probe is left to run, up
+    to MQTT_CONNECT_TIMEOUT, and a refused or timed out probe counts as a failed attempt.
+    """
+    poller = uselect.poll()
+    poller.register(probe, uselect.POLLOUT)
+    ready = poller.poll(0)
+    if ready and not ready[0][1] & (uselect.POLLERR | uselect.POLLHUP):
+        close_probe()
+        return True
+    if ready:
+        close_probe()
+        mqtt_failed(now, "refused")
+    elif utime.ticks_diff(now, probe_started) >= config.MQTT_CONNECT_TIMEOUT * 1000:
+        close_probe()
+        mqtt_failed(now, "no answer")
+    return False
+
+
+# Connect to MQTT in steps that don't block while the broker is down. A non-blocking TCP
+# connection is opened first and checked on the following calls. Only once the broker has
+# answered it does umqtt.simple connect, which blocks, but for a round trip on the LAN
+# rather than a TCP timeout. The topics are subscribed to once per session.
+def connect_mqtt(now):
+    global session_up, sessions, subscribes, connect_ms, connect_ms_max, last_sent, poller
+    if probe is None:
+        if mqtt_backoff.due(now):
+            start_probe(now)
+        return
+    if not probe_answered(now):
+        return
+    print('Attempting MQTT connection...')
+    started = utime.ticks_ms()
     try:
-        print('Attempting MQTT connection...')
-        mqtt_client.connect()
-        print('MQTT connected!')
-    except Exception as e:
-        print(f'Failed to connect to MQTT: {e}')
-        mqtt_client = None  # Reset client to None to attempt re-initialization later
+        mqtt_client.connect(timeout=config.MQTT_CONNECT_TIMEOUT)
+        mqtt_client.subscribe(config.SET_TEMP_TOPIC)
+        mqtt_client.subscribe(config.COMMAND_TOPIC)
+    except (OSError, MQTTException) as e:
+        close_socket()
+        mqtt_failed(now, e)
+        return
+    subscribes += 2
+    connect_ms = utime.ticks_diff(utime.ticks_ms(), started)
+    connect_ms_max = max(connect_ms_max, connect_ms)
+    sessions += 1
+    session_up = True
+    last_sent = utime.ticks_ms()
+    poller = uselect.poll()
+    poller.register(mqtt_client.sock, uselect.POLLIN)
+    mqtt_backoff.succeeded()
+    print(f'MQTT connected in {connect_ms}ms!')
+
+
+def drop_session(now, why):
+    global session_up, drops, poller
+    session_up = False
+    poller = None
+    drops += 1
+    close_socket()
+    print(f'MQTT session lost: {why}, reconnecting in {mqtt_backoff.failed(now) // 1000}s')
+
+
+def status():
+    if session_up:
+        link = "mqtt"
+    elif wlan and wlan.isconnected():
+        link = "wifi"
+    else:
+        link = "down"
+    return {"link": link, "wifi_attempts": wifi_attempts, "mqtt_attempts": mqtt_attempts, "sessions": sessions,
+            "drops": drops, "subscribes": subscribes, "pings": pings, "received": received, "connect_ms": connect_ms,
+            "connect_ms_max": connect_ms_max, "publish_us": publish_us, "publish_us_max": publish_us_max,
+            "dns_lookups": dns_lookups, "dns_ms": dns_ms}
 
 
 # MQTT Callback
 # Add these new attributes to the payload in publish_sensor_values()
 def publish_sensor_values():
-    global mqtt_client
+    global publish_us, publish_us_max, last_sent
     if mqtt_client:
         payload = {
             "output_temp": config.output_temp,
@@ -89,25 +297,57 @@ def publish_sensor_values():
             "current_state": config.current_state,
             "fan_speed_percentage": config.fan_speed_percentage,
             "pump_frequency": config.pump_frequency,
+            "heat_demand": config.heat_demand,
             "startup_attempts": config.startup_attempts,
             "emergency_reason": config.emergency_reason,
             "heartbeat": config.heartbeat,
-            "startup_successful": config.startup_successful
+            "startup_successful": config.startup_successful,
+            "startup_time": config.startup_time,
+            "fuel_pulses": fuelPump.pump.pulses,
+            "autotune": autotune.status(),
+            "interlock": interlock.status(),
+            "emergency": emergencyStop.status(),
+            "tasks": scheduler.tasks.stats(),
+            "liveness": liveness.registry.stats(),
+            "events": eventLog.events.status(),
+            "mqtt": status()
         }
-        mqtt_client.publish(config.SENSOR_VALUES_TOPIC, json.dumps(payload))
+        message = json.dumps(payload)
+        started = utime.ticks_us()
+        mqtt_client.publish(config.SENSOR_VALUES_TOPIC, message)
+        publish_us = utime.ticks_diff(utime.ticks_us(), started)
+        publish_us_max = max(publish_us_max, publish_us)
+        last_sent = utime.ticks_ms()
+
+
+def publish_events():
+    # One message per event log file, binary records for tools/decode_events.py
+    for data in eventLog.events.chunks():
+        mqtt_client.publish(config.EVENT_LOG_TOPIC, data)
 
 
 # Extend mqtt_callback() to handle new settings
 def mqtt_callback(topic, msg):
+    global events_requested
     topic = topic.decode('utf-8')
     msg = msg.decode('utf-8')
     if topic == config.SET_TEMP_TOPIC:
         config.TARGET_TEMP = float(msg)
     elif topic == config.COMMAND_TOPIC:
-        if msg == "start":
-            config.current_state = 'STARTING'
-        elif msg == "stop":
-            config.current_state = 'STOPPING'
+        if msg == "reset":
+            print(f"Emergency stop: {emergencyStop.reset()}")
+        elif msg == "events":
+            events_requested = True
+        elif config.current_state == 'EMERGENCY_STOP':
+            print(f"Emergency stop latched ({config.emergency_reason}), ignoring '{msg}' until reset")
+        elif msg == "start" or msg == "stop":
+            config.current_state = stateMachine.command(config.current_state, msg)
+        elif msg.startswith("autotune "):
+            loop = msg[len("autotune "):]
+            if loop == "stop":
+                autotune.stop()
+            else:
+                print(f"Autotune: {autotune.start(loop)}")
     elif topic == "set/exhaust_safe_temp":
         config.EXHAUST_SAFE_TEMP = float(msg)
     elif topic == "set/output_safe_temp":
@@ -117,9 +357,9 @@ def mqtt_callback(topic, msg):
     elif topic == "set/max_fan_percentage":
         config.MAX_FAN_PERCENTAGE = int(msg)
     elif topic == "set/min_pump_frequency":
-        config.MIN_PUMP_FREQUENCY = int(msg)
+        config.MIN_PUMP_FREQUENCY = float(msg)
     elif topic == "set/max_pump_frequency":
-        config.MAX_PUMP_FREQUENCY = int(msg)
+        config.MAX_PUMP_FREQUENCY = float(msg)
     elif topic == "set/log_level":
         config.LOG_LEVEL = int(msg)
     elif topic == "set/startup_time_limit":
@@ -132,30 +372,82 @@ def mqtt_callback(topic, msg):
         config.EMERGENCY_STOP_TIMER = int(msg)
 
 
-# Main function for networking
+# Everything that goes out to the broker goes out from here, at NETWORK_RATE_HZ. Incoming
+# messages are handled by poll_mqtt()
+def service_mqtt(now):
+    global pings, last_sent, events_requested
+    try:
+        if utime.ticks_diff(now, last_sent) >= config.MQTT_KEEPALIVE * 500:
+            mqtt_client.ping()
+            pings += 1
+            last_sent = now
+        publish_sensor_values()
+        if events_requested:
+            events_requested = False
+            publish_events()
+    except (OSError, MQTTException) as e:
+        drop_session(now, e)
+
+
+# Runs at MQTT_POLL_RATE_HZ while MQTT is on. While nothing has arrived it costs one poll of
+# the session's socket, and a command is handled as soon as the next poll sees it rather
+# than at the next run_networking. So a command waits up to one poll period: uasyncio only
+# wakes a task on a readable socket through its private _io_queue, and umqtt.simple does its
+# own blocking reads, so the socket is polled at a fixed rate instead of waited on
+def poll_mqtt():
+    global received
+    for _ in range(MAX_MESSAGES_PER_POLL):
+        if poller is None:
+            return
+        ready = False
+        for _, event in poller.ipoll(0):
+            ready = True
+            if event & (uselect.POLLERR | uselect.POLLHUP):
+                drop_session(utime.ticks_ms(), "connection closed")
+                return
+        if not ready:
+            return
+        try:
+            mqtt_client.check_msg()
+        except (OSError, MQTTException) as e:
+            drop_session(utime.ticks_ms(), e)
+            return
+        except Exception as e:
+            # A message the callback couldn't handle, the session itself is fine
+            print(f'Failed in MQTT operation: {e}')
+        received += 1
+
+
+# Main function for networking, runs at NETWORK_RATE_HZ. Never waits on the network: every
+# call moves the WiFi and MQTT connections on by at most one step
 def run_networking():
-    global wifi_initialized, mqtt_initialized, wlan, mqtt_client
+    global wifi_initialized, mqtt_initialized, wifi_connecting, broker_address
     if config.USE_WIFI and not wifi_initialized:
         init_wifi()
         wifi_initialized = True
     if config.USE_MQTT and not mqtt_initialized:
         init_mqtt()
         mqtt_initialized = True
+    if not wlan:
+        return
 
-    if wlan and not wlan.isconnected():  # Check wlan is not None
-        connect_wifi()
-    if wlan and wlan.isconnected():  # Check wlan is not None
-        if mqtt_client is None:
-            connect_mqtt()
-        if mqtt_client:  # Make sure mqtt_client is not None
-            try:
-                mqtt_client.set_callback(mqtt_callback)
-                mqtt_client.subscribe(config.SET_TEMP_TOPIC)
-                mqtt_client.subscribe(config.COMMAND_TOPIC)
-                mqtt_client.check_msg()
-                publish_sensor_values()
-            except Exception as e:
-                print(f'Failed in MQTT operation: {e}')
-                mqtt_client = None  # Reset client to None to attempt re-initialization later
-
-    utime.sleep(0.1)  # Add sleep to avoid CPU hogging
+    now = utime.ticks_ms()
+    if not wlan.isconnected():
+        if session_up:
+            drop_session(now, "WiFi lost")
+        if probe is not None:
+            close_probe()
+        connect_wifi(now)
+        return
+    if wifi_connecting:
+        wifi_connecting = False
+        wifi_backoff.succeeded()
+        broker_address = None  # The network may hand out another DNS server or broker address
+        print(f'WiFi connected! IP Address: {wlan.ifconfig()[0]}')
+
+    if not mqtt_client:
+        return
+    if not session_up:
+        connect_mqtt(now)
+    if session_up:
+        service_mqtt(now)
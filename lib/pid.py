@@ -0,0 +1,86 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# Discrete PID controller shared by the fan RPM and output temperature loops
+
+
+class PIDController:
+    """
+    Discrete PID with the output clamped to out_min..out_max.
+
+    The integrator stops winding up while the output is saturated and is kept within the
+    output range. The derivative works on the measurement, so setpoint changes don't
+    kick the output. feed_forward is added to the output before clamping, the loop then
+    only has to correct what the feed-forward gets wrong. With integral_band set, the
+    integrator only runs while the error is within it, so it doesn't fill up while the
+    process is still catching up with a setpoint change.
+    """
+    __slots__ = ('kp', 'ki', 'kd', 'out_min', 'out_max', 'integral_band', 'integral', 'prev_measurement', 'output')
+
+    def __init__(self, kp, ki, kd, out_min=0.0, out_max=100.0, integral_band=None):
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.out_min = out_min
+        self.out_max = out_max
+        self.integral_band = integral_band
+        self.reset()
+
+    def reset(self):
+        # The integral is kept scaled by ki, so changing the gains doesn't bump the output
+        self.integral = 0.0
+        self.prev_measurement = None
+        self.output = 0.0
+
+    def calculate(self, setpoint, measurement, dt, feed_forward=0.0):
+        if dt <= 0:
+            return self.output
+        error = setpoint - measurement
+        proportional = self.kp * error
+        derivative = 0.0
+        if self.prev_measurement is not None:
+            derivative = -self.kd * (measurement - self.prev_measurement) / dt
+        self.prev_measurement = measurement
+
+        integral = self.integral
+        if self.integral_band is None or -self.integral_band <= error <= self.integral_band:
+            integral += self.ki * error * dt
+        output = feed_forward + proportional + integral + derivative
+        if output > self.out_max:
+            if error > 0:
+                integral = self.integral  # Saturated high, don't wind up further
+            output = self.out_max
+        elif output < self.out_min:
+            if error < 0:
+                integral = self.integral
+            output = self.out_min
+        span = self.out_max - self.out_min
+        self.integral = max(-span, min(integral, span))
+        self.output = output
+        return output
@@ -0,0 +1,140 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# Lumped thermal model of the burner, used when IS_SIMULATION is set and by the host tools.
+#
+# Only plain arithmetic and comparisons are used, so every state and parameter can be a
+# float (one heater, on the ESP32) or a NumPy array (thousands of heaters stepped at once
+# on a PC, see tools/sim/plant.py). Conditions are written as products of comparisons
+# instead of if statements for the same reason.
+
+# Fuel and air
+PULSE_GRAMS = 0.022 * 0.84  # 22 ul dosing pump stroke of diesel
+FUEL_ENERGY = 43000.0  # J/g
+STOICHIOMETRIC_AFR = 14.5
+MAX_AIR_FLOW = 2.5  # g/s of combustion air at full fan duty
+AIR_CP = 1.005  # J/(g K)
+
+# Combustion air fan
+FAN_MAX_RPM = 6000.0  # At full duty
+FAN_STALL_DUTY = 0.15  # The motor doesn't turn below this duty
+FAN_CURVE = 0.7  # RPM rises steeply above the stall duty and flattens out towards full duty
+FAN_TAU = 0.5  # s, spin-up of rotor and impeller
+
+# Combustion
+COMBUSTION_EFFICIENCY = 0.85
+LAMBDA_MIN = 0.7  # Too rich below this, the flame chokes
+LAMBDA_MAX = 6.0  # Too lean above this, the flame blows out
+MIN_FUEL_RATE = 0.3  # Pulses/s needed to keep the evaporator wet
+FUEL_TAU = 2.0  # s, the evaporator smooths out the pump pulses
+GLOW_POWER = 80.0  # W into the chamber while the glow plug is on
+GLOW_TEMP = 1000.0  # C the glow plug tip reaches
+GLOW_TAU = 12.0  # s
+IGNITION_TEMP = 700.0  # C at the glow plug tip needed to light the fuel
+
+# Heat exchanger, exhaust and output side
+HX_CAPACITY = 2500.0  # J/K
+HX_UA_MIN = 10.0  # W/K into the output medium with the fan stopped
+HX_UA_FAN = 30.0  # W/K extra at full fan duty
+GAS_RISE = 10.0  # C the flame gases are above the heat exchanger per pulse/s
+EXHAUST_TAU = 6.0  # s, exhaust sensor lag
+OUTPUT_CAPACITY = 60000.0  # J/K of the heated air or coolant
+OUTPUT_LOSS = 40.0  # W/K from the heated air or coolant to ambient
+
+MAX_STEP = 0.5  # s, longer steps are split up to keep the integration stable
+
+
+class HeaterPlant:
+    """
+    One heater (float parameters) or a batch of heaters (NumPy array parameters).
+
+    ambient is the starting and surrounding temperature. ignitable=0 simulates a heater
+    that never lights, flameout_after is how long a flame burns before it goes out on
+    its own, in seconds.
+    """
+
+    def __init__(self, ambient=15.0, ignitable=1, flameout_after=1e12):
+        self.ambient = ambient
+        self.ignitable = ignitable
+        self.flameout_after = flameout_after
+
+        # Every state starts out cold, the "+ 0.0" makes a copy when ambient is an array
+        self.hx = ambient + 0.0
+        self.exhaust = ambient + 0.0
+        self.output = ambient + 0.0
+        self.glow = ambient + 0.0
+        self.fuel_rate = ambient * 0.0
+        self.flame = ambient * 0.0
+        self.burn_time = ambient * 0.0
+        self.ignitions = ambient * 0.0
+        self.fuel_burned = ambient * 0.0  # Pulses that made it into the flame
+        self.fan_rpm = ambient * 0.0
+
+    def step(self, dt, pump_hz, fan_fraction, glow_on):
+        """
+        Advance the model by dt seconds with the given pump rate (pulses/s), fan duty (0-1)
+        and glow plug state.
+        """
+        while dt > 0:
+            h = dt if dt < MAX_STEP else MAX_STEP
+            self._step(h, pump_hz, fan_fraction, glow_on)
+            dt -= h
+
+    def _step(self, dt, pump_hz, fan_fraction, glow_on):
+        glow_on = glow_on > 0
+        self.fuel_rate = self.fuel_rate + (pump_hz - self.fuel_rate) * (dt / FUEL_TAU)
+        self.glow = self.glow + (glow_on * GLOW_TEMP + (1 - glow_on) * self.hx - self.glow) * (dt / GLOW_TAU)
+
+        # Implicit step, stays stable whatever dt is
+        turning = (fan_fraction > FAN_STALL_DUTY) * (fan_fraction - FAN_STALL_DUTY) / (1 - FAN_STALL_DUTY)
+        fan_target = FAN_MAX_RPM * turning ** FAN_CURVE
+        self.fan_rpm = self.fan_rpm + (fan_target - self.fan_rpm) * (dt / (FAN_TAU + dt))
+
+        air_flow = MAX_AIR_FLOW * fan_fraction
+        fuel_flow = self.fuel_rate * PULSE_GRAMS
+        mixture = air_flow / (fuel_flow * STOICHIOMETRIC_AFR + 1e-9)
+        can_burn = (mixture > LAMBDA_MIN) * (mixture < LAMBDA_MAX) * (self.fuel_rate > MIN_FUEL_RATE)
+
+        ignite = glow_on * (self.glow > IGNITION_TEMP) * can_burn * self.ignitable
+        lit = ((self.flame + ignite) > 0) * can_burn * (self.burn_time < self.flameout_after)
+        self.ignitions = self.ignitions + lit * (self.flame <= 0)
+        self.flame = lit * 1.0
+        self.burn_time = self.burn_time + self.flame * dt
+        self.fuel_burned = self.fuel_burned + self.flame * self.fuel_rate * dt
+
+        # Heat exchanger energy balance
+        heat_in = self.flame * COMBUSTION_EFFICIENCY * fuel_flow * FUEL_ENERGY + glow_on * GLOW_POWER
+        to_output = (HX_UA_MIN + HX_UA_FAN * fan_fraction) * (self.hx - self.output)
+        to_exhaust = air_flow * AIR_CP * (self.hx - self.ambient)
+        self.hx = self.hx + (heat_in - to_output - to_exhaust) * (dt / HX_CAPACITY)
+
+        # The exhaust sensor sits in the flue gas, the output in the heated air or coolant
+        gas = self.hx + self.flame * GAS_RISE * self.fuel_rate
+        self.exhaust = self.exhaust + (gas - self.exhaust) * (dt / EXHAUST_TAU)
+        self.output = self.output + (to_output - OUTPUT_LOSS * (self.output - self.ambient)) * (dt / OUTPUT_CAPACITY)
@@ -0,0 +1,135 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+from array import array
+
+
+class RingBuffer:
+    """
+    Fixed-capacity history of float samples.
+
+    The storage is allocated once. The sum is kept up to date on every push, and
+    min/max are only rescanned when the sample that held them drops out.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.buffer = array('f', [0.0] * capacity)
+        self.clear()
+
+    def clear(self):
+        self.head = 0  # Index the next sample is written to
+        self.count = 0
+        self.total = 0.0
+        self.minimum = 0.0
+        self.maximum = 0.0
+        self.extremes_stale = False
+
+    def push(self, value):
+        buffer = self.buffer
+        head = self.head
+
+        if self.count == self.capacity:
+            oldest = buffer[head]
+            self.total -= oldest
+            if oldest <= self.minimum or oldest >= self.maximum:
+                self.extremes_stale = True
+        else:
+            self.count += 1
+
+        buffer[head] = value
+        value = buffer[head]  # Use the stored (single precision) value from here on
+        self.total += value
+        if self.count == 1:
+            self.minimum = value
+            self.maximum = value
+        elif value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+        head += 1
+        if head == self.capacity:
+            head = 0
+            # Re-sum once per lap so float rounding in the running total can't build up
+            if self.count == self.capacity:
+                self._resum()
+        self.head = head
+
+    def _resum(self):
+        total = 0.0
+        for value in self.buffer:
+            total += value
+        self.total = total
+
+    def _rescan(self):
+        buffer = self.buffer
+        index = self.head - self.count
+        minimum = maximum = buffer[index]
+        for _ in range(self.count - 1):
+            index += 1
+            value = buffer[index]
+            if value < minimum:
+                minimum = value
+            if value > maximum:
+                maximum = value
+        self.minimum = minimum
+        self.maximum = maximum
+        self.extremes_stale = False
+
+    def __len__(self):
+        return self.count
+
+    def is_full(self):
+        return self.count == self.capacity
+
+    def mean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def min(self):
+        if self.extremes_stale:
+            self._rescan()
+        return self.minimum
+
+    def max(self):
+        if self.extremes_stale:
+            self._rescan()
+        return self.maximum
+
+    def latest(self):
+        return self.buffer[self.head - 1]
+
+    def oldest(self):
+        return self.buffer[self.head - self.count]
+
+    def get(self, age):
+        """
+        Return a sample by age, 0 being the latest.
+        """
+        return self.buffer[self.head - 1 - age]
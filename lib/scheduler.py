@@ -0,0 +1,173 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# Runs the firmware's periodic jobs as tasks on the asyncio event loop, each at its own
+# rate from config.json, and keeps timing statistics for every task in a fixed table.
+from array import array
+import utime
+import hardwareConfig as config
+from lib import liveness
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio  # CPython, for running the firmware on a PC
+
+MAX_TASKS = 8
+AVERAGE_WEIGHT = 1 / 16  # Averages are exponential, over roughly the last 16 runs
+
+
+def log(message, level=1):
+    if config.LOG_LEVEL >= level:
+        print(f"[Scheduler] {message}")
+
+
+class Scheduler:
+    """
+    Periodic tasks with per-task statistics. Everything is preallocated in add(), so a
+    task run doesn't allocate anything for its bookkeeping.
+
+    Jitter is how late a run started against its schedule. An overrun is a run that
+    finished after the next one should have started; the schedule then restarts from
+    now instead of running the missed periods back to back.
+
+    Every task checks in with liveness.registry after each run that didn't raise, with a
+    deadline of LIVENESS_PERIODS of its periods, at least LIVENESS_MIN_DEADLINE. A run that raises is logged and counted,
+    and the task carries on at its next period.
+    """
+
+    def __init__(self, max_tasks=MAX_TASKS):
+        self.names = []
+        self.functions = []
+        self.periods_us = array('l', [0] * max_tasks)
+        self.runs = array('L', [0] * max_tasks)
+        self.overruns = array('L', [0] * max_tasks)
+        self.max_jitter_us = array('l', [0] * max_tasks)
+        self.avg_jitter_us = array('f', [0] * max_tasks)
+        self.max_exec_us = array('l', [0] * max_tasks)
+        self.avg_exec_us = array('f', [0] * max_tasks)
+        self.errors = array('L', [0] * max_tasks)
+        self.liveness_ids = array('B', [0] * max_tasks)
+        self.running = []  # asyncio tasks, once started
+
+    def add(self, name, rate_hz, function):
+        if len(self.names) >= len(self.periods_us):
+            raise ValueError(f"no room for task '{name}', at most {len(self.periods_us)} tasks")
+        if rate_hz <= 0:
+            raise ValueError(f"task '{name}' needs a rate above 0 Hz, not {rate_hz}")
+        index = len(self.names)
+        self.names.append(name)
+        self.functions.append(function)
+        self.periods_us[index] = int(1000000 / rate_hz)
+        deadline_ms = max(config.LIVENESS_PERIODS * self.periods_us[index] // 1000, config.LIVENESS_MIN_DEADLINE)
+        self.liveness_ids[index] = liveness.registry.register(name, deadline_ms, name in liveness.critical_names())
+        return index
+
+    def start(self):
+        for index in range(len(self.names)):
+            log(f"{self.names[index]} every {self.periods_us[index] // 1000} ms", level=2)
+            self.running.append(asyncio.create_task(self._run(index)))
+        return self.running
+
+    def reset_stats(self):
+        for index in range(len(self.names)):
+            self.runs[index] = 0
+            self.overruns[index] = 0
+            self.max_jitter_us[index] = 0
+            self.avg_jitter_us[index] = 0
+            self.max_exec_us[index] = 0
+            self.avg_exec_us[index] = 0
+            self.errors[index] = 0
+
+    async def _run(self, index):
+        function = self.functions[index]
+        period_us = self.periods_us[index]
+        next_run = utime.ticks_us()
+        while True:
+            started = utime.ticks_us()
+            jitter = utime.ticks_diff(started, next_run)
+            try:
+                function()
+            except Exception as e:
+                self.errors[index] += 1
+                log(f"{self.names[index]} failed: {e!r}", level=0)
+            else:
+                liveness.registry.check_in(self.liveness_ids[index])
+            took = utime.ticks_diff(utime.ticks_us(), started)
+            self._record(index, jitter, took)
+
+            next_run = utime.ticks_add(next_run, period_us)
+            delay = utime.ticks_diff(next_run, utime.ticks_us())
+            if delay < 0:
+                self.overruns[index] += 1
+                next_run = utime.ticks_us()
+                delay = 0
+            await asyncio.sleep(delay / 1000000)
+
+    def _record(self, index, jitter, took):
+        if self.runs[index] == 0:
+            self.avg_jitter_us[index] = jitter
+            self.avg_exec_us[index] = took
+        else:
+            self.avg_jitter_us[index] += (jitter - self.avg_jitter_us[index]) * AVERAGE_WEIGHT
+            self.avg_exec_us[index] += (took - self.avg_exec_us[index]) * AVERAGE_WEIGHT
+        self.runs[index] += 1
+        if jitter > self.max_jitter_us[index]:
+            self.max_jitter_us[index] = jitter
+        if took > self.max_exec_us[index]:
+            self.max_exec_us[index] = took
+
+    def stats(self):
+        """
+        Statistics per task name, in milliseconds, for telemetry.
+        """
+        result = {}
+        for index in range(len(self.names)):
+            result[self.names[index]] = {
+                "period_ms": self.periods_us[index] / 1000,
+                "runs": self.runs[index],
+                "overruns": self.overruns[index],
+                "jitter_ms": [round(self.avg_jitter_us[index] / 1000, 2), self.max_jitter_us[index] / 1000],
+                "exec_ms": [round(self.avg_exec_us[index] / 1000, 2), self.max_exec_us[index] / 1000],
+                "errors": self.errors[index],
+            }
+        return result
+
+    def format_stats(self):
+        lines = [f"{'task':<10} {'period ms':>9} {'runs':>7} {'overruns':>8} {'jitter ms avg/max':>17} "
+                 f"{'exec ms avg/max':>15}"]
+        for name, task in self.stats().items():
+            lines.append(f"{name:<10} {task['period_ms']:>9.0f} {task['runs']:>7} {task['overruns']:>8} "
+                         f"{task['jitter_ms'][0]:>10.2f}/{task['jitter_ms'][1]:<6.1f}"
+                         f"{task['exec_ms'][0]:>8.2f}/{task['exec_ms'][1]:<6.1f}")
+        return lines
+
+
+# The firmware's tasks, set up in main.py
+tasks = Scheduler()
@@ -27,18 +27,9 @@
 # Stay safe and think before you act.                              #
 ####################################################################
 
-import math
+import utime
 import hardwareConfig as config
-
-# Predefined R0, and T0 values for common thermistors
-common_thermistors = {
-    'NTC_10k': {'R0': 10000, 'T0': 298.15},
-    'NTC_50k': {'R0': 50000, 'T0': 298.15},
-    'NTC_100k': {'R0': 100000, 'T0': 298.15},
-    'PTC_500': {'R0': 500, 'T0': 298.15},
-    'PTC_1k': {'R0': 1000, 'T0': 298.15},
-    'PTC_2.3k': {'R0': 2300, 'T0': 298.15},
-}
+from lib import thermistor, adcSampler, filters, plant
 
 
 def log(message, level=1):
@@ -46,106 +37,131 @@ def log(message, level=1):
         print(f"[Sensor] {message}")
 
 
-# Initialize an empty list to keep track of the last N temperature measurements for each sensor
-temp_history_output = []
-temp_history_exhaust = []
-
-# The number of past measurements to average
-TEMP_HISTORY_LENGTH = 3
+# read_output_temp and read_exhaust_temp are called at SENSOR_RATE_HZ
+SAMPLE_PERIOD = 1 / config.SENSOR_RATE_HZ
 
+# Used if a filter in config.json can't be built, the old 3 sample moving average
+FALLBACK_FILTER = "mean:3"
 
-def read_temp(analog_value, sensor_type, sensor_beta, sensor_name="output"):
-    global temp_history_output, temp_history_exhaust
 
+def make_filter(spec, sensor_name):
     try:
-        if analog_value == 4095:
-            log("Warning: ADC max value reached, can't calculate resistance")
-            return 999
+        chain = filters.build_chain(spec, SAMPLE_PERIOD)
+    except ValueError as e:
+        log(f"Bad {sensor_name} filter '{spec}': {e}. Using '{FALLBACK_FILTER}'")
+        chain = filters.build_chain(FALLBACK_FILTER, SAMPLE_PERIOD)
+    log(f"{sensor_name} filter adds {chain.group_delay_seconds()}s of delay", level=2)
+    return chain
 
-        resistance = 10000 * (analog_value / (4095 - analog_value))
-        params = common_thermistors.get(sensor_type, {})
 
-        if not params:
-            log("Invalid sensor type specified")
-            return 999
+# Filter chain for each sensor
+output_filter = make_filter(config.OUTPUT_FILTER, "output")
+exhaust_filter = make_filter(config.EXHAUST_FILTER, "exhaust")
 
-        R0 = params['R0']
-        T0 = params['T0']
-        BETA = sensor_beta
 
-        temperature_k = 1 / (
-                math.log(resistance / R0) / BETA + 1 / T0
-        ) if 'NTC' in sensor_type else 1 / (
-                1 / T0 + (1 / BETA) * math.log(resistance / R0)
-        )
+# ADC to temperature lookup tables, built once at boot for each configured sensor
+output_table = thermistor.build_table(config.OUTPUT_SENSOR_TYPE, config.OUTPUT_SENSOR_BETA)
+exhaust_table = thermistor.build_table(config.EXHAUST_SENSOR_TYPE, config.EXHAUST_SENSOR_BETA)
 
-        temperature_c = temperature_k - 273.15
+# Latest temperatures before the filter chains, for the interlock, and utime.ticks_us() of
+# the ADC reading they came from
+output_raw = thermistor.INVALID_TEMP
+exhaust_raw = thermistor.INVALID_TEMP
+sampled_us = 0
 
-        # Choose the history list based on the sensor name
-        history_list = temp_history_output if sensor_name == "output" else temp_history_exhaust
 
-        # Add the new temperature measurement to the history
-        history_list.append(temperature_c)
+def latest_reading(sampler, adc):
+    # Use the background sampler's latest burst, or read directly if it isn't running
+    global sampled_us
+    value = sampler.value
+    if value >= 0:
+        sampled_us = adcSampler.burst_us
+        return value
+    sampled_us = utime.ticks_us()
+    return adc.read()
+
+
+def convert(analog_value, table):
+    try:
+        if analog_value == 4095:
+            log("Warning: ADC max value reached, can't calculate resistance")
+            return thermistor.INVALID_TEMP
 
-        # Remove the oldest measurement if history is too long
-        if len(history_list) > TEMP_HISTORY_LENGTH:
-            history_list.pop(0)
+        if table is None:
+            log("Invalid sensor type specified")
+            return thermistor.INVALID_TEMP
 
-        # Calculate and return the average temperature
-        avg_temperature = sum(history_list) / len(history_list)
-        return avg_temperature
+        temperature_c = thermistor.lookup(table, analog_value)
+        if temperature_c == thermistor.INVALID_TEMP:
+            log("Warning: ADC reading out of range, can't calculate temperature")
+        return temperature_c
 
     except Exception as e:
         log(f"An error occurred while reading the temperature sensor: {e}")
+        return thermistor.INVALID_TEMP
+
+
+def read_temp(analog_value, table, sensor_name="output"):
+    global output_raw, exhaust_raw
+    temperature_c = convert(analog_value, table)
+    if sensor_name == "output":
+        output_raw = temperature_c
+    else:
+        exhaust_raw = temperature_c
+    if temperature_c == thermistor.INVALID_TEMP:
         return 999
 
+    try:
+        # Run the measurement through the sensor's filter chain
+        chain = output_filter if sensor_name == "output" else exhaust_filter
+        return chain.update(temperature_c)
+
+    except Exception as e:
+        log(f"An error occurred while filtering the temperature: {e}")
+        return 999
+
+
+# Heater model used instead of the sensors when IS_SIMULATION is set
+simulated_plant = plant.HeaterPlant() if config.IS_SIMULATION else None
+last_simulation_ticks = None
+
 
-# Global variables for simulation
-simulated_output_temp = 20  # Simulated output temperature
-simulated_exhaust_temp = 20  # Simulated exhaust temperature
-output_temp_ramp_direction = 1  # 1 for ramping up, -1 for ramping down
+def step_simulation():
+    # Advance the heater model to now using the current fuel, fan and glow plug outputs
+    global last_simulation_ticks
+    now = utime.ticks_ms()
+    if last_simulation_ticks is not None:
+        dt = utime.ticks_diff(now, last_simulation_ticks) / 1000
+        if dt > 0:
+            simulated_plant.step(dt, config.pump_frequency, config.air_pwm.duty() / config.FAN_MAX_DUTY,
+                                 config.GLOW_PIN.value())
+    last_simulation_ticks = now
 
 
-# Read simulated output temperature
 def read_output_temp():
-    global simulated_output_temp, output_temp_ramp_direction
+    global output_raw, sampled_us
     if config.IS_SIMULATION:
-        if config.current_state == 'RUNNING':
-            if simulated_output_temp >= 80:
-                output_temp_ramp_direction = -1  # Change direction to ramp down
-            elif simulated_output_temp <= 50:
-                output_temp_ramp_direction = 1  # Change direction to ramp up
-
-            simulated_output_temp += output_temp_ramp_direction  # Increment or decrement based on direction
-        else:
-            simulated_output_temp = 20  # Reset to 20 for other states
-        return simulated_output_temp
+        step_simulation()
+        output_raw = simulated_plant.output
+        sampled_us = utime.ticks_us()
+        return simulated_plant.output
     else:
         return read_temp(
-            config.OUTPUT_TEMP_ADC.read(),
-            config.OUTPUT_SENSOR_TYPE,
-            config.OUTPUT_SENSOR_BETA,
+            latest_reading(adcSampler.output_sampler, config.OUTPUT_TEMP_ADC),
+            output_table,
             sensor_name="output"
         )
 
 
-# Read simulated exhaust temperature
 def read_exhaust_temp():
-    global simulated_exhaust_temp
+    global exhaust_raw
     if config.IS_SIMULATION:
-        if config.current_state == 'STARTING':
-            simulated_exhaust_temp = min(simulated_exhaust_temp + 1, 120)
-        elif config.current_state == 'RUNNING':
-            simulated_exhaust_temp = 120
-        elif config.current_state == 'STOPPING':
-            simulated_exhaust_temp = max(simulated_exhaust_temp - 1, 20)
-        else:
-            simulated_exhaust_temp = 20  # Reset to 20 for other states
-        return simulated_exhaust_temp
+        step_simulation()
+        exhaust_raw = simulated_plant.exhaust
+        return simulated_plant.exhaust
     else:
         return read_temp(
-            config.EXHAUST_TEMP_ADC.read(),
-            config.EXHAUST_SENSOR_TYPE,
-            config.EXHAUST_SENSOR_BETA,
+            latest_reading(adcSampler.exhaust_sampler, config.EXHAUST_TEMP_ADC),
+            exhaust_table,
             sensor_name="exhaust"
         )
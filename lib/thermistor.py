@@ -0,0 +1,152 @@
+####################################################################
+#                          WARNING                                 #
+####################################################################
+# This code is provided "AS IS" without warranty of any kind.      #
+# Use of this code in any form acknowledges your acceptance of     #
+# these terms.                                                     #
+#                                                                  #
+# This code has NOT been tested in real-world scenarios.           #
+# Improper usage, lack of understanding, or any combination        #
+# thereof can result in significant property damage, injury,       #
+# loss of life, or worse.                                          #
+# Specifically, this code is related to controlling heating        #
+# elements and systems, and there's a very real risk that it       #
+# can BURN YOUR SHIT DOWN.                                         #
+#                                                                  #
+# By using, distributing, or even reading this code, you agree     #
+# to assume all responsibility and risk associated with it.        #
+# The author(s), contributors, and distributors of this code       #
+# will NOT be held liable for any damages, injuries, or other      #
+# consequences you may face as a result of using or attempting     #
+# to use this code.                                                #
+#                                                                  #
+# Always approach such systems with caution. Ensure you understand #
+# the code, the systems involved, and the potential risks.         #
+# If you're unsure, DO NOT use the code.                           #
+#                                                                  #
+# Stay safe and think before you act.                              #
+####################################################################
+
+# ADC to temperature conversion for the divider thermistors.
+# Kept free of hardware imports so the tools can use it on a PC too.
+import math
+from array import array
+
+# Predefined R0, and T0 values for common thermistors
+common_thermistors = {
+    'NTC_10k': {'R0': 10000, 'T0': 298.15},
+    'NTC_50k': {'R0': 50000, 'T0': 298.15},
+    'NTC_100k': {'R0': 100000, 'T0': 298.15},
+    'PTC_500': {'R0': 500, 'T0': 298.15},
+    'PTC_1k': {'R0': 1000, 'T0': 298.15},
+    'PTC_2.3k': {'R0': 2300, 'T0': 298.15},
+}
+
+ADC_MAX = 4095
+SERIES_RESISTOR = 10000
+INVALID_TEMP = 999
+
+# The middle of the ADC range gets one table entry every COARSE_STEP counts with linear
+# interpolation in between. The curve bends hard near both ends of the divider, so the
+# first and last FINE_CODES readings get an entry each. That is 617 floats (~2.5 KB) per
+# sensor and stays under 0.1C over the whole useful range.
+COARSE_SHIFT = 4
+COARSE_STEP = 1 << COARSE_SHIFT
+FINE_CODES = 192
+HIGH_START = ADC_MAX + 1 - FINE_CODES
+COARSE_BASE = FINE_CODES
+HIGH_BASE = COARSE_BASE + (HIGH_START - FINE_CODES) // COARSE_STEP + 1
+TABLE_SIZE = HIGH_BASE + FINE_CODES
+
+# Tables are built once per (sensor_type, beta) and shared between sensors
+_tables = {}
+
+
+def beta_temperature(analog_value, sensor_type, sensor_beta):
+    """
+    Convert a raw ADC reading to Celsius with the Beta equation.
+
+    This is the reference formula the lookup tables are generated from.
+    Returns INVALID_TEMP for readings that can't be converted.
+    """
+    if analog_value >= ADC_MAX or analog_value <= 0:
+        return INVALID_TEMP
+
+    params = common_thermistors.get(sensor_type)
+    if not params:
+        return INVALID_TEMP
+
+    resistance = SERIES_RESISTOR * (analog_value / (ADC_MAX - analog_value))
+    R0 = params['R0']
+    T0 = params['T0']
+    BETA = sensor_beta
+
+    temperature_k = 1 / (
+            math.log(resistance / R0) / BETA + 1 / T0
+    ) if 'NTC' in sensor_type else 1 / (
+            1 / T0 + (1 / BETA) * math.log(resistance / R0)
+    )
+
+    return temperature_k - 273.15
+
+
+def build_table(sensor_type, sensor_beta):
+    """
+    Build (or fetch the cached) lookup table for a sensor type and beta.
+
+    Returns None if the sensor type is unknown.
+    """
+    key = (sensor_type, sensor_beta)
+    table = _tables.get(key)
+    if table is not None:
+        return table
+
+    if sensor_type not in common_thermistors:
+        return None
+
+    table = array('f', [0.0] * TABLE_SIZE)
+    for i in range(TABLE_SIZE):
+        if i < COARSE_BASE:
+            analog_value = i
+        elif i < HIGH_BASE:
+            analog_value = FINE_CODES + (i - COARSE_BASE) * COARSE_STEP
+        else:
+            analog_value = HIGH_START + i - HIGH_BASE
+        # The end points can't be converted, clamp them to the nearest valid reading
+        analog_value = min(max(analog_value, 1), ADC_MAX - 1)
+        table[i] = beta_temperature(analog_value, sensor_type, sensor_beta)
+
+    _tables[key] = table
+    return table
+
+
+def lookup(table, analog_value):
+    """
+    Convert a raw ADC reading to Celsius using a table from build_table().
+    """
+    if analog_value >= ADC_MAX or analog_value <= 0:
+        return INVALID_TEMP
+
+    if analog_value < FINE_CODES:
+        return table[analog_value]
+    if analog_value >= HIGH_START:
+        return table[HIGH_BASE + analog_value - HIGH_START]
+
+    offset = analog_value - FINE_CODES
+    index = COARSE_BASE + (offset >> COARSE_SHIFT)
+    fraction = offset & (COARSE_STEP - 1)
+    low = table[index]
+    if fraction == 0:
+        return low
+    return low + (table[index + 1] - low) * fraction / COARSE_STEP
+
+
+def temperature_to_adc(temperature_c, sensor_type, sensor_beta):
+    """
+    Inverse of beta_temperature(), used by the simulator to fake ADC readings.
+    """
+    params = common_thermistors[sensor_type]
+    ratio = math.exp(sensor_beta * (1 / (temperature_c + 273.15) - 1 / params['T0']))
+    resistance = params['R0'] * ratio
+    analog_value = int(ADC_MAX * resistance / (resistance + SERIES_RESISTOR) + 0.5)
+    return min(max(analog_value, 1), ADC_MAX - 1)
@@ -28,14 +28,17 @@
 ####################################################################
 
 import machine
-import _thread
 import hardwareConfig as config
 import utime
-from machine import Timer
 from states import stateMachine, emergencyStop
-from lib import sensors, networking, fanPID
+from lib import sensors, networking, fanPID, adcSampler, scheduler, fuelPump, interlock, liveness, eventLog
 import webserver
 
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio  # CPython, for running the firmware on a PC
+
 # Initialize the WDT with a 10-second timeout
 wdt = machine.WDT(id=0, timeout=10000)  # 10 seconds
 
@@ -54,83 +57,65 @@ def get_reset_reason():
     return reset_reason
 
 
-pulse_timer = Timer(0)
-last_pulse_time = 0
-off_timer = Timer(1)
-
-
-def turn_off_pump(_):
-    config.FUEL_PIN.off()
+def read_sensors():
+    config.output_temp = sensors.read_output_temp()
+    config.exhaust_temp = sensors.read_exhaust_temp()
+    if config.IS_SIMULATION:
+        # No ADC bursts for the interlock to follow, it goes by the simulated readings
+        interlock.check(sensors.output_raw, sensors.exhaust_raw, sensors.sampled_us)
 
 
-def pulse_fuel_callback(_):
-    global last_pulse_time
-    current_time = utime.ticks_ms()
-
-    if utime.ticks_diff(current_time, config.heartbeat) > 10000:
-        config.FUEL_PIN.off()
-        log("Heartbeat missing, fuel pump turned off.")
-    elif config.pump_frequency > 0:
-        period = 1000.0 / config.pump_frequency
+def control():
+    config.heartbeat = utime.ticks_ms()
+    current_switch_value = config.SWITCH_PIN.value()
 
-        if utime.ticks_diff(current_time, last_pulse_time) >= period:
-            last_pulse_time = current_time
-            config.FUEL_PIN.on()
-            off_timer.init(period=int(config.PUMP_ON_TIME * 1000), mode=Timer.ONE_SHOT, callback=turn_off_pump)
-    else:
-        config.FUEL_PIN.off()
+    config.current_state, config.emergency_reason = stateMachine.handle_state(
+        config.current_state,
+        current_switch_value,
+        config.exhaust_temp,
+        config.output_temp
+    )
+    fuelPump.update()
+    eventLog.events.state(config.current_state)
 
+    log(f"Current state: {config.current_state}")
+    if config.emergency_reason:
+        log(f"Emergency reason: {config.emergency_reason}")
+        emergencyStop.emergency_stop(config.emergency_reason)
 
-pulse_timer.init(period=100, mode=Timer.PERIODIC, callback=pulse_fuel_callback)
 
-
-def emergency_stop_thread():
-    while True:
+def monitor():
+    # Only fed while every critical task keeps checking in, a stuck or failing one gets us reset
+    stalled = liveness.registry.stalled()
+    if stalled is None:
         wdt.feed()
-        current_time = utime.ticks_ms()  # Use ticks_ms to get the current time in milliseconds
-
-        if utime.ticks_diff(current_time, config.heartbeat) > 10000:  # Compare in milliseconds (10 seconds = 10000 ms)
-            emergencyStop.emergency_stop("No heartbeat detected")
-
-        utime.sleep(1)
-
-
-def run_networking_thread():
-    while True:
-        networking.run_networking()
-        utime.sleep(5)
-
-
-def main():
-    while True:
-        config.heartbeat = utime.ticks_ms()
-
-        config.output_temp = sensors.read_output_temp()
-        config.exhaust_temp = sensors.read_exhaust_temp()
-        current_switch_value = config.SWITCH_PIN.value()
+    else:
+        log(f"Not feeding the watchdog, {stalled} has stalled", level=0)
+    current_time = utime.ticks_ms()
 
-        config.current_state, config.emergency_reason = stateMachine.handle_state(
-            config.current_state,
-            current_switch_value,
-            config.exhaust_temp,
-            config.output_temp
-        )
+    if utime.ticks_diff(current_time, config.heartbeat) > 10000:  # Compare in milliseconds (10 seconds = 10000 ms)
+        emergencyStop.emergency_stop("No heartbeat detected")
 
-        log(f"Current state: {config.current_state}")
-        if config.emergency_reason:
-            log(f"Emergency reason: {config.emergency_reason}")
 
-        utime.sleep(1)
+async def main():
+    tasks = scheduler.tasks
+    tasks.add('sensors', config.SENSOR_RATE_HZ, read_sensors)
+    tasks.add('control', config.CONTROL_RATE_HZ, control)
+    tasks.add('monitor', config.MONITOR_RATE_HZ, monitor)
+    tasks.add('network', config.NETWORK_RATE_HZ, networking.run_networking)
+    if config.USE_MQTT:
+        tasks.add('mqtt', config.MQTT_POLL_RATE_HZ, networking.poll_mqtt)
+    if config.FAN_RPM_SENSOR:
+        tasks.add('fan', config.FAN_RATE_HZ, fanPID.fan_control_step)
+    if config.USE_WEBSERVER:
+        await webserver.start_server()
+    await asyncio.gather(*tasks.start())
 
 
 if __name__ == "__main__":
     boot_reason = get_reset_reason()
     log(f"Reset/Boot Reason was: {boot_reason}")
-    _thread.start_new_thread(emergency_stop_thread, ())
-    _thread.start_new_thread(run_networking_thread, ())
-    if config.FAN_RPM_SENSOR:
-        _thread.start_new_thread(fanPID.fan_control_thread, ())
-    if config.USE_WEBSERVER:
-        _thread.start_new_thread(webserver.web_server, ())
-    main()
-
+    eventLog.events.record(eventLog.BOOT, boot_reason)
+    if not config.IS_SIMULATION:
+        adcSampler.start(interlock.burst_check)
+    asyncio.run(main())
@@ -27,11 +27,14 @@
 # Stay safe and think before you act.                              #
 ####################################################################
 
+import utime
 import hardwareConfig as config
-from lib import helpers
+from lib import helpers, autotune, flameDetector
+from lib.fuelAirMap import FuelAirMap
+from lib.pid import PIDController
 
-# Initialize a list to store the last N exhaust temperatures
-exhaust_temp_history = []
+# Watches the exhaust temperature for the flame going out while RUNNING
+flame_detector = flameDetector.make_detector()
 
 
 def log(message, level=1):
@@ -39,42 +42,102 @@ def log(message, level=1):
         print(f"[Control] {message}")
 
 
-def calculate_pump_frequency(target_temp, output_temp, max_delta, max_frequency, min_frequency):
-    delta = target_temp - output_temp
-    pump_frequency = min(max((delta / max_delta) * max_frequency, min_frequency), max_frequency)
-    return pump_frequency
+FALLBACK_FUEL_AIR_MAP = "0:1.0:20,100:5.0:60"
 
 
-def control_air_and_fuel(output_temp, exhaust_temp):
-    log("Performing air and fuel control...")
+def make_fuel_air_map(spec):
+    try:
+        return FuelAirMap(spec)
+    except ValueError as e:
+        log(f"Bad FUEL_AIR_MAP '{spec}': {e}. Using '{FALLBACK_FUEL_AIR_MAP}'", level=0)
+        return FuelAirMap(FALLBACK_FUEL_AIR_MAP)
 
-    # Update the exhaust temperature history
-    exhaust_temp_history.append(exhaust_temp)
 
-    # Manually enforce maximum length
-    while len(exhaust_temp_history) > config.EXHAUST_TEMP_HISTORY_LENGTH:
-        exhaust_temp_history.pop(0)
+# The modulating controller turns the output temperature error into one heat demand in
+# percent, the fuel/air map turns that into pump frequency and fan speed
+fuel_air_map = make_fuel_air_map(config.FUEL_AIR_MAP)
+heat_pid = PIDController(kp=config.HEAT_KP, ki=config.HEAT_KI, kd=0.0)
+last_control_time = 0
 
-    # Check for decreasing exhaust temperature over the last N readings
-    if len(exhaust_temp_history) == config.EXHAUST_TEMP_HISTORY_LENGTH:
-        if all(earlier - later > config.MIN_TEMP_DELTA for earlier, later in
-               zip(exhaust_temp_history, exhaust_temp_history[1:])):
-            log("Flame out detected based on decreasing exhaust temperature. Exiting...", level=0)
-            return "FLAME_OUT"
 
+def calculate_pump_frequency(target_temp, output_temp, max_delta, max_frequency, min_frequency):
+    delta = target_temp - output_temp
+    pump_frequency = min(max((delta / max_delta) * max_frequency, min_frequency), max_frequency)
+    return pump_frequency
+
+
+def begin_running():
+    """
+    Start the flame-out detector and the modulating controller afresh. The startup ends on
+    whatever fuel lit the flame, often the full ramp, and carrying that over as integral
+    overshot into STANDBY whenever the heater restarted close to the target. PUMP_RAMP_RATE
+    keeps the step down to what the controller asks for smooth.
+    """
+    global last_control_time
+    flame_detector.reset()
+    heat_pid.reset()
+    last_control_time = utime.ticks_ms()
+
+
+def modulating_air_and_fuel(output_temp):
+    global last_control_time
+    now = utime.ticks_ms()
+    dt = utime.ticks_diff(now, last_control_time) / 1000.0
+    last_control_time = now
+    # No more demand than the fuel limit lets through, so the integral doesn't wind up
+    # behind a MAX_PUMP_FREQUENCY lowered at runtime
+    heat_pid.out_max = fuel_air_map.demand_for_pump(config.MAX_PUMP_FREQUENCY)
+    demand = heat_pid.calculate(config.TARGET_TEMP, output_temp, dt)
+
+    # While the temperature loop is being tuned, the relay sets the demand instead
+    if autotune.temperature.running:
+        relay = autotune.temperature.step(output_temp, now)
+        if relay is not None:
+            demand = relay
+
+    config.heat_demand = demand
+    # The map can ask for more than the configured limits, the limits win
+    pump_frequency, fan_speed_percentage = fuel_air_map.lookup(demand)
+    pump_frequency = min(max(pump_frequency, config.MIN_PUMP_FREQUENCY), config.MAX_PUMP_FREQUENCY)
+    fan_speed_percentage = min(max(fan_speed_percentage, config.MIN_FAN_PERCENTAGE), config.MAX_FAN_PERCENTAGE)
+    return pump_frequency, fan_speed_percentage
+
+
+def proportional_air_and_fuel(output_temp):
     # Calculate the fan speed percentage based on temperature delta
     delta = config.TARGET_TEMP - output_temp
-    config.fan_speed_percentage = min(max((delta / config.CONTROL_MAX_DELTA) * 100, config.MIN_FAN_PERCENTAGE),
-                                      config.MAX_FAN_PERCENTAGE)
-
-    # Use the helper function to set the fan speed
-    helpers.set_fan_percentage(config.fan_speed_percentage)
+    fan_speed_percentage = min(max((delta / config.CONTROL_MAX_DELTA) * 100, config.MIN_FAN_PERCENTAGE),
+                               config.MAX_FAN_PERCENTAGE)
 
     pump_frequency = calculate_pump_frequency(
         config.TARGET_TEMP, output_temp, config.CONTROL_MAX_DELTA,
         config.MAX_PUMP_FREQUENCY, config.MIN_PUMP_FREQUENCY
     )
 
+    # While the temperature loop is being tuned, the relay drives the pump instead
+    if autotune.temperature.running:
+        relay = autotune.temperature.step(output_temp, utime.ticks_ms())
+        if relay is not None:
+            pump_frequency = relay
+    return pump_frequency, fan_speed_percentage
+
+
+def control_air_and_fuel(output_temp, exhaust_temp):
+    log("Performing air and fuel control...")
+
+    # The pump frequency that was feeding the flame while this reading built up
+    if flame_detector.update(exhaust_temp, config.pump_frequency):
+        log("Flame out detected based on decreasing exhaust temperature. Exiting...", level=0)
+        return "FLAME_OUT"
+
+    if config.CONTROL_MODE == 'modulating':
+        pump_frequency, config.fan_speed_percentage = modulating_air_and_fuel(output_temp)
+    else:
+        pump_frequency, config.fan_speed_percentage = proportional_air_and_fuel(output_temp)
+
+    # Use the helper function to set the fan speed
+    helpers.set_fan_percentage(config.fan_speed_percentage)
+
     # Update global variables
     config.pump_frequency = pump_frequency
 
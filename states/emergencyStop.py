@@ -27,8 +27,16 @@
 # Stay safe and think before you act.                              #
 ####################################################################
 
+# Latched emergency stop. The safe outputs are set once when it triggers and then
+# re-asserted from a slow hardware timer, so a stuck or crashed task can't turn anything
+# back on, while the event loop keeps running: the watchdog stays fed and MQTT and the
+# web page keep showing the reason. Only reset() leaves EMERGENCY_STOP, and only once
+# the readings are back within the SafetyLimits, at most once per EMERGENCY_RESET_INTERVAL.
+import utime
 import hardwareConfig as config
-from machine import Timer, reset
+from machine import Timer
+from lib import fuelPump, interrupts, interlock, autotune, eventLog, sensors
+from states import startup, shutdown
 
 
 def log(message, level=1):
@@ -36,38 +44,129 @@ def log(message, level=1):
         print(f"[Emergency Stop] {message}")
 
 
-def turn_off_pumps(timer):
-    config.air_pwm.duty(0)
-    log("Fan turned off after 10 minutes.")
+latched = False
+reason = None
+triggered_ms = 0
+cooled_down = False  # The fan and water pumps are off once EMERGENCY_STOP_TIMER has run out
+reasserts = 0
+resets = 0
+last_reset_attempt_ms = None
 
-    if config.IS_WATER_HEATER:
-        config.WATER_PIN.off()
-        log("Water pump turned off after 10 minutes.")
 
+@interrupts.handler
+def reassert_safe_outputs(_):
+    # Timer callback, also used once when triggering
+    global reasserts
+    fuelPump.pump.stop()
+    config.FUEL_PIN.off()
+    config.GLOW_PIN.off()
+    config.pump_frequency = 0
+    if cooled_down:
+        config.air_pwm.duty(0)
+    else:
+        config.air_pwm.duty(config.FAN_MAX_DUTY)
+    if config.IS_WATER_HEATER:
+        config.WATER_PIN.value(0 if cooled_down else 1)
     if config.HAS_SECOND_PUMP:
-        config.WATER_SECONDARY_PIN.off()
-        log("Secondary water pump turned off after 10 minutes.")
+        config.WATER_SECONDARY_PIN.value(0 if cooled_down else 1)
+    reasserts += 1
 
-    timer.deinit()  # Stop the timer
-    log("Performing hard reset...")
-    reset()  # Perform a hard reset
 
+# Runs in the main context, the timer only triggers it
+def turn_off_pumps():
+    global cooled_down
+    cooled_down = True
+    config.fan_speed_percentage = 0
+    reassert_safe_outputs(None)
+    log(f"Fan and water pumps turned off after {config.EMERGENCY_STOP_TIMER // 1000}s, still latched.")
 
-def emergency_stop(reason):
-    log(f"Triggered due to {reason}. Initiating emergency stop sequence.")
 
-    # Create a timer that will call `turn_off_pumps` after 10 minutes
-    pump_timer = Timer(-1)
-    pump_timer.init(period=config.EMERGENCY_STOP_TIMER, mode=Timer.ONE_SHOT, callback=turn_off_pumps)
+turn_off_pumps_later = interrupts.Deferred(turn_off_pumps)
+pump_timer = Timer(-1)
+reassert_timer = Timer(-1)
 
-    while True:
-        config.current_state = 'EMERGENCY_STOP'
-        config.GLOW_PIN.off()
-        config.FUEL_PIN.off()
-        if config.IS_WATER_HEATER:
-            config.WATER_PIN.on()
-        if config.HAS_SECOND_PUMP:
-            config.WATER_SECONDARY_PIN.on()
-        config.air_pwm.duty(config.FAN_MAX_DUTY)
-        config.pump_frequency = 0
-        log("All pins and frequencies set to safe states. Please reboot to continue.")
+
+def emergency_stop(why):
+    """
+    Latch EMERGENCY_STOP. Safe to call again while latched, the first reason is kept.
+    """
+    global latched, reason, triggered_ms, cooled_down
+    config.current_state = 'EMERGENCY_STOP'
+    if latched:
+        config.emergency_reason = reason
+        return
+
+    latched = True
+    reason = why
+    triggered_ms = utime.ticks_ms()
+    cooled_down = False
+    config.emergency_reason = why
+    log(f"Triggered due to {why}. Initiating emergency stop sequence.")
+
+    # Nothing that could turn the burner back on may carry on
+    startup.sequence.cancel()
+    shutdown.sequence.active = False
+    autotune.stop()
+
+    config.fan_speed_percentage = 100
+    reassert_safe_outputs(None)
+    reassert_timer.init(period=config.EMERGENCY_REASSERT_PERIOD, mode=Timer.PERIODIC,
+                        callback=reassert_safe_outputs)
+    # Cool down with the fan and water pumps running, then turn them off as well
+    pump_timer.init(period=config.EMERGENCY_STOP_TIMER, mode=Timer.ONE_SHOT, callback=turn_off_pumps_later.trigger_ref)
+    log("All pins and frequencies set to safe states. Waiting for a reset.")
+    eventLog.events.record(eventLog.EMERGENCY, eventLog.reason_code(why))
+
+
+def reset():
+    """
+    Leave EMERGENCY_STOP for OFF. Returns what happened, for MQTT and the web page.
+    """
+    global latched, reason, resets, last_reset_attempt_ms
+    if not latched:
+        return "not in emergency stop"
+    now = utime.ticks_ms()
+    since = triggered_ms if last_reset_attempt_ms is None else last_reset_attempt_ms
+    wait_ms = config.EMERGENCY_RESET_INTERVAL - utime.ticks_diff(now, since)
+    if wait_ms > 0:
+        return f"reset refused, try again in {wait_ms // 1000 + 1}s"
+    last_reset_attempt_ms = now
+
+    fault = interlock.fault(sensors.output_raw, sensors.exhaust_raw)
+    if fault is not None:
+        log(f"Reset refused: {fault}")
+        return f"reset refused, {fault}"
+    if config.exhaust_temp > config.EXHAUST_SHUTDOWN_TEMP:
+        log(f"Reset refused: exhaust still at {config.exhaust_temp}C")
+        return f"reset refused, exhaust still above {config.EXHAUST_SHUTDOWN_TEMP}C"
+
+    reassert_timer.deinit()
+    pump_timer.deinit()
+    config.fan_speed_percentage = 0
+    config.air_pwm.duty(0)
+    if config.IS_WATER_HEATER:
+        config.WATER_PIN.off()
+    if config.HAS_SECOND_PUMP:
+        config.WATER_SECONDARY_PIN.off()
+    interlock.clear()
+    log(f"Reset after {reason}, heater OFF")
+    eventLog.events.record(eventLog.EMERGENCY_RESET, eventLog.reason_code(reason))
+    latched = False
+    reason = None
+    resets += 1
+    last_reset_attempt_ms = None
+    config.startup_attempts = 0
+    config.emergency_reason = None
+    config.current_state = 'OFF'
+    return "reset, heater OFF"
+
+
+def status():
+    return {
+        "latched": latched,
+        "reason": reason,
+        "seconds": utime.ticks_diff(utime.ticks_ms(), triggered_ms) // 1000 if latched else 0,
+        "cooled_down": cooled_down,
+        "reasserts": reasserts,
+        "resets": resets,
+    }
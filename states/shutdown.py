@@ -31,48 +31,67 @@ import hardwareConfig as config
 import utime
 from lib import helpers
 
+# Results of ShutdownSequence.tick()
+IN_PROGRESS = "IN_PROGRESS"
+DONE = "DONE"
+TIMEOUT = "TIMEOUT"
+
 
 def log(message, level=2):
     if config.LOG_LEVEL >= level:
         print(f"[Shutdown] {message}")
 
 
-def shut_down():
-    log("Shutting Down")
-    step = 0
-    config.current_state = 'STOPPING'
-    cooldown_start_time = None
-    shutdown_start_time = utime.time()
+class ShutdownSequence:
+    """
+    Fuel off, purge and cool down, then everything off, as a resumable state object the
+    main loop ticks once per loop. next_state is where the state machine goes once the
+    heater is cold, e.g. OFF, STANDBY or STARTING for another ignition attempt.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.step = 0
+        self.next_state = 'OFF'
+        self.start_ticks = 0
+        self.cooldown_start_ticks = None
+
+    def begin(self, next_state):
+        log(f"Shutting Down, then {next_state}")
+        self.active = True
+        self.step = 0
+        self.next_state = next_state
+        self.start_ticks = utime.ticks_ms()
+        self.cooldown_start_ticks = None
 
-    while True:
-        config.heartbeat = utime.ticks_ms()
-        config.exhaust_temp = config.exhaust_temp
-        if utime.time() - shutdown_start_time > config.SHUTDOWN_TIME_LIMIT:
+    def tick(self, exhaust_temp):
+        now = utime.ticks_ms()
+        if utime.ticks_diff(now, self.start_ticks) > config.SHUTDOWN_TIME_LIMIT * 1000:
             log("Shutdown took too long, triggering emergency stop.")
-            return
+            self.active = False
+            return TIMEOUT
 
-        if step == 0:
+        if self.step == 0:
             log("Stopping fuel supply...")
             config.pump_frequency = 0
-            step += 1
+            self.step += 1
 
-        elif step == 1:
-            if cooldown_start_time is None:
+        elif self.step == 1:
+            if self.cooldown_start_ticks is None:
                 log("Activating glow plug and fan for purging and cooling...")
                 helpers.set_fan_percentage(config.MAX_FAN_PERCENTAGE)
                 config.GLOW_PIN.on()
-                cooldown_start_time = utime.time()
+                self.cooldown_start_ticks = now
 
-            current_exhaust_temp = config.exhaust_temp
-            elapsed_time = utime.time() - cooldown_start_time
+            elapsed_time = utime.ticks_diff(now, self.cooldown_start_ticks) // 1000
 
             log(
-                f"Cooling down... Elapsed Time: {elapsed_time}s, Target Exhaust Temp: {config.EXHAUST_SHUTDOWN_TEMP}C, Current Exhaust Temp: {current_exhaust_temp}C")
+                f"Cooling down... Elapsed Time: {elapsed_time}s, Target Exhaust Temp: {config.EXHAUST_SHUTDOWN_TEMP}C, Current Exhaust Temp: {exhaust_temp}C")
 
-            if elapsed_time >= config.COOLDOWN_MIN_TIME and current_exhaust_temp <= config.EXHAUST_SHUTDOWN_TEMP:
-                step += 1
+            if elapsed_time >= config.COOLDOWN_MIN_TIME and exhaust_temp <= config.EXHAUST_SHUTDOWN_TEMP:
+                self.step += 1
 
-        elif step == 2:
+        elif self.step == 2:
             log("Turning off electrical components...")
             helpers.set_fan_percentage(0)
             config.GLOW_PIN.off()
@@ -81,6 +100,10 @@ def shut_down():
             if config.HAS_SECOND_PUMP:
                 config.WATER_SECONDARY_PIN.off()
             log("Finished Shutting Down")
-            break
+            self.active = False
+            return DONE
+
+        return IN_PROGRESS
+
 
-        utime.sleep(1)
+sequence = ShutdownSequence()
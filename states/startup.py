@@ -29,97 +29,167 @@
 
 import hardwareConfig as config
 import utime
-import main
 from lib import helpers
+from lib.linefit import LineFit
+
+# Results of StartupSequence.tick()
+IN_PROGRESS = "IN_PROGRESS"
+DONE = "DONE"
+FAILED = "FAILED"
 
 
 def state_message(state, message):
     print(f"[Current Startup Procedure: - {state}] {message}")
 
 
-def start_up():
-    state = "WARMING_GLOW_PLUG"
-    step = 1
-    exhaust_temps = []
-    initial_exhaust_temp = None
-    last_time_checked = utime.time()
-    if config.IS_SIMULATION:
-        glow_plug_heat_up_end_time = last_time_checked + 1
-    else:
-        glow_plug_heat_up_end_time = last_time_checked + 60
-    startup_start_time = last_time_checked
-    startup_time_limit = 300  # 5 minutes in seconds
-
-    while True:
-        current_time = utime.time()
-        config.heartbeat = utime.ticks_ms()
-        main.wdt.feed()
-
-        if current_time - startup_start_time > startup_time_limit:
+def glow_plug_heat_up_time(temperature):
+    """
+    Preheat in seconds for a heater at this temperature: GLOW_PLUG_HEAT_UP_TIME when it's
+    at GLOW_PLUG_COLD_TEMP or colder, GLOW_PLUG_MIN_HEAT_UP_TIME at GLOW_PLUG_WARM_TEMP or
+    warmer, and in between in proportion.
+    """
+    cold, warm = config.GLOW_PLUG_COLD_TEMP, config.GLOW_PLUG_WARM_TEMP
+    longest, shortest = config.GLOW_PLUG_HEAT_UP_TIME, config.GLOW_PLUG_MIN_HEAT_UP_TIME
+    if temperature <= cold or warm <= cold:
+        return longest
+    if temperature >= warm:
+        return shortest
+    return longest + (shortest - longest) * (temperature - cold) / (warm - cold)
+
+
+class StartupSequence:
+    """
+    The ignition sequence as a resumable state object. The main loop calls tick() once
+    per loop with the latest exhaust temperature, so sensors, the switch and commands stay
+    live while the glow plug heats up and the fuel ramps up.
+
+    Each ramp step moves on as soon as a line through the last RAMP_RISE_WINDOW exhaust
+    readings rises by RAMP_RISE_RATE C/s, clearly above their scatter. A step that doesn't
+    show that within RAMP_SAMPLE_COUNT readings still moves on if the exhaust rose by
+    RAMP_MIN_TEMP_RISE over the step, and fails otherwise.
+    """
+
+    def __init__(self):
+        self.active = False
+        self.state = None
+        self.step = 1
+        self.rise = LineFit(max(config.RAMP_RISE_WINDOW, 3))  # Exhaust readings of the current step
+        self.step_readings = 0
+        self.initial_exhaust_temp = None
+        self.start_ticks = 0
+        self.last_sample_ticks = 0
+        self.glow_plug_heat_up_ms = 0
+
+    def begin(self):
+        self.active = True
+        self.state = "WARMING_GLOW_PLUG"
+        self.step = 1
+        self.rise.reset()
+        self.step_readings = 0
+        self.initial_exhaust_temp = None
+        self.start_ticks = utime.ticks_ms()
+        self.last_sample_ticks = self.start_ticks
+        self.glow_plug_heat_up_ms = 0
+        config.startup_successful = False  # Assume startup will fail
+
+    def cancel(self):
+        # Stop where we are, the shutdown sequence takes care of the outputs
+        self.active = False
+
+    def _finish(self, successful):
+        self.active = False
+        config.startup_successful = successful
+        if successful:
+            config.startup_time = utime.ticks_diff(utime.ticks_ms(), self.start_ticks) / 1000
+            state_message("COMPLETED", f"Time to RUNNING: {config.startup_time:.1f}s")
+        return DONE if successful else FAILED
+
+    def _next_step(self, exhaust_temp):
+        config.fan_speed_percentage = min(config.fan_speed_percentage + config.RAMP_FAN_STEP_PERCENTAGE, 100)
+        helpers.set_fan_percentage(config.fan_speed_percentage)
+        config.pump_frequency = min(config.pump_frequency + config.RAMP_PUMP_STEP_FREQUENCY,
+                                    config.MAX_PUMP_FREQUENCY)
+        state_message(self.state,
+                      f"Step {self.step} successful. Fan: {config.fan_speed_percentage}%, Fuel Pump: {config.pump_frequency} Hz")
+        self.initial_exhaust_temp = exhaust_temp
+        self.step += 1
+        self.rise.reset()
+        self.step_readings = 0
+
+    def tick(self, exhaust_temp):
+        now = utime.ticks_ms()
+        state = self.state
+
+        if utime.ticks_diff(now, self.start_ticks) > config.STARTUP_TIME_LIMIT * 1000:
             state_message("TIMEOUT", "Startup took too long. Changing state to STOPPING.")
-            config.startup_successful = False
-            return
+            return self._finish(False)
 
         if state == "WARMING_GLOW_PLUG":
             state_message(state, "Initializing system...")
-            config.startup_successful = False  # Assume startup will fail
-            initial_exhaust_temp = config.exhaust_temp
-            if initial_exhaust_temp > 100:
+            self.initial_exhaust_temp = exhaust_temp
+            if exhaust_temp > 100:
                 state_message(state, "Initial exhaust temperature too high. Stopping...")
-                config.startup_successful = False
-                return
+                return self._finish(False)
             helpers.set_fan_percentage(config.FAN_START_PERCENTAGE)
             config.GLOW_PIN.on()
+            # The colder of the two sensors is the closest we get to the combustion chamber's temperature
+            if config.IS_SIMULATION:
+                heat_up_time = 1
+            else:
+                heat_up_time = glow_plug_heat_up_time(min(exhaust_temp, config.output_temp))
+            self.glow_plug_heat_up_ms = int(heat_up_time * 1000)
             if config.IS_WATER_HEATER:
                 config.WATER_PIN.on()
             if config.HAS_SECOND_PUMP:
                 config.WATER_SECONDARY_PIN.on()
-            state_message(state, f"Fan: {config.fan_speed_percentage}%, Glow plug: On")
-            state = "INITIAL_FUELING"
+            state_message(state, f"Fan: {config.fan_speed_percentage}%, Glow plug: On for {heat_up_time:.0f}s")
+            self.state = "INITIAL_FUELING"
 
         elif state == "INITIAL_FUELING":
-            # state_message(state, "Waiting for glow plug to heat up...")
-            if current_time >= glow_plug_heat_up_end_time:
+            if utime.ticks_diff(now, self.start_ticks) >= self.glow_plug_heat_up_ms:
                 config.pump_frequency = config.MIN_PUMP_FREQUENCY
                 state_message(state, f"Fuel Pump: {config.pump_frequency} Hz")
-                state = "RAMPING_UP"
-                last_time_checked = current_time
-                exhaust_temps = []
+                self.state = "RAMPING_UP"
+                self.last_sample_ticks = now
+                self.rise.reset()
+                self.step_readings = 0
 
         elif state == "RAMPING_UP":
-            if current_time - last_time_checked >= 1:
-                last_time_checked = current_time
-                exhaust_temps.append(config.exhaust_temp)
-
-                if len(exhaust_temps) >= 20:
-                    avg_exhaust_temp = sum(exhaust_temps) / len(exhaust_temps)
-                    state_message(state, f"Average Exhaust Temp at step {step}: {avg_exhaust_temp}C")
-
-                    if avg_exhaust_temp >= 100:
-                        state_message("COMPLETED", "Reached target exhaust temperature. Startup Procedure Completed.")
-                        config.startup_successful = True
-                        config.startup_attempts = 0
-                        config.GLOW_PIN.off()
-                        return
-
-                    elif initial_exhaust_temp + 5 < avg_exhaust_temp:
-                        config.fan_speed_percentage = min(config.fan_speed_percentage + 20, 100)
-                        helpers.set_fan_percentage(config.fan_speed_percentage)
-                        config.pump_frequency = min(config.pump_frequency + 1, config.MAX_PUMP_FREQUENCY)
-                        state_message(state,
-                                      f"Step {step} successful. Fan: {config.fan_speed_percentage}%, Fuel Pump: {config.pump_frequency} Hz")
-                        initial_exhaust_temp = avg_exhaust_temp
-                        step += 1
-
-                        if step > 5:
-                            state_message("COMPLETED", "Startup Procedure Completed")
-                            config.startup_successful = True
-                            config.startup_attempts = 0
-                            return
-
-                        exhaust_temps = []
-                    else:
-                        state_message(state, "Temperature not rising as expected. Changing state to STOPPING.")
-                        config.current_state = 'STOPPING'
-                        config.startup_attempts += 1
-                        return
+            # One exhaust reading per second, however often we get ticked
+            if utime.ticks_diff(now, self.last_sample_ticks) < 1000:
+                return IN_PROGRESS
+            self.last_sample_ticks = now
+            rise = self.rise
+            rise.push(exhaust_temp)
+            self.step_readings += 1
+            if not rise.is_full():
+                return IN_PROGRESS
+
+            avg_exhaust_temp = rise.mean()
+            if avg_exhaust_temp >= config.STARTUP_EXHAUST_TEMP:
+                state_message("COMPLETED", "Reached target exhaust temperature. Startup Procedure Completed.")
+                config.GLOW_PIN.off()
+                return self._finish(True)
+
+            # One reading per second, so the slope is in C/s
+            slope = rise.slope()
+            if slope >= config.RAMP_RISE_RATE and slope >= config.RAMP_RISE_T * rise.slope_error():
+                state_message(state, f"Exhaust rising {slope:.2f}C/s at step {self.step}, {avg_exhaust_temp:.1f}C")
+            elif self.step_readings < config.RAMP_SAMPLE_COUNT:
+                return IN_PROGRESS
+            elif self.initial_exhaust_temp + config.RAMP_MIN_TEMP_RISE < avg_exhaust_temp:
+                state_message(state, f"Exhaust rose slowly to {avg_exhaust_temp:.1f}C at step {self.step}")
+            else:
+                state_message(state, "Temperature not rising as expected. Changing state to STOPPING.")
+                return self._finish(False)
+
+            self._next_step(avg_exhaust_temp)
+            if self.step > config.RAMP_STEPS:
+                state_message("COMPLETED", "Startup Procedure Completed")
+                config.GLOW_PIN.off()
+                return self._finish(True)
+
+        return IN_PROGRESS
+
+
+sequence = StartupSequence()
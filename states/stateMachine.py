@@ -29,6 +29,7 @@
 
 import hardwareConfig as config
 from states import startup, shutdown, control
+from lib import autotune, eventLog
 
 
 def log(message, level=2):
@@ -36,9 +37,44 @@ def log(message, level=2):
         print(message)
 
 
+def stop(next_state):
+    # Shut down, then carry on in next_state once the heater has cooled down
+    startup.sequence.cancel()
+    autotune.temperature.cancel("heater stopped")
+    shutdown.sequence.begin(next_state)
+    return 'STOPPING'
+
+
+def command(current_state, name):
+    """
+    A "start" or "stop" from outside the state machine, e.g. over MQTT. Goes through the
+    same sequences as the state machine itself, so nothing half finished from before is
+    picked up again later. Returns the new state.
+    """
+    if name == 'stop':
+        config.startup_attempts = 0
+        if current_state in ('STARTING', 'RUNNING', 'STANDBY'):
+            return stop('OFF')
+        if current_state == 'STOPPING':
+            shutdown.sequence.next_state = 'OFF'
+    elif name == 'start':
+        config.startup_attempts = 0
+        if current_state == 'STOPPING':
+            # Purge and cool down first, like before another ignition attempt
+            shutdown.sequence.next_state = 'STARTING'
+        elif current_state in ('OFF', 'STANDBY', 'FAILURE'):
+            startup.sequence.begin()
+            return 'STARTING'
+    return current_state
+
+
 def handle_state(current_state, switch_value, exhaust_temp, output_temp):
     emergency_reason = None
 
+    # Latched by the interlock, which has already cut the fuel, emergencyStop takes it from here
+    if current_state == 'EMERGENCY_STOP':
+        return 'EMERGENCY_STOP', config.emergency_reason
+
     # When we are in OFF and the switch is OFF, we stay in OFF
     if current_state == 'OFF':
         if switch_value == 1:
@@ -47,35 +83,56 @@ def handle_state(current_state, switch_value, exhaust_temp, output_temp):
         else:
             return 'STARTING', None
 
-    # When starting is successful, we transition into RUNNING
+    # The startup sequence advances one step per call, when it succeeds we transition into RUNNING
     if current_state == 'STARTING':
-        startup.start_up()
-        if config.startup_successful:
+        if switch_value == 1:
             config.startup_attempts = 0
+            return stop('OFF'), None
+        if not startup.sequence.active:
+            startup.sequence.begin()
+        result = startup.sequence.tick(exhaust_temp)
+        if result == startup.DONE:
+            config.startup_attempts = 0
+            control.begin_running()
             return 'RUNNING', None
-        else:
+        elif result == startup.FAILED:
             config.startup_attempts += 1
+            eventLog.events.record(eventLog.STARTUP_FAILED, config.startup_attempts)
             if config.startup_attempts >= config.FAILURE_STATE_RETRIES:
-                shutdown.shut_down()
-                return 'FAILURE', None
-            return 'STARTING', None
+                return stop('FAILURE'), None
+            # Purge and cool down before the next attempt
+            return stop('STARTING'), None
+        return 'STARTING', None
 
     if current_state == 'RUNNING':
         if output_temp > config.TARGET_TEMP + 2:
-            shutdown.shut_down()
-            return 'STANDBY', None
+            return stop('STANDBY'), None
         elif switch_value == 1:
             config.startup_attempts = 0
-            shutdown.shut_down()
-            return 'OFF', None
+            return stop('OFF'), None
         else:
             flame_status = control.control_air_and_fuel(output_temp, exhaust_temp)
             if flame_status == "FLAME_OUT":
-                shutdown.shut_down()
                 config.startup_attempts += 1
-                return 'STARTING', None
+                eventLog.events.record(eventLog.FLAME_OUT, config.startup_attempts)
+                return stop('STARTING'), None
             return 'RUNNING', None
 
+    # The shutdown sequence advances one step per call, then we go where it was asked to go
+    if current_state == 'STOPPING':
+        if not shutdown.sequence.active:
+            # Nothing should get here without stop(), but never sit in STOPPING without a sequence
+            shutdown.sequence.begin('OFF')
+        if switch_value == 1 and shutdown.sequence.next_state != 'OFF':
+            config.startup_attempts = 0
+            shutdown.sequence.next_state = 'OFF'
+        result = shutdown.sequence.tick(exhaust_temp)
+        if result == shutdown.DONE:
+            return shutdown.sequence.next_state, None
+        elif result == shutdown.TIMEOUT:
+            return 'EMERGENCY_STOP', "Shutdown took too long"
+        return 'STOPPING', None
+
     # When in STANDBY and the temps drops 10C under the set state, we transition from STANDBY to STARTING, then RUNNING
     if current_state == 'STANDBY':
         if output_temp < config.TARGET_TEMP - 2 and switch_value == 0:
@@ -0,0 +1,390 @@
+# Micro-benchmarks for the firmware hot paths, on CPython or the MicroPython unix port.
+#
+# The firmware modules are imported as-is with the hardware modules (machine, utime,
+# network, usocket, uselect, umqtt.simple) replaced by the stand-ins in tools/sim/stubs. For every
+# benchmark the time per call and the heap allocated per call are measured and compared
+# against tools/bench_baseline.json, which keeps one set of numbers per Python
+# implementation.
+#
+# Times are kept relative to a reference loop of plain interpreter work, timed in turns
+# with every benchmark, so the baseline carries over to other machines and a machine that
+# is busy for a while slows both down alike. The absolute times are only printed.
+#
+# Heap per call is what the call allocates in total on MicroPython (gc.mem_alloc with the
+# collector off), and the peak it needs above what was already allocated on CPython
+# (tracemalloc), so only compare numbers from the same implementation.
+#
+# Usage: python tools/bench.py [--save] [--threshold 0.25] [--only name]
+#        micropython tools/bench.py ...
+import gc
+import json
+import os
+import sys
+import time
+
+IS_MICROPYTHON = sys.implementation.name == 'micropython'
+
+
+def _dirname(path):
+    # os.path isn't available on MicroPython
+    index = path.rfind('/')
+    return path[:index] if index > 0 else '.'
+
+
+TOOLS_DIR = _dirname(sys.argv[0] if IS_MICROPYTHON else os.path.abspath(__file__))
+ROOT = _dirname(TOOLS_DIR)
+SIM_DIR = TOOLS_DIR + '/sim'
+STUBS_DIR = SIM_DIR + '/stubs'
+BASELINE_FILE = TOOLS_DIR + '/bench_baseline.json'
+
+DEFAULT_THRESHOLD = 0.25  # Allowed slowdown or allocation growth before a benchmark fails
+ALLOC_SLACK = 16  # Bytes per call of noise allowed on top of the threshold
+ROUND_US = 20000  # Each timing round runs at least this long
+ROUNDS = 9  # Rounds of the benchmark and the reference loop in turns, the fastest of each counts
+REFERENCE_ITERATIONS = 100
+ALLOC_CALLS = 50
+SAVE_PASSES = 3  # A saved baseline is the median of this many passes, so one noisy pass doesn't set it
+RETRIES = 3  # Times a benchmark that looks slower is timed again, a busy machine passes, a real slowdown stays
+
+# Hardware modules the firmware imports, replaced by the simulator's stand-ins
+STUBBED_MODULES = ('machine', 'utime', 'network', 'usocket', 'uselect', 'umqtt', 'umqtt.simple')
+
+if IS_MICROPYTHON:
+    def now_us():
+        return time.ticks_us()
+
+    def elapsed_us(start):
+        return time.ticks_diff(time.ticks_us(), start)
+else:
+    def now_us():
+        return time.perf_counter_ns() // 1000
+
+    def elapsed_us(start):
+        return time.perf_counter_ns() // 1000 - start
+
+
+# ┌─────────────────────┐
+# │ Environment         │
+# └─────────────────────┘
+def install_stubs():
+    # Built-in modules win over sys.path on MicroPython, so load the stand-ins through
+    # the stubs package and register them under the names the firmware imports
+    for path in (STUBS_DIR, SIM_DIR, ROOT):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    for name in STUBBED_MODULES:
+        sys.modules[name] = __import__('stubs.' + name, None, None, ['_'])
+
+
+def make_work_dir():
+    # hardwareConfig and the web server read and write config.json in the current directory
+    try:
+        import tempfile
+        work_dir = tempfile.mkdtemp(prefix='heater-bench-')
+    except ImportError:
+        work_dir = '/tmp/heater-bench'
+        try:
+            os.mkdir(work_dir)
+        except OSError:
+            pass
+    with open(ROOT + '/config.json') as f:
+        settings = json.load(f)
+    # Before the firmware is imported, so nothing gets printed at import either. The log
+    # calls stay in, their messages just aren't printed, not even the level 0 ones.
+    settings['LoggingLevel']['LOG_LEVEL'] = -1
+    with open(work_dir + '/config.json', 'w') as f:
+        f.write(json.dumps(settings))
+    return work_dir
+
+
+def remove_work_dir(work_dir):
+    for name in os.listdir(work_dir):
+        os.remove(work_dir + '/' + name)
+    os.rmdir(work_dir)
+
+
+# ┌─────────────────────┐
+# │ Benchmarks          │
+# └─────────────────────┘
+class NullMQTTClient:
+    # Swallows what would go out, so only the payload building is measured
+    def publish(self, topic, msg, retain=False, qos=0):
+        pass
+
+
+def post_body(params):
+    fields = []
+    for section, settings in params.items():
+        for key, value in settings.items():
+            fields.append(section + '.' + key + '=' + str(value).replace(' ', '+'))
+    return '&'.join(fields)
+
+
+def benchmarks():
+    """
+    Return (name, function) pairs. Every function is called without arguments and runs
+    one call of the hot path it is named after.
+    """
+    import hardwareConfig as config
+    import usocket
+    import uselect
+    from lib import sensors, networking
+    from lib.pid import PIDController
+    from states import control, stateMachine
+    import webserver
+
+    target = config.TARGET_TEMP
+    output_code = 2048
+    exhaust_code = 1500
+    params = webserver.read_config_params()
+    body = post_body(params)
+    pid = PIDController(kp=config.FAN_KP, ki=config.FAN_KI, kd=config.FAN_KD)
+    networking.mqtt_client = NullMQTTClient()
+    # A session socket nothing arrives on, what poll_mqtt sees nearly all the time
+    idle_socket = usocket.socket()
+    idle_poller = uselect.poll()
+    idle_poller.register(idle_socket, uselect.POLLIN)
+
+    def read_output_temp():
+        sensors.read_temp(output_code, sensors.output_table, "output")
+
+    def read_exhaust_temp():
+        sensors.read_temp(exhaust_code, sensors.exhaust_table, "exhaust")
+
+    def control_air_and_fuel():
+        control.control_air_and_fuel(target - 4, 150.0)
+
+    def handle_state_running():
+        stateMachine.handle_state('RUNNING', 0, 150.0, target - 4)
+
+    def handle_state_standby():
+        stateMachine.handle_state('STANDBY', 0, 40.0, target)
+
+    def pid_calculate():
+        pid.calculate(3500, 3300, 0.2, 45.0)
+
+    def publish_sensor_values():
+        networking.publish_sensor_values()
+
+    def poll_mqtt_idle():
+        networking.poller = idle_poller
+        networking.poll_mqtt()
+
+    def generate_html_page():
+        webserver.generate_html_page(params)
+
+    def handle_post_data():
+        webserver.handle_post_data(body)
+
+    return [
+        ('sensors.read_temp output', read_output_temp),
+        ('sensors.read_temp exhaust', read_exhaust_temp),
+        ('control.control_air_and_fuel', control_air_and_fuel),
+        ('stateMachine.handle_state RUNNING', handle_state_running),
+        ('stateMachine.handle_state STANDBY', handle_state_standby),
+        ('pid.PIDController.calculate', pid_calculate),
+        ('networking.publish_sensor_values', publish_sensor_values),
+        ('networking.poll_mqtt idle', poll_mqtt_idle),
+        ('webserver.generate_html_page', generate_html_page),
+        ('webserver.handle_post_data', handle_post_data),
+    ]
+
+
+# ┌─────────────────────┐
+# │ Measuring           │
+# └─────────────────────┘
+def reference_loop():
+    # Plain interpreter work, nothing from the firmware: calls, small int arithmetic,
+    # attribute and list access
+    values = [0, 1, 2, 3]
+    total = 0
+    for i in range(REFERENCE_ITERATIONS):
+        total += values[i & 3] * 3 // 2
+        total = abs(total) % 1000
+    return total
+
+
+def calls_per_round(function):
+    # Find a call count that fills a round
+    calls = 1
+    while True:
+        start = now_us()
+        for _ in range(calls):
+            function()
+        took = elapsed_us(start)
+        if took >= ROUND_US:
+            return calls
+        calls *= 2 if took < ROUND_US // 4 else 1 + ROUND_US // max(took, 1)
+
+
+def time_round(function, calls):
+    start = now_us()
+    for _ in range(calls):
+        function()
+    return elapsed_us(start) / calls
+
+
+def time_per_call(function, reference_calls):
+    """
+    Return (us per call, us per call of the reference loop), the fastest of ROUNDS rounds
+    of each taken in turns.
+    """
+    calls = calls_per_round(function)
+    best = reference = None
+    for _ in range(ROUNDS):
+        took = time_round(reference_loop, reference_calls)
+        reference = took if reference is None else min(reference, took)
+        took = time_round(function, calls)
+        best = took if best is None else min(best, took)
+    return best, reference
+
+
+def bytes_per_call(function):
+    function()
+    gc.collect()
+    if IS_MICROPYTHON:
+        gc.disable()
+        before = gc.mem_alloc()
+        for _ in range(ALLOC_CALLS):
+            function()
+        allocated = gc.mem_alloc() - before
+        gc.enable()
+        return allocated / ALLOC_CALLS
+
+    import tracemalloc
+    tracemalloc.start()
+    total = 0
+    for _ in range(ALLOC_CALLS):
+        tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        function()
+        total += tracemalloc.get_traced_memory()[1] - before
+    tracemalloc.stop()
+    return total / ALLOC_CALLS
+
+
+# ┌─────────────────────┐
+# │ Baselines           │
+# └─────────────────────┘
+def load_baselines():
+    try:
+        with open(BASELINE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_baselines(baselines):
+    try:
+        text = json.dumps(baselines, indent=4, sort_keys=True)
+    except TypeError:
+        text = json.dumps(baselines)  # MicroPython's json has no pretty-printing
+    with open(BASELINE_FILE, 'w') as f:
+        f.write(text + '\n')
+
+
+def regressions(result, baseline, threshold):
+    found = []
+    if result['relative'] > baseline['relative'] * (1 + threshold):
+        found.append('time')
+    if result['bytes'] > baseline['bytes'] * (1 + threshold) + ALLOC_SLACK:
+        found.append('heap')
+    return found
+
+
+def parse_args(argv):
+    args = {'save': False, 'threshold': DEFAULT_THRESHOLD, 'only': None}
+    i = 0
+    while i < len(argv):
+        if argv[i] == '--save':
+            args['save'] = True
+        elif argv[i] == '--threshold':
+            i += 1
+            args['threshold'] = float(argv[i])
+        elif argv[i] == '--only':
+            i += 1
+            args['only'] = argv[i]
+        else:
+            raise SystemExit("Usage: bench.py [--save] [--threshold 0.25] [--only name]")
+        i += 1
+    return args
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+    implementation = sys.implementation.name
+    baselines = load_baselines()
+    baseline = baselines.get(implementation, {})
+    install_stubs()
+    cwd = os.getcwd()
+    work_dir = make_work_dir()
+    os.chdir(work_dir)
+    try:
+        reference_calls = calls_per_round(reference_loop)
+        passes = {}
+        selected = [(name, function) for name, function in benchmarks() if not args['only'] or args['only'] in name]
+        for _ in range(SAVE_PASSES if args['save'] else 1):
+            for name, function in selected:
+                us, reference = time_per_call(function, reference_calls)
+                passes.setdefault(name, []).append((us, us / reference, bytes_per_call(function)))
+        results = {}
+        for name, measured in passes.items():
+            middle = len(measured) // 2
+            results[name] = {'us': sorted(us for us, _, _ in measured)[middle],
+                             'relative': sorted(relative for _, relative, _ in measured)[middle],
+                             'bytes': sorted(allocated for _, _, allocated in measured)[middle]}
+        if not args['save']:
+            for name, function in selected:
+                base = baseline.get(name)
+                for _ in range(RETRIES):
+                    if not base or 'time' not in regressions(results[name], base, args['threshold']):
+                        break
+                    us, reference = time_per_call(function, reference_calls)
+                    if us / reference < results[name]['relative']:
+                        results[name]['us'], results[name]['relative'] = us, us / reference
+    finally:
+        os.chdir(cwd)
+        remove_work_dir(work_dir)
+
+    failed = False
+    print(f"{'benchmark':<36} {'us/call':>9} {'x ref':>8} {'base':>8} {'B/call':>8} {'base':>8}")
+    for name, result in results.items():
+        base = None if args['save'] else baseline.get(name)
+        status = ''
+        if base:
+            found = regressions(result, base, args['threshold'])
+            if found:
+                failed = True
+                status = 'SLOWER' if found == ['time'] else 'REGRESSED ' + '+'.join(found)
+        elif not args['save']:
+            failed = True
+            status = 'NO BASELINE'
+        base_relative = f"{base['relative']:.3f}" if base else '-'
+        base_bytes = f"{base['bytes']:.0f}" if base else '-'
+        print(f"{name:<36} {result['us']:>9.2f} {result['relative']:>8.3f} {base_relative:>8} "
+              f"{result['bytes']:>8.0f} {base_bytes:>8}  {status}")
+
+    if args['save']:
+        # Absolute times depend on the machine, only what is relative to the reference is kept.
+        # A full run replaces the baseline, so benchmarks that are gone don't linger in it.
+        saved = {name: {'relative': result['relative'], 'bytes': result['bytes']} for name, result in results.items()}
+        if args['only']:
+            baseline.update(saved)
+        else:
+            baseline = saved
+        baselines[implementation] = baseline
+        save_baselines(baselines)
+        print(f"Saved {implementation} baseline to {BASELINE_FILE}")
+    elif not baseline:
+        print(f"FAIL: no {implementation} baseline in {BASELINE_FILE}, run with --save to store one")
+        sys.exit(1)
+    elif failed:
+        print(f"FAIL: regressions beyond {args['threshold'] * 100:.0f}% of the {implementation} baseline, "
+              f"or benchmarks without one")
+        sys.exit(1)
+    else:
+        print("OK")
+
+
+if __name__ == "__main__":
+    main()
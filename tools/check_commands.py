@@ -0,0 +1,250 @@
+# Measure how long an MQTT command takes from the broker to the heater.
+#
+# The unmodified firmware runs in tools/sim/simulator.py with WiFi and MQTT on. Once the
+# heater is RUNNING the broker stand-in in tools/sim/stubs/umqtt/simple.py sends a new
+# target temperature to SET_TEMP_TOPIC, or "stop" to COMMAND_TOPIC. Every command is sent
+# at a few points between two polls of the MQTT socket and the slowest is listed: how long
+# until the firmware had handled the message, and for "stop" until the fuel pump stopped.
+# Handling has to come within one MQTT_POLL_RATE_HZ period and half a broker round trip,
+# the pump within one CONTROL_RATE_HZ period after that.
+#
+# For comparison the same is measured with the socket polled only at NETWORK_RATE_HZ, the
+# way messages used to be picked up.
+#
+# Then "stop" and "start" are sent in the middle of the startup and shutdown sequences. The
+# heater has to go through a full shutdown, then start over from the glow plug with the
+# switch still on, and never end up in FAILURE or EMERGENCY_STOP because of a sequence left
+# half finished by an earlier command.
+#
+# Usage: python tools/check_commands.py [--ambient 5] [--send-at 300]
+#                                       [--set Scheduler.MQTT_POLL_RATE_HZ=10]
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim'))
+
+from scenario import NETWORK_ON, parse_overrides, merged, switch_on, crashes  # noqa: E402
+from simulator import Simulation, load_config  # noqa: E402
+from lib.plant import HeaterPlant  # noqa: E402
+
+WATCH_PERIOD = 0.0005  # s, under the simulated cost of a time query
+SLACK = 0.02  # s on top of the bounds, for the simulated time queries
+PHASES = (0.0, 0.25, 0.5, 0.75)  # Where between two polls the command is sent, as a fraction of the period
+WATCH_TIME = 10  # s after sending
+NEW_TARGET = 21.5
+SEQUENCE_PERIOD = 0.1  # s between looks at the state machine, well under a CONTROL_RATE_HZ period
+RESTART_TIME = 1200  # s after the last command to be RUNNING again
+
+
+def set_target(sim):
+    sys.modules['umqtt.simple'].broker.publish(sim.config.SET_TEMP_TOPIC, str(NEW_TARGET))
+
+
+def send_stop(sim):
+    sys.modules['umqtt.simple'].broker.publish(sim.config.COMMAND_TOPIC, "stop")
+
+
+def target_set(sim):
+    return sim.config.TARGET_TEMP == NEW_TARGET
+
+
+def stopping(sim):
+    return sim.state == 'STOPPING'
+
+
+def pump_stopped(sim):
+    return not sys.modules['lib.fuelPump'].pump.running
+
+
+# (name, send, handled, actuated or None)
+COMMANDS = [
+    ('set temperature', set_target, target_set, None),
+    ('stop', send_stop, stopping, pump_stopped),
+]
+
+
+def run_command(send, handled, actuated, overrides, ambient, send_at):
+    """
+    Return ({'handled': s, 'actuated': s, 'latency': broker round trip}, problems).
+    """
+    sim = Simulation(overrides=merged(NETWORK_ON, overrides), plant=HeaterPlant(ambient=ambient))
+    result = {'handled': None, 'actuated': None, 'latency': 0.0}
+    problems = []
+
+    def watch(s):
+        elapsed = s.now() - send_at
+        if result['handled'] is None and handled(s):
+            result['handled'] = elapsed
+        if actuated is not None and result['actuated'] is None and actuated(s):
+            result['actuated'] = elapsed
+        if result['handled'] is not None and (actuated is None or result['actuated'] is not None):
+            s.stop()
+
+    def start(s):
+        if s.state != 'RUNNING':
+            problems.append(f"heater was {s.state} when the command was sent, not RUNNING")
+        if not sys.modules['lib.networking'].session_up:
+            problems.append("MQTT wasn't connected when the command was sent")
+        if handled(s) or (actuated is not None and actuated(s)):
+            problems.append("already done before the command was sent")
+        result['latency'] = sys.modules['umqtt.simple'].broker.latency
+        send(s)
+        s.every(WATCH_PERIOD, watch)
+
+    switch_on(sim)
+    sim.at(send_at, start)
+    sim.run(send_at + WATCH_TIME)
+    sim.cleanup()
+    if result['handled'] is None:
+        problems.append("never handled")
+    if actuated is not None and result['actuated'] is None:
+        problems.append("never actuated")
+    problems.extend(crashes(sim))
+    return result, problems
+
+
+def fueling(sim, since):
+    return sim.state == 'STARTING' and sys.modules['states.startup'].sequence.state == 'RAMPING_UP'
+
+
+def in_state(state, after=0.0):
+    def condition(sim, since):
+        return sim.state == state and since >= after
+    return condition
+
+
+def after(seconds):
+    def condition(sim, since):
+        return since >= seconds
+    return condition
+
+
+# (name, [(condition, command)]), each command sent once its condition holds, with the time
+# since the previous one
+SEQUENCES = [
+    ('stop while starting', [(fueling, 'stop')]),
+    ('start, then stop while stopping', [(in_state('RUNNING', 60), 'stop'), (in_state('STOPPING', 2), 'start'),
+                                         (after(30), 'stop')]),
+]
+
+
+def run_sequence(steps, overrides, ambient):
+    """
+    Send the commands, then watch the heater come back to RUNNING. Return (seconds after
+    the last command, problems).
+    """
+    sim = Simulation(overrides=merged(NETWORK_ON, overrides), plant=HeaterPlant(ambient=ambient))
+    progress = {'step': 0, 'sent_at': 0.0, 'restarted': False, 'running': None}
+    problems = []
+
+    def watch(s):
+        if progress['step'] < len(steps):
+            condition, command = steps[progress['step']]
+            if condition(s, s.now() - progress['sent_at']):
+                sys.modules['umqtt.simple'].broker.publish(s.config.COMMAND_TOPIC, command)
+                progress['step'] += 1
+                progress['sent_at'] = s.now()
+            return
+        if not progress['restarted'] and s.state == 'STARTING':
+            # Caught before the next control tick, a fresh start hasn't begun its sequence yet
+            progress['restarted'] = True
+            startup = sys.modules['states.startup'].sequence
+            if startup.active and startup.state != 'WARMING_GLOW_PLUG':
+                problems.append(f"the restart picked up a startup left at {startup.state}")
+            if s.config.startup_attempts:
+                problems.append(f"the restart counted as startup attempt {s.config.startup_attempts + 1}")
+        if progress['restarted'] and s.state == 'RUNNING':
+            progress['running'] = s.now() - progress['sent_at']
+            s.stop()
+
+    switch_on(sim)
+    sim.every(SEQUENCE_PERIOD, watch)
+    sim.run(RESTART_TIME * (len(steps) + 1))
+    sim.cleanup()
+
+    if progress['step'] < len(steps):
+        problems.append(f"only {progress['step']} of {len(steps)} commands sent, the heater was {sim.state}")
+    else:
+        after = [state for when, state in sim.timeline if when >= progress['sent_at']]
+        if 'OFF' not in after[:3]:
+            problems.append(f"went {' -> '.join(after[:3])} after the last command, not through OFF")
+        if progress['running'] is None:
+            problems.append(f"not RUNNING again, ended up {sim.state}")
+    problems.extend(f"went to {state}" for state in ('FAILURE', 'EMERGENCY_STOP')
+                    if state in [state for _, state in sim.timeline])
+    problems.extend(crashes(sim))
+    return progress['running'], problems
+
+
+def slowest(results, key):
+    values = [result[key] for result in results]
+    return None if None in values else max(values)
+
+
+def format_seconds(value):
+    return '-' if value is None else f"{value * 1000:.0f}ms"
+
+
+def measure(overrides, ambient, send_at, poll_rate):
+    """
+    Return [(name, slowest handled, slowest actuated, broker round trip, problems)].
+    """
+    period = 1 / poll_rate
+    rows = []
+    for name, send, handled, actuated in COMMANDS:
+        runs = [run_command(send, handled, actuated, overrides, ambient, send_at + phase * period)
+                for phase in PHASES]
+        problems = [problem for _, found in runs for problem in found]
+        results = [result for result, _ in runs]
+        rows.append((name, slowest(results, 'handled'), slowest(results, 'actuated') if actuated is not None else None,
+                     max(result['latency'] for result in results), problems))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure MQTT command latency against the simulated heater.")
+    parser.add_argument('--ambient', type=float, default=5.0, help='ambient temperature of the simulated heater')
+    parser.add_argument('--send-at', type=float, default=300, help='when to send the commands, once RUNNING')
+    parser.add_argument('--set', action='append', default=[], metavar='Section.KEY=value',
+                        help='override a config.json value')
+    args = parser.parse_args()
+    overrides = parse_overrides(args.set)
+    scheduler = load_config(overrides)['Scheduler']
+    failed = False
+
+    print(f"{'command':<16} {'polled at':>10} {'handled':>8} {'bound':>7} {'pump off':>9} {'bound':>7}")
+    for name, handled, actuated, latency, problems in measure(overrides, args.ambient, args.send_at,
+                                                              scheduler['MQTT_POLL_RATE_HZ']):
+        handle_bound = 1 / scheduler['MQTT_POLL_RATE_HZ'] + latency / 2 + SLACK
+        actuate_bound = handle_bound + 1 / scheduler['CONTROL_RATE_HZ']
+        if handled is not None and handled > handle_bound:
+            problems.append(f"handled after {handled:.3f}s, bound is {handle_bound:.3f}s")
+        if actuated is not None and actuated > actuate_bound:
+            problems.append(f"pump stopped after {actuated:.3f}s, bound is {actuate_bound:.3f}s")
+        pump = f"{format_seconds(actuated):>9} {format_seconds(actuate_bound):>7}" if name == 'stop' else ''
+        print(f"{name:<16} {scheduler['MQTT_POLL_RATE_HZ']:>8.1f}Hz {format_seconds(handled):>8} "
+              f"{format_seconds(handle_bound):>7} {pump}{'  FAILED: ' + '; '.join(problems) if problems else ''}")
+        failed |= bool(problems)
+
+    # The way it was: messages only picked up when the network task ran
+    before = merged(overrides)
+    before.setdefault('Scheduler', {})['MQTT_POLL_RATE_HZ'] = scheduler['NETWORK_RATE_HZ']
+    for name, handled, actuated, _, _ in measure(before, args.ambient, args.send_at, scheduler['NETWORK_RATE_HZ']):
+        pump = f"{format_seconds(actuated):>9}" if name == 'stop' else ''
+        print(f"{name:<16} {scheduler['NETWORK_RATE_HZ']:>8.1f}Hz {format_seconds(handled):>8} {'':>7} {pump}")
+
+    print()
+    print(f"{'commands':<32} {'running again':>13}")
+    for name, steps in SEQUENCES:
+        running, problems = run_sequence(steps, overrides, args.ambient)
+        print(f"{name:<32} {'-' if running is None else f'{running:.0f}s':>13}"
+              f"{'  FAILED: ' + '; '.join(problems) if problems else ''}")
+        failed |= bool(problems)
+
+    print("FAIL" if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
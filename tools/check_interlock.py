@@ -0,0 +1,235 @@
+# Check the over-temperature interlock in lib/interlock.py and the latched emergency stop
+# in states/emergencyStop.py against the simulated heater.
+#
+# The unmodified firmware runs in tools/sim/simulator.py. Once the heater is RUNNING a
+# fault is injected at the temperature ADCs: a thermistor stepping to 10C over its safety
+# limit, or stuck at an open or shorted thermistor. For every fault the fuel pump has to
+# stop, with the glow plug off and EMERGENCY_STOP latched, within one ADC_SAMPLE_PERIOD_MS
+# of the step, however the sensor filters and the scheduler rates are set up. Every fault is
+# injected at a few points between two ADC bursts and the slowest is listed, next to the
+# time the firmware measured from the ADC burst that showed it to the fuel cut. The
+# emergency stop then has to stay latched, without fuel, while the other tasks keep running,
+# and a reset over MQTT has to be refused until the sensor is fixed and
+# EMERGENCY_RESET_INTERVAL has passed. A normal heating cycle must not trip the interlock
+# at all.
+#
+# Usage: python tools/check_interlock.py [--ambient 5] [--fault-at 600]
+#                                        [--set SamplingSettings.ADC_SAMPLE_PERIOD_MS=50]
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim'))
+
+from scenario import parse_overrides, switch_on, normal_cycle, crashes  # noqa: E402
+from simulator import Simulation, load_config, FUEL_PIN, GLOW_PIN  # noqa: E402
+from lib.plant import HeaterPlant  # noqa: E402
+
+WATCH_PERIOD = 0.0005  # s, under the simulated cost of a time query, so the fuel cut is seen before the next task runs
+SLACK = 0.05  # s on top of the bound, for the simulated time queries
+LATCHED_TIME = 120  # s the emergency stop is watched after the trip
+PHASES = (0.01, 0.34, 0.67)  # Where between two ADC bursts the fault comes, as a fraction of the period
+
+
+def over_limit(sensor, limit):
+    def inject(sim):
+        sim.hold_sensor(sensor, getattr(sim.config, limit) + 10)
+    return inject
+
+
+def stuck_sensor(sensor, raw):
+    def inject(sim):
+        sim.fail_sensor(sensor, raw)
+    return inject
+
+
+# (name, fault injected at --fault-at, start of the reason it has to trip for)
+FAULTS = [
+    ('output over limit', over_limit('output', 'OUTPUT_SAFE_TEMP'), "Output over"),
+    ('exhaust over limit', over_limit('exhaust', 'EXHAUST_SAFE_TEMP'), "Exhaust over"),
+    ('output open', stuck_sensor('output', 4095), "Output sensor"),
+    ('output shorted', stuck_sensor('output', 0), "Output sensor"),
+    ('exhaust open', stuck_sensor('exhaust', 4095), "Exhaust sensor"),
+    ('exhaust shorted', stuck_sensor('exhaust', 0), "Exhaust sensor"),
+]
+
+
+def interlock():
+    return sys.modules['lib.interlock']
+
+
+def emergency_stop():
+    return sys.modules['states.emergencyStop']
+
+
+def scheduler():
+    return sys.modules['lib.scheduler'].tasks
+
+
+def run_fault(inject, expected, overrides, ambient, fault_at):
+    """
+    Return (result dict, problems). latency is from the fault to the fuel pump stopping.
+    """
+    sim = Simulation(overrides=overrides, plant=HeaterPlant(ambient=ambient))
+    result = {'state': None, 'latency': None, 'burst_to_cut_us': None, 'reason': None}
+    problems = []
+
+    def watch(s):
+        if result['latency'] is None:
+            if sys.modules['lib.fuelPump'].pump.running:
+                return
+            result['latency'] = s.now() - result['fault_at']
+            if s.machine.pins[FUEL_PIN].value():
+                problems.append("fuel pin still on")
+            if s.machine.pins[GLOW_PIN].value():
+                problems.append("glow plug still on")
+        # The interlock cuts the outputs first and books the trip after that
+        if result['reason'] is not None or interlock().reason is None:
+            return
+        result['reason'] = interlock().reason
+        result['burst_to_cut_us'] = interlock().burst_to_cut_us
+        result['state'] = s.state
+        result['pulses'] = s.machine.pins[FUEL_PIN].edges
+        result['monitor_runs'] = scheduler().runs[scheduler().names.index('monitor')]
+        if not result['reason'].startswith(expected):
+            problems.append(f"tripped for {result['reason']!r}, not '{expected}...'")
+
+    def fault(s):
+        result['running'] = s.state == 'RUNNING'
+        if interlock().reason is not None:
+            problems.append(f"tripped before the fault: {interlock().reason}")
+        result['fault_at'] = s.now()
+        inject(s)
+        s.every(WATCH_PERIOD, watch)
+
+    switch_on(sim)
+    sim.at(fault_at, fault)
+    sim.run(fault_at + LATCHED_TIME)
+    sim.cleanup()
+
+    config = sim.config
+    bound = config.ADC_SAMPLE_PERIOD_MS / 1000
+    result['bound'] = bound
+    if not result.get('running'):
+        problems.append("heater wasn't RUNNING when the fault came")
+    if result['latency'] is None:
+        problems.append("fuel never stopped")
+    elif result['reason'] is None:
+        problems.append("fuel stopped, but the interlock never tripped")
+    else:
+        if result['latency'] > bound + SLACK:
+            problems.append(f"fuel stopped after {result['latency']:.3f}s, bound is {bound:.3f}s")
+        if result['state'] != 'EMERGENCY_STOP':
+            problems.append(f"state is {result['state']}, not EMERGENCY_STOP")
+        problems.extend(check_latched(sim, result))
+    problems.extend(crashes(sim))
+    return result, problems
+
+
+def check_latched(sim, result):
+    """
+    Problems with the emergency stop LATCHED_TIME after the trip.
+    """
+    problems = []
+    # The clock is stopped, so the module's globals rather than status(), which reads it
+    emergency = emergency_stop()
+    if sim.state != 'EMERGENCY_STOP' or not emergency.latched:
+        problems.append(f"didn't stay latched, {sim.state} at the end")
+    if emergency.reason != result['reason']:
+        problems.append(f"emergency reason is {emergency.reason!r}")
+    pulses = sim.machine.pins[FUEL_PIN].edges - result['pulses']
+    if pulses:
+        problems.append(f"{pulses} fuel pulses after the trip")
+    if emergency.reasserts < LATCHED_TIME * 1000 // sim.config.EMERGENCY_REASSERT_PERIOD - 1:
+        problems.append(f"safe outputs re-asserted only {emergency.reasserts} times")
+    monitor_runs = scheduler().runs[scheduler().names.index('monitor')] - result['monitor_runs']
+    if monitor_runs < LATCHED_TIME * sim.config.MONITOR_RATE_HZ - 1:
+        problems.append(f"monitor task ran {monitor_runs} times while latched, the watchdog would fire")
+    return problems
+
+
+def run_reset(overrides, ambient, fault_at):
+    """
+    Trip on an open exhaust sensor, then reset over MQTT: too soon, with the sensor still
+    open, too soon after that attempt, and finally once it is fixed. Returns problems.
+    """
+    sim = Simulation(overrides=overrides, plant=HeaterPlant(ambient=ambient))
+    interval = sim.settings['EmergencyHandling']['EMERGENCY_RESET_INTERVAL'] / 1000
+    problems = []
+
+    def send_reset(expect_state):
+        def action(s):
+            networking = sys.modules['lib.networking']
+            networking.mqtt_callback(s.config.COMMAND_TOPIC.encode(), b"reset")
+            if s.state != expect_state:
+                problems.append(f"{s.now() - fault_at:.0f}s after the trip: {s.state}, expected {expect_state}")
+        return action
+
+    switch_on(sim)
+    sim.at(fault_at, lambda s: s.fail_sensor('exhaust', 4095))
+    sim.at(fault_at + 5, send_reset('EMERGENCY_STOP'))  # Too soon after the trip
+    sim.at(fault_at + interval + 5, send_reset('EMERGENCY_STOP'))  # Sensor still open
+    sim.at(fault_at + interval + 10, lambda s: s.fail_sensor('exhaust', None))
+    sim.at(fault_at + interval + 20, send_reset('EMERGENCY_STOP'))  # Too soon after the last attempt
+    sim.at(fault_at + 2 * interval + 10, send_reset('OFF'))
+    sim.run(fault_at + 2 * interval + 300)
+    sim.cleanup()
+
+    if emergency_stop().resets != 1:
+        problems.append(f"{emergency_stop().resets} resets, expected 1")
+    reset_at = fault_at + 2 * interval + 10
+    if not any(when > reset_at and state == 'RUNNING' for when, state in sim.timeline):
+        problems.append("heater didn't start again after the reset")
+    problems.extend(crashes(sim))
+    return problems
+
+
+def run_normal(overrides, ambient):
+    sim = normal_cycle(overrides, ambient)
+    problems = []
+    if interlock().reason is not None:
+        problems.append(f"tripped: {interlock().reason}")
+    states = [state for _, state in sim.timeline]
+    if 'RUNNING' not in states:
+        problems.append("never reached RUNNING")
+    problems.extend(crashes(sim))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the over-temperature interlock against the simulated heater.")
+    parser.add_argument('--ambient', type=float, default=5.0, help='ambient temperature of the simulated heater')
+    parser.add_argument('--fault-at', type=float, default=600, help='when to inject the faults, once RUNNING')
+    parser.add_argument('--set', action='append', default=[], metavar='Section.KEY=value',
+                        help='override a config.json value')
+    args = parser.parse_args()
+    overrides = parse_overrides(args.set)
+
+    period = load_config(overrides)['SamplingSettings']['ADC_SAMPLE_PERIOD_MS'] / 1000
+    failed = False
+    print(f"{'fault':<20} {'reason':<32} {'fuel off':>8} {'bound':>7} {'burst to cut':>13}")
+    for name, inject, expected in FAULTS:
+        runs = [run_fault(inject, expected, overrides, args.ambient, args.fault_at + phase * period)
+                for phase in PHASES]
+        result = max((result for result, _ in runs), key=lambda result: result['latency'] or float('inf'))
+        problems = [problem for _, found in runs for problem in found]
+        latency = '-' if result['latency'] is None else f"{result['latency']:.3f}s"
+        burst_to_cut = '-' if result['burst_to_cut_us'] is None else f"{result['burst_to_cut_us']}us"
+        print(f"{name:<20} {result['reason'] or '-':<32} {latency:>8} {result['bound']:>6.3f}s {burst_to_cut:>13}"
+              f"{'  FAILED: ' + '; '.join(problems) if problems else ''}")
+        failed |= bool(problems)
+
+    problems = run_reset(overrides, args.ambient, args.fault_at)
+    print(f"{'reset over MQTT':<20} {'refused, then OFF':<32}{'  FAILED: ' + '; '.join(problems) if problems else ''}")
+    failed |= bool(problems)
+
+    problems = run_normal(overrides, args.ambient)
+    print(f"{'normal cycle':<20} {'no trip':<32}{'  FAILED: ' + '; '.join(problems) if problems else ''}")
+    failed |= bool(problems)
+
+    print("FAIL" if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
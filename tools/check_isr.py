@@ -0,0 +1,333 @@
+# Check the firmware's interrupt handlers for anything that allocates.
+#
+# Handlers are the functions marked with @interrupts.handler, plus every function that is
+# registered as a timer callback or pin IRQ handler, also when it is handed to a helper that
+# registers it: then every call of the helper is followed, and a callback that can't be
+# followed fails the check. Each one is checked, together with everything it calls inside
+# the firmware, against MicroPython's allocation rules: no f-strings or string building,
+# no floats, no lists, dicts or tuples, no closures or bound methods made on the fly, no
+# new objects or exceptions. Calls into MicroPython itself (pins, timers, utime, arrays)
+# are assumed not to allocate.
+#
+# Usage: python tools/check_isr.py
+import ast
+import glob
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRMWARE_GLOBS = ('*.py', 'lib/*.py', 'states/*.py')
+
+ALLOCATING_BUILTINS = {
+    'print', 'str', 'repr', 'format', 'float', 'list', 'dict', 'set', 'tuple', 'bytes', 'bytearray',
+    'sorted', 'reversed', 'map', 'filter', 'zip', 'enumerate', 'open', 'iter', 'divmod', 'super',
+}
+ALLOCATING_METHODS = {
+    'append', 'extend', 'insert', 'join', 'format', 'split', 'strip', 'encode', 'decode', 'copy',
+    'items', 'keys', 'values', 'replace', 'lower', 'upper', 'startswith', 'endswith',
+}
+REGISTRATIONS = {'irq': 'handler', 'init': 'callback', 'Timer': 'callback'}
+
+
+class Module:
+    def __init__(self, path):
+        self.path = path
+        relative = os.path.relpath(path, ROOT)
+        self.name = relative[:-3].replace(os.sep, '.')
+        with open(path) as f:
+            self.tree = ast.parse(f.read(), relative)
+        self.relative = relative
+        self.functions = {}
+        self.classes = {}  # class name -> {method name: FunctionDef}
+        self.aliases = {}  # class name -> {attribute: method name}, from self.x = self.method
+        self.imports = {}  # local name -> module name
+
+        for node in self.tree.body:
+            if isinstance(node, ast.FunctionDef):
+                self.functions[node.name] = node
+            elif isinstance(node, ast.ClassDef):
+                methods = {item.name: item for item in node.body if isinstance(item, ast.FunctionDef)}
+                self.classes[node.name] = methods
+                self.aliases[node.name] = self._method_aliases(methods)
+            elif isinstance(node, ast.Import):
+                for alias in node.names:
+                    self.imports[alias.asname or alias.name] = alias.name
+            elif isinstance(node, ast.ImportFrom) and node.module:
+                for alias in node.names:
+                    self.imports[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+
+    @staticmethod
+    def _method_aliases(methods):
+        aliases = {}
+        for method in methods.values():
+            for node in ast.walk(method):
+                if (isinstance(node, ast.Assign) and len(node.targets) == 1 and
+                        _is_self_attribute(node.targets[0]) and _is_self_attribute(node.value) and
+                        node.value.attr in methods):
+                    aliases[node.targets[0].attr] = node.value.attr
+        return aliases
+
+
+def _is_self_attribute(node):
+    return isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == 'self'
+
+
+def _is_handler_decorator(node):
+    return ((isinstance(node, ast.Name) and node.id == 'handler') or
+            (isinstance(node, ast.Attribute) and node.attr == 'handler'))
+
+
+class Checker:
+    def __init__(self, modules):
+        self.modules = {module.name: module for module in modules}
+        self.problems = []  # (handler, location, message)
+        self.checked = set()
+
+    # ┌─────────────────────┐
+    # │ Name resolution     │
+    # └─────────────────────┘
+    def _instance_class(self, module, name):
+        # Module level "name = SomeClass(...)", with SomeClass local or from another firmware module
+        for node in module.tree.body:
+            if (isinstance(node, ast.Assign) and len(node.targets) == 1 and
+                    isinstance(node.targets[0], ast.Name) and node.targets[0].id == name and
+                    isinstance(node.value, ast.Call)):
+                target = self.resolve(node.value.func, module, None)
+                if target and target[0] == 'class':
+                    return target[1], target[2]
+        return None
+
+    def resolve(self, node, module, class_name):
+        """
+        Work out what an expression refers to: ('module', module), ('class', module,
+        name), ('instance', module, class name), ('method', module, class name, def)
+        or ('function', module, def). None when it's outside the firmware.
+        """
+        if isinstance(node, ast.Name):
+            if node.id == 'self' and class_name:
+                return 'instance', module, class_name
+            if node.id in module.functions:
+                return 'function', module, module.functions[node.id]
+            if node.id in module.classes:
+                return 'class', module, node.id
+            if node.id in module.imports:
+                imported = module.imports[node.id]
+                if imported in self.modules:
+                    return 'module', self.modules[imported]
+                return None
+            instance = self._instance_class(module, node.id)
+            if instance:
+                return ('instance',) + instance
+            return None
+
+        if isinstance(node, ast.Attribute):
+            owner = self.resolve(node.value, module, class_name)
+            if owner is None:
+                return None
+            if owner[0] == 'module':
+                return self.resolve(ast.Name(id=node.attr), owner[1], None)
+            if owner[0] == 'instance':
+                owner_module, owner_class = owner[1], owner[2]
+                methods = owner_module.classes[owner_class]
+                name = owner_module.aliases[owner_class].get(node.attr, node.attr)
+                if name in methods:
+                    return 'method', owner_module, owner_class, methods[name]
+        return None
+
+    # ┌─────────────────────┐
+    # │ Checking            │
+    # └─────────────────────┘
+    def check_function(self, handler, module, class_name, function, chain=()):
+        key = (module.name, class_name, function.name)
+        if key in self.checked:
+            return
+        self.checked.add(key)
+        chain = chain + (function.name,)
+        for node in self._walk_body(function):
+            self._check_node(handler, module, class_name, node, chain)
+
+    @staticmethod
+    def _walk_body(function):
+        # Every node in the function, without descending into nested functions
+        stack = list(function.body)
+        while stack:
+            node = stack.pop()
+            yield node
+            if isinstance(node, (ast.FunctionDef, ast.Lambda)):
+                continue
+            stack.extend(ast.iter_child_nodes(node))
+
+    def _report(self, handler, module, node, chain, message):
+        location = f"{module.relative}:{node.lineno}"
+        via = ' -> '.join(chain)
+        self.problems.append((handler, location, f"{message} (in {via})"))
+
+    def _check_node(self, handler, module, class_name, node, chain):
+        report = lambda message: self._report(handler, module, node, chain, message)  # noqa: E731
+
+        if isinstance(node, ast.JoinedStr):
+            report("builds an f-string")
+        elif isinstance(node, ast.Constant) and isinstance(node.value, float):
+            report(f"uses the float {node.value}")
+        elif isinstance(node, (ast.BinOp, ast.AugAssign)):
+            if isinstance(node.op, ast.Div):
+                report("divides with '/', which makes a float")
+            elif isinstance(node.op, (ast.Add, ast.Mod)):
+                operands = [node.left, node.right] if isinstance(node, ast.BinOp) else [node.value]
+                if any(isinstance(o, ast.Constant) and isinstance(o.value, (str, bytes)) for o in operands):
+                    report("builds a string")
+        elif isinstance(node, (ast.List, ast.Dict, ast.Set)):
+            report(f"builds a {type(node).__name__.lower()}")
+        elif isinstance(node, (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+            report("uses a comprehension")
+        elif isinstance(node, ast.Tuple) and isinstance(node.ctx, ast.Load):
+            if not all(isinstance(element, ast.Constant) for element in node.elts):
+                report("builds a tuple")
+        elif isinstance(node, (ast.Lambda, ast.FunctionDef)):
+            report("creates a closure")
+        elif isinstance(node, ast.Starred) or (isinstance(node, ast.keyword) and node.arg is None):
+            report("unpacks arguments")
+        elif isinstance(node, ast.Raise) and isinstance(node.exc, ast.Call):
+            report("raises a new exception")
+        elif isinstance(node, ast.Call):
+            self._check_call(handler, module, class_name, node, chain, report)
+        elif isinstance(node, ast.Attribute) and isinstance(node.ctx, ast.Load):
+            # Reading an attribute bound once in __init__ is fine, naming the method itself isn't
+            target = self.resolve(node, module, class_name)
+            if (target and target[0] == 'method' and target[3].name == node.attr and
+                    not getattr(node, '_call_target', False)):
+                report(f"creates a bound method for {node.attr}, bind it once in __init__")
+
+    def _check_call(self, handler, module, class_name, node, chain, report):
+        func = node.func
+        func._call_target = True
+        if isinstance(func, ast.Name) and func.id in ALLOCATING_BUILTINS and func.id not in module.functions:
+            report(f"calls {func.id}()")
+            return
+        if isinstance(func, ast.Attribute) and func.attr in ALLOCATING_METHODS:
+            report(f"calls .{func.attr}()")
+            return
+        target = self.resolve(func, module, class_name)
+        if target is None:
+            return
+        if target[0] == 'class':
+            report(f"creates a {target[2]} object")
+        elif target[0] == 'function':
+            self.check_function(handler, target[1], None, target[2], chain)
+        elif target[0] == 'method':
+            self.check_function(handler, target[1], target[2], target[3], chain)
+
+    # ┌─────────────────────┐
+    # │ Finding handlers    │
+    # └─────────────────────┘
+    @staticmethod
+    def _scopes(module):
+        # (class name, node) for everything in the module that can make a call
+        scopes = [(None, node) for node in module.tree.body if not isinstance(node, ast.ClassDef)]
+        for class_name in module.classes:
+            scopes += [(class_name, method) for method in module.classes[class_name].values()]
+        return scopes
+
+    def callers(self, function):
+        # (module, class name, call) for every call of function inside the firmware
+        for module in self.modules.values():
+            for class_name, scope in self._scopes(module):
+                for node in ast.walk(scope):
+                    if isinstance(node, ast.Call):
+                        target = self.resolve(node.func, module, class_name)
+                        if target and target[0] in ('function', 'method') and target[-1] is function:
+                            yield module, class_name, node
+
+    def callbacks(self, module, class_name, scope, callback, seen=()):
+        """
+        Everything a registered callback expression can stand for: [(target, expression,
+        module, class name)], with target None where it can't be followed. A parameter of
+        the registering function is followed to the arguments of every call of it.
+        """
+        parameters = [arg.arg for arg in scope.args.args] if isinstance(scope, ast.FunctionDef) else []
+        if not (isinstance(callback, ast.Name) and callback.id in parameters):
+            target = self.resolve(callback, module, class_name)
+            if target is None or target[0] not in ('function', 'method'):
+                target = None
+            return [(target, callback, module, class_name)]
+        if scope in seen:
+            return [(None, callback, module, class_name)]
+
+        found = []
+        index = parameters.index(callback.id) - (1 if class_name else 0)  # self isn't passed
+        for caller_module, caller_class, call in self.callers(scope):
+            argument = next((kw.value for kw in call.keywords if kw.arg == callback.id), None)
+            if argument is None and 0 <= index < len(call.args):
+                argument = call.args[index]
+            if argument is None:
+                found.append((None, call, caller_module, caller_class))
+                continue
+            caller_scope = next(node for name, node in self._scopes(caller_module)
+                                if name == caller_class and any(n is call for n in ast.walk(node)))
+            found += self.callbacks(caller_module, caller_class, caller_scope, argument, seen + (scope,))
+        return found or [(None, callback, module, class_name)]
+
+    def marked_handlers(self):
+        for module in self.modules.values():
+            for function in module.functions.values():
+                if any(_is_handler_decorator(d) for d in function.decorator_list):
+                    yield module, None, function
+            for class_name, methods in module.classes.items():
+                for method in methods.values():
+                    if any(_is_handler_decorator(d) for d in method.decorator_list):
+                        yield module, class_name, method
+
+    def registrations(self):
+        # (module, class, scope, registering call, callback expression) for every IRQ and timer callback
+        for module in self.modules.values():
+            for class_name, scope in self._scopes(module):
+                for node in ast.walk(scope):
+                    if not isinstance(node, ast.Call):
+                        continue
+                    name = node.func.attr if isinstance(node.func, ast.Attribute) else getattr(node.func, 'id', None)
+                    keyword = REGISTRATIONS.get(name)
+                    for kw in node.keywords:
+                        if kw.arg == keyword:
+                            yield module, class_name, scope, node, kw.value
+
+    def run(self):
+        for module, class_name, function in self.marked_handlers():
+            handler = f"{module.name}.{class_name + '.' if class_name else ''}{function.name}"
+            self.check_function(handler, module, class_name, function)
+
+        for module, class_name, scope, call, callback in self.registrations():
+            location = f"{module.relative}:{call.lineno}"
+            for target, expression, source, _ in self.callbacks(module, class_name, scope, callback):
+                if target is None:
+                    self.problems.append((ast.unparse(callback), f"{source.relative}:{expression.lineno}",
+                                          f"can't follow the callback '{ast.unparse(expression)}' registered "
+                                          f"at {location}, mark what it stands for or pass it directly"))
+                    continue
+                function = target[-1]
+                if not any(_is_handler_decorator(d) for d in function.decorator_list):
+                    self.problems.append((function.name, location,
+                                          f"registers '{ast.unparse(expression)}', which isn't marked "
+                                          f"@interrupts.handler"))
+                    self.check_function(function.name, target[1], target[2] if target[0] == 'method' else None,
+                                        function)
+
+
+def main():
+    paths = []
+    for pattern in FIRMWARE_GLOBS:
+        paths += sorted(glob.glob(os.path.join(ROOT, pattern)))
+    checker = Checker([Module(path) for path in paths])
+    checker.run()
+
+    handlers = sorted({'.'.join(filter(None, (m.name, c, f.name))) for m, c, f in checker.marked_handlers()})
+    print(f"Checked {len(handlers)} handlers and {len(checker.checked)} functions they reach")
+    if checker.problems:
+        for handler, location, message in checker.problems:
+            print(f"{location}: {handler}: {message}")
+        print(f"FAIL: {len(checker.problems)} problem(s) in interrupt context")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# Check that the fuel limit holds when it is lowered at runtime.
+#
+# The unmodified firmware runs in tools/sim/simulator.py in the cold, where the temperature
+# loop asks for all the fuel it can get. Once the heater is RUNNING, MAX_PUMP_FREQUENCY is
+# lowered through the handler for the MQTT set/max_pump_frequency topic. The control loop
+# has to ask for no more than the new limit within one CONTROL_RATE_HZ period, the pump has
+# to be down to it once PUMP_RAMP_RATE allows, and neither may go over it again while the
+# heater keeps running. Then the limit is put back, and the pump has to pick up again just
+# as quickly rather than wait for an integral that wound up behind the limit.
+#
+# Usage: python tools/check_limits.py [--ambient -10] [--limit-at 600] [--limit 2]
+#                                     [--set TemperatureControl.CONTROL_MODE=proportional]
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim'))
+
+from scenario import parse_overrides, merged, switch_on, crashes  # noqa: E402
+from simulator import Simulation  # noqa: E402
+from lib.plant import HeaterPlant  # noqa: E402
+
+WATCH_PERIOD = 0.1  # s, well under a CONTROL_RATE_HZ period
+HOLD = 600  # s the lowered limit is kept
+SLACK = 0.5  # s on top of the bounds, for the simulated time queries
+
+
+def set_max_pump_frequency(value):
+    # What a message to set/max_pump_frequency does once it has arrived
+    def action(sim):
+        sys.modules['lib.networking'].mqtt_callback(b'set/max_pump_frequency', str(value).encode())
+    return action
+
+
+def pump():
+    return sys.modules['lib.fuelPump'].pump
+
+
+def run_limit(overrides, ambient, limit_at, limit):
+    """
+    Return (result dict, problems).
+    """
+    sim = Simulation(overrides=overrides, plant=HeaterPlant(ambient=ambient))
+    original = sim.settings['FuelPumpControl']['MAX_PUMP_FREQUENCY']
+    control_period = 1 / sim.settings['Scheduler']['CONTROL_RATE_HZ']
+    ramp_rate = sim.settings['FuelPumpControl']['PUMP_RAMP_RATE']
+    restore_at = limit_at + HOLD
+    result = {'before': None, 'peak': 0.0, 'commanded': None, 'capped': None, 'recovered': None}
+    problems = []
+
+    def lower(s):
+        if s.state != 'RUNNING':
+            problems.append(f"heater was {s.state} when the limit was lowered, not RUNNING")
+        result['before'] = pump().frequency()
+        if result['before'] <= limit:
+            problems.append(f"the pump was only at {result['before']:.2f}Hz, lower --limit or --ambient")
+        set_max_pump_frequency(limit)(s)
+
+    def watch(s):
+        since = s.now() - limit_at
+        if s.now() < restore_at:
+            if result['commanded'] is None and s.config.pump_frequency <= limit:
+                result['commanded'] = since
+            if result['capped'] is None and pump().frequency() <= limit:
+                result['capped'] = since
+            if result['capped'] is not None and s.state == 'RUNNING':
+                result['peak'] = max(result['peak'], pump().frequency())
+        elif result['recovered'] is None and pump().frequency() > limit:
+            result['recovered'] = s.now() - restore_at
+            s.stop()
+
+    switch_on(sim)
+    sim.at(limit_at, lower)
+    sim.at(limit_at, lambda s: s.every(WATCH_PERIOD, watch))
+    sim.at(restore_at, set_max_pump_frequency(original))
+    sim.run(restore_at + HOLD)
+    sim.cleanup()
+
+    if result['before'] is not None and result['before'] > limit:
+        ramp_bound = control_period + (result['before'] - limit) / ramp_rate + SLACK
+        result['bounds'] = (control_period + SLACK, ramp_bound)
+        if result['commanded'] is None or result['commanded'] > control_period + SLACK:
+            problems.append(f"the control loop still asked for more than {limit}Hz after one control period")
+        if result['capped'] is None or result['capped'] > ramp_bound:
+            problems.append(f"the pump wasn't down to {limit}Hz within {ramp_bound:.1f}s")
+        if result['peak'] > limit:
+            problems.append(f"the pump went back up to {result['peak']:.2f}Hz under the {limit}Hz limit")
+        if result['recovered'] is None or result['recovered'] > control_period + SLACK:
+            problems.append("the pump didn't pick up within one control period once the limit was put back")
+    states = [state for when, state in sim.timeline if limit_at <= when <= restore_at]
+    if states:
+        problems.append(f"left RUNNING under the limit: {' -> '.join(states)}")
+    problems.extend(crashes(sim))
+    return result, problems
+
+
+def format_seconds(value):
+    return '-' if value is None else f"{value:.1f}s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that a lowered MAX_PUMP_FREQUENCY caps the fuel.")
+    parser.add_argument('--ambient', type=float, default=-10.0, help='ambient temperature of the simulated heater')
+    parser.add_argument('--limit-at', type=float, default=600, help='when to lower the limit, once RUNNING')
+    parser.add_argument('--limit', type=float, default=2.0, help='the lowered MAX_PUMP_FREQUENCY in Hertz')
+    parser.add_argument('--set', action='append', default=[], metavar='Section.KEY=value',
+                        help='override a config.json value')
+    args = parser.parse_args()
+    overrides = parse_overrides(args.set)
+    failed = False
+
+    print(f"{'mode':<13} {'before':>7} {'asked':>6} {'bound':>6} {'pump':>6} {'bound':>6} {'peak':>6} "
+          f"{'back up':>8}")
+    # A mode given with --set is the only one run
+    modes = [overrides['TemperatureControl']['CONTROL_MODE']] \
+        if 'CONTROL_MODE' in overrides.get('TemperatureControl', {}) else ['modulating', 'proportional']
+    for mode in modes:
+        mode_overrides = merged(overrides, {'TemperatureControl': {'CONTROL_MODE': mode}})
+        result, problems = run_limit(mode_overrides, args.ambient, args.limit_at, args.limit)
+        commanded_bound, ramp_bound = result.get('bounds', (None, None))
+        before = '-' if result['before'] is None else f"{result['before']:.2f}"
+        print(f"{mode:<13} {before:>7} {format_seconds(result['commanded']):>6} "
+              f"{format_seconds(commanded_bound):>6} {format_seconds(result['capped']):>6} "
+              f"{format_seconds(ramp_bound):>6} {result['peak']:>6.2f} {format_seconds(result['recovered']):>8}"
+              f"{'  FAILED: ' + '; '.join(problems) if problems else ''}")
+        failed |= bool(problems)
+
+    print("FAIL" if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+# Check that the watchdog is gated by the liveness registry in lib/liveness.py.
+#
+# The unmodified firmware runs in tools/sim/simulator.py. First a normal heating cycle, where
+# the watchdog must never run out, and the longest gap between check-ins of every task is
+# listed against its deadline. Then, once the heater is RUNNING, one task at a time is made
+# to fail on every run. A critical task has to stop the watchdog feed, so the watchdog runs
+# out within the task's deadline, one monitor period and the watchdog timeout. A task that
+# isn't in LIVENESS_CRITICAL has to be reported as stalled while the watchdog keeps being fed.
+#
+# Usage: python tools/check_liveness.py [--ambient 5] [--fault-at 300]
+#                                       [--set Scheduler.LIVENESS_CRITICAL=sensors,control]
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim'))
+
+from scenario import parse_overrides, merged, switch_on, normal_cycle, crashes  # noqa: E402
+from simulator import Simulation, load_config  # noqa: E402
+from lib.plant import HeaterPlant  # noqa: E402
+
+WATCHDOG_TIMEOUT = 10.0  # s, main.wdt
+RUN_AFTER_FAULT = 60  # s
+SLACK = 1.0  # s, the simulator looks at the watchdog once a second
+
+
+def injected(*_):
+    raise RuntimeError("injected fault")
+
+
+def break_sensors(sim):
+    sys.modules['lib.sensors'].read_output_temp = injected
+
+
+def break_control(sim):
+    sys.modules['states.stateMachine'].handle_state = injected
+
+
+def break_network(sim):
+    networking = sys.modules['lib.networking']
+    networking.init_wifi = injected
+    networking.wifi_initialized = False
+    sim.config.USE_WIFI = True
+
+
+def break_fan(sim):
+    sys.modules['lib.fanPID'].read_rpm = injected
+
+
+# (task, how to break it, extra config.json values it needs)
+FAULTS = [
+    ('sensors', break_sensors, {}),
+    ('control', break_control, {}),
+    ('network', break_network, {}),
+    ('fan', break_fan, {'FanControl': {'FAN_RPM_SENSOR': True}}),
+]
+
+
+def liveness():
+    return sys.modules['lib.liveness'].registry
+
+
+def run_fault(task, inject, overrides, ambient, fault_at):
+    """
+    Return (seconds from the fault to the watchdog running out or None, problems).
+    """
+    settings = load_config(overrides)
+    critical = [name.strip() for name in settings['Scheduler']['LIVENESS_CRITICAL'].split(',')]
+    sim = Simulation(overrides=overrides, plant=HeaterPlant(ambient=ambient))
+    problems = []
+
+    def fault(s):
+        if s.state != 'RUNNING':
+            problems.append(f"heater was {s.state} when the fault came, not RUNNING")
+        inject(s)
+
+    switch_on(sim)
+    sim.at(fault_at, fault)
+    sim.run(fault_at + RUN_AFTER_FAULT)
+    sim.cleanup()
+
+    registry = liveness()
+    index = registry.names.index(task)
+    deadline = registry.deadlines_ms[index] / 1000
+    expired = None if sim.watchdog_expired_at is None else sim.watchdog_expired_at - fault_at
+    if task in critical:
+        bound = deadline + 1 / settings['Scheduler']['MONITOR_RATE_HZ'] + WATCHDOG_TIMEOUT + SLACK
+        if expired is None:
+            problems.append("the watchdog was still fed")
+        elif expired > bound:
+            problems.append(f"the watchdog ran out after {expired:.1f}s, bound is {bound:.1f}s")
+    else:
+        if expired is not None:
+            problems.append(f"the watchdog ran out after {expired:.1f}s for a task that isn't critical")
+        if not registry.misses[index]:
+            problems.append("the stall wasn't noticed")
+    problems.extend(crashes(sim, watchdog=False))
+    return expired, deadline, task in critical, problems
+
+
+def run_normal(overrides, ambient):
+    sim = normal_cycle(overrides, ambient)
+    problems = crashes(sim)
+    registry = liveness()
+    for index, name in enumerate(registry.names):
+        if registry.misses[index]:
+            problems.append(f"{name} missed its deadline {registry.misses[index]} time(s)")
+    gaps = [(name, registry.worst_ms[index], registry.deadlines_ms[index]) for index, name in enumerate(registry.names)]
+    return gaps, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that the watchdog is gated by the task liveness registry.")
+    parser.add_argument('--ambient', type=float, default=5.0, help='ambient temperature of the simulated heater')
+    parser.add_argument('--fault-at', type=float, default=300, help='when to break a task, once RUNNING')
+    parser.add_argument('--set', action='append', default=[], metavar='Section.KEY=value',
+                        help='override a config.json value')
+    args = parser.parse_args()
+    overrides = parse_overrides(args.set)
+    failed = False
+
+    gaps, problems = run_normal(overrides, args.ambient)
+    print(f"Normal cycle{'  FAILED: ' + '; '.join(problems) if problems else ''}")
+    print(f"{'task':<10} {'worst gap':>10} {'deadline':>10}")
+    for name, worst, deadline in gaps:
+        print(f"{name:<10} {worst:>8}ms {deadline:>8}ms")
+    failed |= bool(problems)
+
+    print(f"{'broken':<10} {'critical':>8} {'deadline':>9} {'watchdog out':>13}")
+    for task, inject, extra in FAULTS:
+        expired, deadline, critical, problems = run_fault(task, inject, merged(overrides, extra), args.ambient,
+                                                          args.fault_at)
+        out = '-' if expired is None else f"{expired:.1f}s"
+        print(f"{task:<10} {'yes' if critical else 'no':>8} {deadline:>8.1f}s {out:>13}"
+              f"{'  FAILED: ' + '; '.join(problems) if problems else ''}")
+        failed |= bool(problems)
+
+    print("FAIL" if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# Check the WiFi and MQTT connection handling in lib/networking.py against outages.
+#
+# The unmodified firmware runs in tools/sim/simulator.py with WiFi and MQTT on, talking to
+# the broker stand-in in tools/sim/stubs/umqtt/simple.py. Once the heater is RUNNING the
+# broker, and in a second run the access point, goes away for a while and comes back.
+# While it is down the connection attempts have to back off, the network task must not
+# hold up the others, and no task may miss its liveness deadline. Once it is back the
+# session has to be up again within one RECONNECT_MAX_DELAY and a few network periods,
+# subscribed once, and a new target temperature sent to SET_TEMP_TOPIC has to arrive.
+#
+# Both outages are then repeated with MQTT_SERVER given as a name, on a DNS server that
+# takes DNS_LATENCY to answer. The name may only be looked up once per WiFi connection,
+# not on every attempt to reach the broker, and never with an IP address.
+#
+# Usage: python tools/check_network.py [--ambient 5] [--outage-at 300] [--outage 1200]
+#                                      [--set NetworkSettings.RECONNECT_MAX_DELAY=60000]
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim'))
+
+from scenario import NETWORK_ON, parse_overrides, merged, switch_on, crashes  # noqa: E402
+from simulator import Simulation  # noqa: E402
+from lib.plant import HeaterPlant  # noqa: E402
+
+WIFI_CONNECT_TIMEOUT = 30  # s, lib/networking.py
+MAX_BLOCK_MS = 50  # Longest the network task may run for while the broker or access point is down
+AFTER_OUTAGE = 900  # s the heater keeps running after the outage
+NEW_TARGET = 21.5
+DNS_LATENCY = 2.0  # s the slow DNS server takes to answer
+BROKER_NAME = 'broker.lan'
+
+
+def broker():
+    return sys.modules['umqtt.simple'].broker
+
+
+def set_broker(available):
+    def action(sim):
+        broker().available = available
+    return action
+
+
+def set_access_point(available):
+    def action(sim):
+        sys.modules['network'].network_available = available
+    return action
+
+
+def most_attempts(outage, attempt_time, settings):
+    """
+    Attempts the backoff allows at most while an outage lasts, each taking attempt_time
+    and followed by at least half of the delay.
+    """
+    delay = 0
+    elapsed = 0.0
+    attempts = 0
+    while elapsed <= outage:
+        attempts += 1
+        delay = min(max(delay * 2, settings['RECONNECT_MIN_DELAY']), settings['RECONNECT_MAX_DELAY'])
+        elapsed += attempt_time + delay / 2000
+    return attempts + 1  # The one that may be under way when the outage starts
+
+
+def slow_dns(sim):
+    import usocket  # The stand-in, before the firmware has imported it
+    usocket.resolver.latency = DNS_LATENCY
+
+
+def run_outage(name, overrides, ambient, outage_at, outage, dns=False):
+    """
+    Return (result dict, problems). With dns the broker is reached by name, through a
+    slow DNS server.
+    """
+    server = {'NetworkSettings': {'MQTT_SERVER': BROKER_NAME}} if dns else {}
+    sim = Simulation(overrides=merged(NETWORK_ON, server, overrides), plant=HeaterPlant(ambient=ambient))
+    settings = sim.settings['NetworkSettings']
+    network_period = 1 / sim.settings['Scheduler']['NETWORK_RATE_HZ']
+    result = {'name': name}
+    problems = []
+    counters = {}
+    down, up = (set_broker(False), set_broker(True)) if name == 'broker' else \
+        (set_access_point(False), set_access_point(True))
+
+    def networking():
+        return sys.modules['lib.networking']
+
+    def scheduler():
+        return sys.modules['lib.scheduler'].tasks
+
+    def start(s):
+        if s.state != 'RUNNING':
+            problems.append(f"heater was {s.state} when the outage came, not RUNNING")
+        if not networking().session_up:
+            problems.append("MQTT wasn't connected when the outage came")
+        counters['before'] = networking().status()
+        scheduler().reset_stats()
+        down(s)
+
+    def end(s):
+        counters['during'] = networking().status()
+        tasks = scheduler()
+        result['network_ms'] = tasks.max_exec_us[tasks.names.index('network')] / 1000
+        result['control_jitter_ms'] = tasks.max_jitter_us[tasks.names.index('control')] / 1000
+        up(s)
+
+    def reconnected(s):
+        if 'reconnected' not in result and networking().session_up:
+            result['reconnected'] = s.now() - (outage_at + outage)
+            broker().publish(s.config.SET_TEMP_TOPIC, str(NEW_TARGET))
+
+    switch_on(sim)
+    if dns:
+        sim.at(0, slow_dns)
+    sim.at(outage_at, start)
+    sim.at(outage_at + outage, end)
+    sim.at(outage_at + outage, lambda s: s.every(1.0, reconnected))
+    sim.run(outage_at + outage + AFTER_OUTAGE)
+    sim.cleanup()
+
+    if 'before' not in counters or 'during' not in counters:
+        problems.append("the simulation ended early")
+        return result, problems
+    before, during = counters['before'], counters['during']
+    key, attempt_time = ('mqtt_attempts', settings['MQTT_CONNECT_TIMEOUT']) if name == 'broker' else \
+        ('wifi_attempts', WIFI_CONNECT_TIMEOUT)
+    result['attempts'] = during[key] - before[key]
+    bound = most_attempts(outage, attempt_time, settings)
+    if result['attempts'] > bound:
+        problems.append(f"{result['attempts']} connection attempts during the outage, at most {bound} expected")
+    if result['network_ms'] > MAX_BLOCK_MS:
+        problems.append(f"the network task ran for {result['network_ms']:.0f}ms while down")
+
+    registry = sys.modules['lib.liveness'].registry
+    for index, task in enumerate(registry.names):
+        if registry.misses[index]:
+            problems.append(f"{task} missed its liveness deadline {registry.misses[index]} time(s)")
+
+    bound = settings['RECONNECT_MAX_DELAY'] / 1000 + attempt_time + 3 * network_period
+    if name == 'access point':
+        bound += settings['RECONNECT_MIN_DELAY'] / 1000 + settings['MQTT_CONNECT_TIMEOUT'] + 3 * network_period
+        if dns:
+            bound += DNS_LATENCY
+    result['bound'] = bound
+    if result.get('reconnected') is None:
+        problems.append("never reconnected")
+    elif result['reconnected'] > bound:
+        problems.append(f"reconnected after {result['reconnected']:.0f}s, bound is {bound:.0f}s")
+    if sim.config.TARGET_TEMP != NEW_TARGET:
+        problems.append("the target temperature sent after reconnecting didn't arrive")
+
+    client = sys.modules['lib.networking'].mqtt_client
+    result['sessions'] = client.connects
+    result['subscribes'] = client.subscribe_calls
+    if client.subscribe_calls != 2 * client.connects:
+        problems.append(f"{client.subscribe_calls} subscriptions for {client.connects} sessions")
+
+    # Once when WiFi first connects, and again after the access point outage
+    result['lookups'] = sys.modules['usocket'].resolver.lookups
+    expected = 0 if not dns else 2 if name == 'access point' else 1
+    if result['lookups'] != expected:
+        problems.append(f"{result['lookups']} DNS lookups, expected {expected}")
+    problems.extend(crashes(sim))
+    return result, problems
+
+
+def run_keepalive(overrides, ambient):
+    """
+    A keepalive shorter than two network periods has to be kept up with pings.
+    """
+    keepalive = {'NetworkSettings': {'MQTT_KEEPALIVE': 6}}
+    sim = Simulation(overrides=merged(NETWORK_ON, keepalive, overrides), plant=HeaterPlant(ambient=ambient))
+    sim.run(300)
+    sim.cleanup()
+    client = sys.modules['lib.networking'].mqtt_client
+    problems = []
+    if not client.pings:
+        problems.append("no pings sent")
+    if client.connects != 1:
+        problems.append(f"{client.connects} sessions, expected 1")
+    problems.extend(crashes(sim))
+    return client.pings, problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check WiFi and MQTT reconnection against outages.")
+    parser.add_argument('--ambient', type=float, default=5.0, help='ambient temperature of the simulated heater')
+    parser.add_argument('--outage-at', type=float, default=300, help='when the outage starts, once RUNNING')
+    parser.add_argument('--outage', type=float, default=1200, help='how long the outage lasts')
+    parser.add_argument('--set', action='append', default=[], metavar='Section.KEY=value',
+                        help='override a config.json value')
+    args = parser.parse_args()
+    overrides = parse_overrides(args.set)
+    failed = False
+
+    print(f"{'outage':<23} {'attempts':>8} {'network':>8} {'control':>8} {'back after':>11} {'sessions':>9} "
+          f"{'subscribes':>10} {'lookups':>8}")
+    for dns in (False, True):
+        for name in ('broker', 'access point'):
+            result, problems = run_outage(name, overrides, args.ambient, args.outage_at, args.outage, dns)
+            back = '-' if result.get('reconnected') is None else f"{result['reconnected']:.0f}s"
+            network = '-' if 'network_ms' not in result else f"{result['network_ms']:.1f}ms"
+            control = '-' if 'control_jitter_ms' not in result else f"{result['control_jitter_ms']:.1f}ms"
+            label = f"{name}, slow DNS" if dns else name
+            print(f"{label:<23} {result.get('attempts', '-'):>8} {network:>8} {control:>8} {back:>11} "
+                  f"{result.get('sessions', '-'):>9} {result.get('subscribes', '-'):>10} "
+                  f"{result.get('lookups', '-'):>8}{'  FAILED: ' + '; '.join(problems) if problems else ''}")
+            failed |= bool(problems)
+
+    pings, problems = run_keepalive(overrides, args.ambient)
+    print(f"{'keepalive 6s':<23} {pings:>8} pings{'  FAILED: ' + '; '.join(problems) if problems else ''}")
+    failed |= bool(problems)
+
+    print("FAIL" if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# Compare the output temperature control modes against the simulated heater.
+#
+# Every CONTROL_MODE runs the unmodified firmware through the same scenarios in
+# tools/sim/simulator.py. For each one the mean distance from TARGET_TEMP while RUNNING,
+# once the first approach is over, the number of restarts out of STANDBY and the fuel used
+# are listed side by side.
+#
+# When both are run, modulating is checked against proportional, and the script fails if it
+# doesn't do better. Where the heater can hold the target, modulating has to get closer to
+# it without more restarts. In the mild scenario even MIN_PUMP_FREQUENCY heats faster than
+# the room loses heat at TARGET_TEMP, so either mode cycles through STANDBY and the error
+# is set by the band around the target. There modulating has to restart no more often and
+# use no more fuel.
+#
+# Usage: python tools/compare_control.py [--modes proportional,modulating] [--settle 1800]
+#                                        [--off 7200] [--workers 4] [--set Section.KEY=value]
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim'))
+
+from scenario import SWITCH_ON, parse_overrides, run_cycle, failed  # noqa: E402
+from tune import PULSE_ML, candidate_overrides  # noqa: E402
+from lib.plant import HeaterPlant  # noqa: E402
+
+# (name, ambient temperature, TARGET_TEMP, whether the heater can hold the target there)
+SCENARIOS = [
+    ('cold', -10.0, 30.0, True),
+    ('cool', 5.0, 35.0, True),
+    ('mild', 15.0, 22.0, False),
+]
+BASELINE_MODE = 'proportional'
+CANDIDATE_MODE = 'modulating'
+
+
+def evaluate(job):
+    mode, scenario, fixed, settle, switch_off = job
+    _, ambient, target, _ = scenario
+    candidate = {'TemperatureControl.CONTROL_MODE': mode, 'TemperatureControl.TARGET_TEMP': target}
+    sim = run_cycle(switch_off + 1200, SWITCH_ON, switch_off, candidate_overrides(candidate, fixed),
+                    plant=HeaterPlant(ambient=ambient))
+
+    states = [state for _, state in sim.timeline]
+    errors = [abs(sample[2] - target) for sample in sim.samples
+              if sample[1] == 'RUNNING' and settle <= sample[0] <= switch_off]
+    return {
+        'mode': mode,
+        'scenario': scenario[0],
+        'error': sum(errors) / len(errors) if errors else None,
+        'worst': max(errors) if errors else None,
+        'restarts': sum(1 for before, after in zip(states, states[1:]) if (before, after) == ('STANDBY', 'STARTING')),
+        'fuel_ml': sim.fuel_pulses * PULSE_ML,
+        'failed': failed(sim),
+    }
+
+
+def format_value(value, unit=''):
+    return '-' if value is None else f"{value:.2f}{unit}"
+
+
+def regressions(candidate, baseline, holds):
+    """
+    Where the candidate mode does worse than the baseline in one scenario.
+    """
+    if candidate['failed'] or candidate['error'] is None:
+        return ["didn't run through"]
+    found = []
+    if candidate['restarts'] > baseline['restarts']:
+        found.append(f"{candidate['restarts']} restarts, {BASELINE_MODE} needs {baseline['restarts']}")
+    if holds and baseline['error'] is not None and candidate['error'] >= baseline['error']:
+        found.append(f"mean error {candidate['error']:.2f}C, {BASELINE_MODE} gets {baseline['error']:.2f}C")
+    if not holds and candidate['fuel_ml'] > baseline['fuel_ml']:
+        found.append(f"{candidate['fuel_ml']:.0f}ml of fuel, {BASELINE_MODE} uses {baseline['fuel_ml']:.0f}ml")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CONTROL_MODE settings against the simulated heater.")
+    parser.add_argument('--modes', default='proportional,modulating', help='CONTROL_MODE values to compare')
+    parser.add_argument('--settle', type=float, default=1800, help='ignore RUNNING before this many seconds')
+    parser.add_argument('--off', type=float, default=7200, help='when to switch the heater off')
+    parser.add_argument('--set', action='append', default=[], metavar='Section.KEY=value',
+                        help='fix a config.json value for every run')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='simulations to run in parallel')
+    args = parser.parse_args()
+
+    modes = args.modes.split(',')
+    fixed = parse_overrides(args.set)
+    jobs = [(mode, scenario, fixed, args.settle, args.off) for scenario in SCENARIOS for mode in modes]
+    print(f"Simulating {len(modes)} mode(s) in {len(SCENARIOS)} scenarios on {args.workers} worker(s)")
+    # One simulation per worker process, the firmware keeps its state in module globals
+    with ProcessPoolExecutor(max_workers=args.workers, max_tasks_per_child=1) as pool:
+        results = list(pool.map(evaluate, jobs))
+
+    print(f"{'scenario':<8} {'mode':<13} {'mean err':>9} {'worst':>7} {'restarts':>8} {'fuel':>9}")
+    for result in results:
+        print(f"{result['scenario']:<8} {result['mode']:<13} {format_value(result['error'], 'C'):>9} "
+              f"{format_value(result['worst'], 'C'):>7} {result['restarts']:>8} "
+              f"{format_value(result['fuel_ml'], 'ml'):>9}{'  FAILED' if result['failed'] else ''}")
+    failed = any(result['failed'] for result in results)
+
+    if BASELINE_MODE in modes and CANDIDATE_MODE in modes:
+        print()
+        for scenario in SCENARIOS:
+            runs = {result['mode']: result for result in results if result['scenario'] == scenario[0]}
+            found = regressions(runs[CANDIDATE_MODE], runs[BASELINE_MODE], scenario[3])
+            print(f"{scenario[0]:<8} {CANDIDATE_MODE} vs {BASELINE_MODE}: "
+                  f"{'WORSE: ' + '; '.join(found) if found else 'better'}")
+            failed |= bool(found)
+        print("FAIL" if failed else "OK")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Decode the persistent event log written by lib/eventLog.py.
+#
+# Reads the events*.bin files copied off the board, what GET /events on the web server
+# sends, or the messages the "events" MQTT command publishes, saved to files. Records from
+# all of them are put in sequence order, so files can be given in any order, and printed
+# one per line, or as CSV.
+#
+# Usage: python tools/decode_events.py events0.bin events1.bin ...
+#        python tools/decode_events.py --url http://192.168.4.1 [--csv]
+import argparse
+import csv
+import os
+import sys
+import urllib.request
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TOOLS_DIR)
+for path in (os.path.join(TOOLS_DIR, 'sim', 'stubs'), ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+
+def load_event_log():
+    # hardwareConfig reads config.json from the current directory when eventLog imports it,
+    # and the module's log then opens its files there, so import it from a scratch directory
+    import tempfile
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix='heater-events-') as work_dir:
+        with open(os.path.join(ROOT, 'config.json')) as f:
+            settings = f.read()
+        with open(os.path.join(work_dir, 'config.json'), 'w') as f:
+            f.write(settings)
+        os.chdir(work_dir)
+        try:
+            from lib import eventLog
+        finally:
+            os.chdir(cwd)
+    return eventLog
+
+
+def read_sources(args):
+    if args.url:
+        with urllib.request.urlopen(args.url.rstrip('/') + '/events', timeout=args.timeout) as response:
+            return [response.read()]
+    data = []
+    for path in args.files:
+        with open(path, 'rb') as f:
+            data.append(f.read())
+    return data
+
+
+def format_uptime(tenths):
+    seconds = tenths // 10
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}.{tenths % 10}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode the heater's persistent event log.")
+    parser.add_argument('files', nargs='*', help='event log files, in any order')
+    parser.add_argument('--url', help="fetch the log from the board's web server instead")
+    parser.add_argument('--timeout', type=float, default=10, help='seconds to wait for --url')
+    parser.add_argument('--csv', action='store_true', help='write CSV instead of text')
+    args = parser.parse_args()
+    if not args.files and not args.url:
+        parser.error("give event log files or --url")
+
+    eventLog = load_event_log()
+    records = {}
+    for data in read_sources(args):
+        if len(data) % eventLog.RECORD_SIZE:
+            print(f"Ignoring {len(data) % eventLog.RECORD_SIZE} bytes of a partly written record", file=sys.stderr)
+        for record in eventLog.unpack(data):
+            records[record[0]] = record  # The same record can come from more than one source
+    records = [records[seq] for seq in sorted(records)]
+
+    if args.csv:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(['seq', 'boot', 'uptime_s', 'kind', 'code', 'event', 'output_temp', 'exhaust_temp'])
+        for seq, boot, uptime, kind, code, output, exhaust in records:
+            writer.writerow([seq, boot, uptime / 10, kind, code, eventLog.describe(kind, code),
+                             output / 10, exhaust / 10])
+        return
+
+    print(f"{'seq':>6} {'boot':>5} {'uptime':>12}  {'output':>7} {'exhaust':>8}  event")
+    for seq, boot, uptime, kind, code, output, exhaust in records:
+        print(f"{seq:>6} {boot:>5} {format_uptime(uptime):>12}  {output / 10:>6.1f}C {exhaust / 10:>7.1f}C  "
+              f"{eventLog.describe(kind, code)}")
+    print(f"{len(records)} event(s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# Compare the flame-out detectors in lib/flameDetector.py on exhaust temperature traces.
+#
+# Traces come from the heater model in lib/plant.py, all of them stepped together as one
+# NumPy batch from tools/sim/plant.py. Each burner is lit with the glow plug, ramped up
+# like the startup sequence does, then run at heat demands that change every minute or
+# two through FUEL_AIR_MAP, with the flame going out on its own in half of them. Sensor
+# noise is added to the exhaust readings. A recorded trace can be checked
+# too, as CSV with the columns seconds, exhaust_temp, pump_frequency and optionally flame
+# (1 while burning).
+#
+# For each detector the flame-outs it catches, how long after the flame went out, and
+# the false alarms while the flame was still burning are listed.
+#
+# Usage: python tools/eval_flame.py [--traces 200] [--noise 0.3] [--seed 1]
+#                                   [--set FlameOutDetection.KEY=value] [--csv trace.csv]
+import argparse
+import csv
+import json
+import os
+import sys
+
+import numpy as np
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(TOOLS_DIR)
+for path in (os.path.join(TOOLS_DIR, 'sim', 'stubs'), os.path.join(TOOLS_DIR, 'sim'), TOOLS_DIR, ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from lib.fuelAirMap import FuelAirMap  # noqa: E402
+from plant import make_batch  # noqa: E402
+from scenario import parse_overrides  # noqa: E402
+
+SAMPLE_PERIOD = 1.0  # s, the control rate the detectors run at
+GLOW_TIME = 60  # s with the glow plug on and a low fire
+LOW_FIRE_TIME = 30  # s of low fire after the glow plug
+RUN_TIME = 1800  # s of RUNNING per trace
+AFTER_FLAME_OUT = 120  # s of trace kept after the flame goes out
+DEMAND_SLEW = 2.0  # % per second, about what the modulating controller does far from target
+DETECTORS = ('drops', 'slope')
+
+
+def load_config(overrides):
+    # hardwareConfig reads config.json from the current directory when flameDetector imports it
+    with open(os.path.join(ROOT, 'config.json')) as f:
+        settings = json.load(f)
+    for section, values in overrides.items():
+        settings.setdefault(section, {}).update(values)
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        import hardwareConfig as config
+        from lib import flameDetector
+    finally:
+        os.chdir(cwd)
+    for section in settings.values():
+        for key, value in section.items():
+            setattr(config, key, value)
+    return config, flameDetector
+
+
+# ┌─────────────────────┐
+# │ Traces              │
+# └─────────────────────┘
+def make_traces(count, seed, noise, fuel_air_map):
+    """
+    Return one [(seconds, exhaust reading, pump Hz, flame burning)] from the start of
+    RUNNING for each of count heaters, every other one with a flame-out. The heaters are
+    stepped together as one batch, each on its own schedule.
+    """
+    rng = np.random.default_rng(seed)
+    plant = make_batch(count, seed=seed, ambient=(-15.0, 20.0))
+    flame_out = np.arange(count) % 2 == 1
+
+    # Glow plug and a low fire, then the startup's ramp steps of 10-30 s each
+    ramp_ends = GLOW_TIME + LOW_FIRE_TIME + np.cumsum(rng.integers(10, 31, (3, count)), axis=0)
+    running_at = ramp_ends[-1]
+    end = running_at + RUN_TIME
+    demand = np.full(count, fuel_air_map.demand_for_pump(5.0))
+    target = demand.copy()
+    change_at = running_at.copy()
+    traces = [[] for _ in range(count)]
+
+    elapsed = 0
+    while (elapsed < end).any():
+        starting = elapsed == running_at
+        plant.flameout_after = np.where(starting & flame_out,
+                                        plant.burn_time + rng.uniform(30, RUN_TIME - AFTER_FLAME_OUT, count),
+                                        plant.flameout_after)
+        running = elapsed >= running_at
+        # The demand moves towards a new level every minute or two, at most DEMAND_SLEW per
+        # second. Once the flame is out the pump carries on as it was, nothing has noticed yet.
+        burning = plant.flame > 0
+        end = np.where(running & ~burning & ~starting, np.minimum(end, elapsed + AFTER_FLAME_OUT), end)
+        new_target = running & burning & (elapsed >= change_at)
+        target = np.where(new_target, rng.uniform(0, 100, count), target)
+        change_at = np.where(new_target, elapsed + rng.uniform(30, 180, count), change_at)
+        demand = np.where(running, demand + np.clip(target - demand, -DEMAND_SLEW, DEMAND_SLEW) * SAMPLE_PERIOD,
+                          demand)
+
+        step = (elapsed >= ramp_ends).sum(axis=0)
+        pump = np.where(running, np.interp(demand, fuel_air_map.demands, fuel_air_map.pumps),
+                        np.where(elapsed < GLOW_TIME + LOW_FIRE_TIME, 2.0, 3.0 + step))
+        fan = np.where(running, np.interp(demand, fuel_air_map.demands, fuel_air_map.fans),
+                       np.where(elapsed < GLOW_TIME + LOW_FIRE_TIME, 30.0, 40.0 + 10.0 * step))
+        recording = running & (elapsed < end)
+        plant.step(SAMPLE_PERIOD, pump, fan / 100, (elapsed < GLOW_TIME) * 1.0)
+        elapsed += SAMPLE_PERIOD
+
+        readings = plant.exhaust + rng.normal(0.0, noise, count)
+        for i in np.flatnonzero(recording):
+            traces[i].append((len(traces[i]) * SAMPLE_PERIOD, float(readings[i]), float(pump[i]),
+                              bool(plant.flame[i] > 0)))
+    return traces
+
+
+def read_csv_trace(path):
+    samples = []
+    with open(path) as f:
+        for row in csv.reader(f):
+            try:
+                values = [float(value) for value in row]
+            except ValueError:
+                continue  # Header
+            flame = values[3] > 0 if len(values) > 3 else True
+            samples.append((values[0], values[1], values[2], flame))
+    return samples
+
+
+# ┌─────────────────────┐
+# │ Scoring             │
+# └─────────────────────┘
+def score_trace(detector, samples):
+    """
+    Return ('detected', delay), ('missed', None), ('false', when) or ('quiet', None).
+    """
+    detector.reset()
+    out_at = next((when for when, _, _, flame in samples if not flame), None)
+    for when, exhaust, pump, _ in samples:
+        if detector.update(exhaust, pump):
+            if out_at is None or when < out_at:
+                return 'false', when
+            return 'detected', when - out_at
+    return ('missed', None) if out_at is not None else ('quiet', None)
+
+
+def summarize(name, results, burning_hours):
+    delays = [value for outcome, value in results if outcome == 'detected']
+    flame_outs = sum(1 for outcome, _ in results if outcome in ('detected', 'missed'))
+    false_alarms = sum(1 for outcome, _ in results if outcome == 'false')
+    mean_delay = f"{sum(delays) / len(delays):.1f}s" if delays else '-'
+    worst_delay = f"{max(delays):.0f}s" if delays else '-'
+    print(f"{name:<8} {len(delays):>4}/{flame_outs:<4} {mean_delay:>8} {worst_delay:>7} "
+          f"{false_alarms:>6} {false_alarms / burning_hours if burning_hours else 0:>8.2f}")
+
+
+def burning_time(samples):
+    return sum(SAMPLE_PERIOD for _, _, _, flame in samples if flame)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare flame-out detectors on exhaust temperature traces.")
+    parser.add_argument('--traces', type=int, default=200, help='simulated traces, half of them with a flame-out')
+    parser.add_argument('--noise', type=float, default=0.3, help='exhaust sensor noise, standard deviation in C')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--set', action='append', default=[], metavar='Section.KEY=value',
+                        help='override a config.json value, e.g. FlameOutDetection.FLAME_OUT_T=3')
+    parser.add_argument('--csv', help='score a recorded trace instead: seconds,exhaust_temp,pump_frequency[,flame]')
+    args = parser.parse_args()
+
+    config, flameDetector = load_config(parse_overrides(args.set))
+    if args.csv:
+        traces = [read_csv_trace(args.csv)]
+    else:
+        fuel_air_map = FuelAirMap(config.FUEL_AIR_MAP)
+        traces = make_traces(args.traces, args.seed, args.noise, fuel_air_map)
+    burning_hours = sum(burning_time(samples) for samples in traces) / 3600
+    print(f"{len(traces)} trace(s), {burning_hours:.1f}h of flame, noise {args.noise}C")
+
+    print(f"{'detector':<8} {'caught':>9} {'mean':>8} {'worst':>7} {'false':>6} {'false/h':>8}")
+    for name in DETECTORS:
+        detector = flameDetector.make_detector(name)
+        summarize(name, [score_trace(detector, samples) for samples in traces], burning_hours)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+# NumPy batches of the heater model in lib/plant.py.
+#
+# make_batch() builds one HeaterPlant whose parameters and states are arrays, so a single
+# step() call advances thousands of heaters. tools/eval_flame.py makes its open-loop traces
+# this way. The firmware simulation and tools/simulate.py run one heater in closed loop,
+# so they use a float HeaterPlant directly.
+#
+# Usage: python tools/sim/plant.py [count]   (times a batch of open-loop heat-up runs)
+import os
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from lib.plant import HeaterPlant  # noqa: E402
+
+
+def make_batch(count, seed=None, ambient=(-10.0, 20.0), ignition_failure_rate=0.0, flameout_rate=0.0,
+               flameout_window=(60.0, 1800.0)):
+    """
+    Build a batch of heaters with randomised conditions.
+
+    ambient is a (low, high) range. A share of the heaters never lights
+    (ignition_failure_rate) and another share loses its flame after a random burn time
+    within flameout_window (flameout_rate).
+    """
+    rng = np.random.default_rng(seed)
+    flameout_after = np.full(count, 1e12)
+    flames_out = rng.random(count) < flameout_rate
+    flameout_after[flames_out] = rng.uniform(flameout_window[0], flameout_window[1], flames_out.sum())
+    return HeaterPlant(
+        ambient=rng.uniform(ambient[0], ambient[1], count),
+        ignitable=(rng.random(count) >= ignition_failure_rate) * 1.0,
+        flameout_after=flameout_after,
+    )
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    batch = make_batch(count, seed=1, ignition_failure_rate=0.05, flameout_rate=0.1)
+    dt = 0.5
+    steps = int(1800 / dt)
+    start = time.perf_counter()
+    for i in range(steps):
+        t = i * dt
+        glow = 1.0 if t < 90 else 0.0
+        pump = 0.0 if t < 60 else (1.0 if t < 90 else 3.0)
+        batch.step(dt, pump, 0.5, glow)
+    elapsed = time.perf_counter() - start
+    print(f"{count} heaters x {steps} steps in {elapsed:.2f}s "
+          f"({count * steps / elapsed / 1e6:.1f}M heater-steps/s)")
+    print(f"lit: {int((batch.flame > 0).sum())}, never lit: {int((batch.ignitions == 0).sum())}, "
+          f"output {batch.output.min():.1f}..{batch.output.max():.1f}C, "
+          f"exhaust {batch.exhaust.min():.1f}..{batch.exhaust.max():.1f}C")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# Scaffolding shared by the tools that run the firmware in simulator.py: config.json
+# overrides from the command line, the usual switch schedule, the normal heating cycle and
+# the problems every simulated run is checked for.
+#
+# A tool only needs tools/sim on sys.path to import this, the simulator adds the firmware
+# and its stand-ins:
+#
+#     sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim'))
+#     from scenario import parse_overrides, ...  # noqa: E402
+import json
+
+from simulator import Simulation
+from lib.plant import HeaterPlant
+
+SWITCH_ON = 5  # s, when the scenarios switch the heater on
+NORMAL_OFF = 2400  # s, when the normal cycle switches it off again
+NORMAL_DURATION = 3600  # s at most for the normal cycle
+NETWORK_ON = {'GeneralSettings': {'USE_WIFI': True, 'USE_MQTT': True}}
+
+
+def parse_overrides(items):
+    overrides = {}
+    for item in items:
+        key, value = item.split('=', 1)
+        section, name = key.split('.', 1)
+        try:
+            value = json.loads(value)
+        except ValueError:
+            pass  # Leave as string
+        overrides.setdefault(section, {})[name] = value
+    return overrides
+
+
+def merged(*layers):
+    """
+    One set of config.json overrides out of several, later layers win.
+    """
+    result = {}
+    for layer in layers:
+        for section, values in layer.items():
+            result.setdefault(section, {}).update(values)
+    return result
+
+
+def switch_on(sim, at=SWITCH_ON):
+    # The switch starts off, so the firmware boots into OFF
+    sim.at(0, lambda s: s.set_switch(False))
+    sim.at(at, lambda s: s.set_switch(True))
+
+
+def run_cycle(duration, switch_on_at, switch_off, overrides, quiet=True, plant=None):
+    """
+    Switch the heater on, let it run and cycle through standby, then switch it off
+    and stop once it is back in OFF.
+    """
+    sim = Simulation(overrides=overrides, plant=plant, quiet=quiet)
+    switch_on(sim, switch_on_at)
+    sim.at(switch_off, lambda s: s.set_switch(False))
+
+    def stop_when_off(s):
+        if s.now() > switch_off and s.state == 'OFF':
+            s.stop()
+
+    sim.every(1.0, stop_when_off)
+    sim.run(duration)
+    sim.cleanup()
+    return sim
+
+
+def normal_cycle(overrides, ambient):
+    return run_cycle(NORMAL_DURATION, SWITCH_ON, NORMAL_OFF, overrides, plant=HeaterPlant(ambient=ambient))
+
+
+def crashes(sim, watchdog=True):
+    """
+    Problems any run can end with: a crashed thread, a reset or the watchdog running out,
+    unless watchdog is False for a run that is meant to make it run out.
+    """
+    problems = [f"thread {name} crashed: {error!r}" for name, error in sim.errors]
+    if sim.resets:
+        problems.append("the board was reset")
+    if watchdog and sim.watchdog_expired_at is not None:
+        problems.append(f"the watchdog ran out at {sim.watchdog_expired_at:.1f}s")
+    return problems
+
+
+def failed(sim):
+    """
+    True if a run ended up anywhere a working heater shouldn't, for ranking candidates.
+    """
+    states = [state for _, state in sim.timeline]
+    return 'FAILURE' in states or 'EMERGENCY_STOP' in states or bool(crashes(sim))
@@ -0,0 +1,345 @@
+# Runs the unmodified firmware under CPython on a virtual clock.
+#
+# The stand-ins in tools/sim/stubs replace machine, micropython, utime, network, usocket,
+# uselect, _thread and umqtt.simple. main.py is executed as __main__ exactly like on the
+# board, with its tasks on an asyncio event loop that sleeps on the virtual clock, while the
+# heater model from lib/plant.py feeds the temperature ADCs and a scenario flips the switch.
+import asyncio
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import math
+import random
+import runpy
+import selectors
+import shutil
+import sys
+import tempfile
+import time
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+STUBS_DIR = os.path.join(SIM_DIR, 'stubs')
+ROOT = os.path.dirname(os.path.dirname(SIM_DIR))
+
+FIRMWARE_MODULES = ('hardwareConfig', 'main', 'webserver', 'lib', 'states')
+STUB_MODULES = ('simclock', 'machine', 'utime', 'network', 'usocket', 'uselect', '_thread', 'umqtt', 'micropython')
+
+# Pins and ADCs from hardwareConfig.py
+FUEL_PIN = 5
+AIR_PIN = 23
+GLOW_PIN = 21
+SWITCH_PIN = 33
+OUTPUT_ADC_PIN = 32
+EXHAUST_ADC_PIN = 34
+FAN_RPM_PIN = 22
+FAN_PULSES_PER_REVOLUTION = 2
+
+# Keep the simulation off the real network and away from port 80 unless asked for
+DEFAULT_OVERRIDES = {
+    'GeneralSettings': {'USE_WEBSERVER': False, 'IS_SIMULATION': False},
+    # The heater model's exhaust runs hotter than a real one, up to about 185C at full fire
+    # in the cold, which the board's limit would take for an overheating heater
+    'SafetyLimits': {'EXHAUST_SAFE_TEMP': 250},
+}
+
+for path in (STUBS_DIR, ROOT):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from lib.plant import HeaterPlant  # noqa: E402
+
+
+def load_config(overrides=None):
+    with open(os.path.join(ROOT, 'config.json')) as f:
+        settings = json.load(f)
+    for layer in (DEFAULT_OVERRIDES, overrides or {}):
+        for section, values in layer.items():
+            settings.setdefault(section, {}).update(values)
+    return settings
+
+
+def _purge_modules():
+    for name in list(sys.modules):
+        root = name.split('.')[0]
+        if root in FIRMWARE_MODULES or root in STUB_MODULES:
+            del sys.modules[name]
+
+
+@contextlib.contextmanager
+def _builtin_stubs():
+    # _thread is built into CPython, so sys.path can't shadow it. Swap the stand-in into
+    # sys.modules while the firmware imports run, the threading module keeps the real one.
+    real_thread = sys.modules.get('_thread')
+    spec = importlib.util.spec_from_file_location('_thread', os.path.join(STUBS_DIR, '_thread.py'))
+    stub = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(stub)
+    sys.modules['_thread'] = stub
+    try:
+        yield
+    finally:
+        sys.modules['_thread'] = real_thread
+
+
+class _VirtualSelector(selectors.SelectSelector):
+    # Waiting for I/O moves the virtual clock instead, which also fires the firmware's
+    # timers and the simulator's hooks. Real sockets are still polled, without waiting.
+    def __init__(self, clock):
+        super().__init__()
+        self._clock = clock
+
+    def select(self, timeout=None):
+        if not self._clock.stopped and (timeout is None or timeout > 0):
+            wait_us = 3600 * 1000000 if timeout is None else max(math.ceil(timeout * 1000000), 1)
+            self._clock.sleep_us(wait_us)
+        return super().select(0)
+
+
+class _VirtualEventLoop(asyncio.SelectorEventLoop):
+    def __init__(self, clock):
+        super().__init__(_VirtualSelector(clock))
+        self._clock = clock
+
+    def time(self):
+        return self._clock.now_us / 1000000
+
+
+class _VirtualEventLoopPolicy(asyncio.DefaultEventLoopPolicy):
+    def __init__(self, clock):
+        super().__init__()
+        self._clock = clock
+
+    def new_event_loop(self):
+        return _VirtualEventLoop(self._clock)
+
+
+@contextlib.contextmanager
+def _virtual_asyncio(clock):
+    # asyncio.run() in main.py gets an event loop on the virtual clock
+    asyncio.set_event_loop_policy(_VirtualEventLoopPolicy(clock))
+    try:
+        yield
+    finally:
+        asyncio.set_event_loop_policy(None)
+
+
+class Simulation:
+    def __init__(self, overrides=None, plant=None, poll_cost_us=1000, plant_period=0.1, quiet=True, seed=0):
+        self.settings = load_config(overrides)
+        self.plant = plant if plant is not None else HeaterPlant()
+        self.poll_cost_us = poll_cost_us
+        self.plant_period = plant_period
+        self.quiet = quiet
+        self.seed = seed  # For the firmware's random module, e.g. reconnect jitter
+        self.output = io.StringIO()
+
+        self.timeline = []  # (virtual seconds, state) on every state change
+        self.samples = []  # (virtual seconds, state, output temp, exhaust temp, pump Hz, fan %, fan RPM)
+        self.sample_period = 1.0
+        self.fuel_pulses = 0
+        self.wall_time = 0.0
+        self.virtual_time = 0.0
+        self.errors = []
+        self.resets = 0
+        self.watchdog_expired_at = None  # When the firmware let the watchdog run out, the board would reboot
+
+        self._workdir = tempfile.mkdtemp(prefix='heater-sim-')
+        with open(os.path.join(self._workdir, 'config.json'), 'w') as f:
+            json.dump(self.settings, f)
+
+        # Fresh firmware and stand-ins for every simulation
+        _purge_modules()
+        import simclock
+        import machine
+        self.clock = simclock.clock
+        self.clock.poll_cost_us = poll_cost_us
+        self.machine = machine
+        self._last_pulses = 0
+        self._fan_phase = 0.0
+        self._events = []
+        self._adc_faults = {}  # ADC pin -> raw reading it is stuck at
+
+    @property
+    def config(self):
+        return sys.modules.get('hardwareConfig')
+
+    @property
+    def state(self):
+        config = self.config
+        return config.current_state if config else None
+
+    def now(self):
+        return self.clock.now_us / 1000000
+
+    # ┌─────────────────────┐
+    # │ Scenario helpers    │
+    # └─────────────────────┘
+    def at(self, time_s, action):
+        """
+        Run action(sim) at time_s of virtual time.
+        """
+        self.clock.at(time_s, lambda _: action(self))
+
+    def every(self, period_s, action):
+        self.clock.every(period_s, lambda _: action(self))
+
+    def set_switch(self, on):
+        # The switch pulls the pin low when the heater should run
+        level = 0 if on else 1
+        if SWITCH_PIN in self.machine.pins:
+            self.machine.pins[SWITCH_PIN].drive(level)
+        else:
+            self.machine.input_levels[SWITCH_PIN] = level
+
+    def fail_sensor(self, sensor, raw):
+        """
+        Hold the 'output' or 'exhaust' ADC at raw from now on, 4095 for an open thermistor
+        and 0 for a shorted one. None puts the heater model back in charge.
+        """
+        pin = OUTPUT_ADC_PIN if sensor == 'output' else EXHAUST_ADC_PIN
+        if raw is None:
+            self._adc_faults.pop(pin, None)
+        else:
+            self._adc_faults[pin] = raw
+        self._write_adcs()
+
+    def hold_sensor(self, sensor, temperature):
+        """
+        Make the 'output' or 'exhaust' thermistor read temperature from now on, a step the
+        heater model wouldn't produce. None puts the heater model back in charge.
+        """
+        from lib import thermistor
+        if temperature is None:
+            self.fail_sensor(sensor, None)
+        elif sensor == 'output':
+            self.fail_sensor(sensor, thermistor.temperature_to_adc(
+                temperature, self.config.OUTPUT_SENSOR_TYPE, self.config.OUTPUT_SENSOR_BETA))
+        else:
+            self.fail_sensor(sensor, thermistor.temperature_to_adc(
+                temperature, self.config.EXHAUST_SENSOR_TYPE, self.config.EXHAUST_SENSOR_BETA))
+
+    def stop(self):
+        self.clock.stop()
+
+    # ┌─────────────────────┐
+    # │ Plant and probes    │
+    # └─────────────────────┘
+    def _step_plant(self, _):
+        machine = self.machine
+        config = self.config
+        if config is None or FUEL_PIN not in machine.pins:
+            return
+        pulses = machine.pins[FUEL_PIN].edges
+        fuel_hz = (pulses - self._last_pulses) / self.plant_period
+        self.fuel_pulses += pulses - self._last_pulses
+        self._last_pulses = pulses
+        fan_fraction = machine.pwms[AIR_PIN].duty() / config.FAN_MAX_DUTY
+        glow_on = machine.pins[GLOW_PIN].value()
+
+        self.plant.step(self.plant_period, fuel_hz, fan_fraction, glow_on)
+        self._write_adcs()
+        self._schedule_fan_edges()
+
+    def _schedule_fan_edges(self):
+        # Hall sensor pulses for the next plant period, at the fan's current speed
+        pin = self.machine.pins.get(FAN_RPM_PIN)
+        if pin is None or pin.irq_handler is None:
+            return
+        rate = self.plant.fan_rpm * FAN_PULSES_PER_REVOLUTION / 60
+        phase = self._fan_phase + rate * self.plant_period
+        end = self.now() + self.plant_period
+        while phase >= 1:
+            phase -= 1
+            self.clock.at(end - phase / rate, self._fan_edge)
+        self._fan_phase = phase
+
+    def _fan_edge(self, _):
+        pin = self.machine.pins[FAN_RPM_PIN]
+        pin.drive(1)
+        pin.drive(0)
+
+    def _write_adcs(self):
+        from lib import thermistor
+        config = self.config
+        machine = self.machine
+        if OUTPUT_ADC_PIN in machine.adcs:
+            machine.adcs[OUTPUT_ADC_PIN].raw = thermistor.temperature_to_adc(
+                self.plant.output, config.OUTPUT_SENSOR_TYPE, config.OUTPUT_SENSOR_BETA)
+        if EXHAUST_ADC_PIN in machine.adcs:
+            machine.adcs[EXHAUST_ADC_PIN].raw = thermistor.temperature_to_adc(
+                self.plant.exhaust, config.EXHAUST_SENSOR_TYPE, config.EXHAUST_SENSOR_BETA)
+        for pin, raw in self._adc_faults.items():
+            if pin in machine.adcs:
+                machine.adcs[pin].raw = raw
+
+    def _check_watchdog(self, _):
+        watchdogs = self.machine.watchdogs
+        if watchdogs and watchdogs[0].expired() and self.watchdog_expired_at is None:
+            self.watchdog_expired_at = self.now()
+            self.stop()
+
+    def _probe(self, _):
+        config = self.config
+        if config is None:
+            return
+        state = config.current_state
+        if not self.timeline or self.timeline[-1][1] != state:
+            self.timeline.append((self.now(), state))
+        self.samples.append((self.now(), state, config.output_temp, config.exhaust_temp,
+                             config.pump_frequency, config.fan_speed_percentage, config.fan_rpm))
+
+    # ┌─────────────────────┐
+    # │ Running             │
+    # └─────────────────────┘
+    def run(self, duration_s):
+        """
+        Boot the firmware and run it for duration_s of virtual time, or until stop().
+        """
+        import simclock
+        self.clock.stop_at_us = int(duration_s * 1000000)
+        self.clock.every(self.plant_period, self._step_plant)
+        self.clock.every(self.sample_period, self._probe)
+        self.clock.every(self.sample_period, self._check_watchdog)
+
+        random.seed(self.seed)
+        cwd = os.getcwd()
+        os.chdir(self._workdir)
+        stream = self.output if self.quiet else sys.stdout
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(stream), _builtin_stubs(), _virtual_asyncio(self.clock):
+                runpy.run_path(os.path.join(ROOT, 'main.py'), run_name='__main__')
+        except simclock.SimulationEnd:
+            pass
+        except self.machine.SimulatedReset:
+            self.resets += 1
+        finally:
+            self.clock.stop()
+            self.wall_time = time.perf_counter() - start
+            self.virtual_time = self.now()
+            os.chdir(cwd)
+            self._probe(None)
+        self.errors = list(self.clock.errors)
+        return self
+
+    def cleanup(self):
+        shutil.rmtree(self._workdir, ignore_errors=True)
+
+    def report(self):
+        lines = []
+        for when, state in self.timeline:
+            lines.append(f"{when:9.1f}s  {state}")
+        speedup = self.virtual_time / self.wall_time if self.wall_time else 0
+        lines.append(f"Simulated {self.virtual_time:.0f}s in {self.wall_time * 1000:.0f}ms "
+                     f"({speedup:.0f}x real time), {self.fuel_pulses} fuel pulses")
+        for name, error in self.errors:
+            lines.append(f"Thread {name} crashed: {error!r}")
+        if self.resets:
+            lines.append(f"Firmware called machine.reset() {self.resets} time(s)")
+        if self.watchdog_expired_at is not None:
+            lines.append(f"Watchdog ran out at {self.watchdog_expired_at:.1f}s, the board would have reset")
+        scheduler = sys.modules.get('lib.scheduler')
+        if scheduler and scheduler.tasks.names:
+            lines.extend(scheduler.tasks.format_stats())
+        return "\n".join(lines)
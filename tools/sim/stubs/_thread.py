@@ -0,0 +1,40 @@
+# Host stand-in for MicroPython's _thread. Threads take turns on the virtual clock.
+import threading
+from simclock import clock
+
+
+def start_new_thread(function, args):
+    return clock.start_thread(function, args)
+
+
+def get_ident():
+    return threading.get_ident()
+
+
+class LockType:
+    # Only one firmware thread runs at a time, so a lock never has to wait
+    def __init__(self):
+        self._locked = False
+
+    def acquire(self, waitflag=1, timeout=-1):
+        if self._locked and not waitflag:
+            return False
+        self._locked = True
+        return True
+
+    def release(self):
+        self._locked = False
+
+    def locked(self):
+        return self._locked
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+
+def allocate_lock():
+    return LockType()
@@ -0,0 +1,232 @@
+# Host stand-in for MicroPython's machine module on the simulator's virtual clock.
+# Every peripheral the firmware creates is registered here so the simulator can drive
+# inputs and watch outputs.
+from simclock import clock
+
+PWRON_RESET = 1
+HARD_RESET = 2
+WDT_RESET = 3
+DEEPSLEEP_RESET = 4
+SOFT_RESET = 5
+
+# Peripherals created by the firmware, by pin number or timer id
+pins = {}
+pwms = {}
+adcs = {}
+timers = {}
+watchdogs = []
+
+# Levels the simulator wants on input pins, applied when the firmware creates them
+input_levels = {}
+
+reset_cause_value = PWRON_RESET
+reset_count = 0
+
+
+class SimulatedReset(BaseException):
+    """
+    Raised by machine.reset() so the simulator can see the firmware rebooting. A
+    BaseException, so the firmware's own "except Exception" handlers let it through.
+    """
+
+
+class Pin:
+    IN = 1
+    OUT = 3
+    OPEN_DRAIN = 7
+    PULL_UP = 2
+    PULL_DOWN = 1
+    IRQ_RISING = 1
+    IRQ_FALLING = 2
+
+    def __init__(self, id, mode=-1, pull=-1, value=None):
+        self.id = id
+        self.mode = mode
+        self.pull = pull
+        # Inputs with a pull-up read high until something drives them
+        self._value = 1 if pull == Pin.PULL_UP else 0
+        if value is not None:
+            self._value = value
+        if id in input_levels:
+            self._value = input_levels[id]
+        self.irq_handler = None
+        self.irq_trigger = 0
+        self.edges = 0  # Number of off to on transitions driven by the firmware
+        pins[id] = self
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._set(1 if value else 0)
+
+    def on(self):
+        self._set(1)
+
+    def off(self):
+        self._set(0)
+
+    def _set(self, value):
+        if value and not self._value:
+            self.edges += 1
+        self._value = value
+
+    def irq(self, handler=None, trigger=IRQ_RISING, hard=False):
+        self.irq_handler = handler
+        self.irq_trigger = trigger
+
+    def drive(self, value):
+        """
+        Set an input from the simulator, firing the IRQ handler on a matching edge.
+        """
+        input_levels[self.id] = value
+        rising = value and not self._value
+        falling = not value and self._value
+        self._value = 1 if value else 0
+        if self.irq_handler and ((rising and self.irq_trigger & Pin.IRQ_RISING) or
+                                 (falling and self.irq_trigger & Pin.IRQ_FALLING)):
+            clock._run_callback(self.irq_handler, self)
+
+    def __call__(self, value=None):
+        return self.value(value)
+
+
+class PWM:
+    def __init__(self, pin, freq=None, duty=None):
+        self.pin = pin
+        self._freq = freq or 5000
+        self._duty = duty or 0
+        pwms[pin.id] = self
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self._freq = value
+
+    def duty(self, value=None):
+        if value is None:
+            return self._duty
+        self._duty = value
+
+    def deinit(self):
+        self._duty = 0
+
+
+class ADC:
+    ATTN_0DB = 0
+    ATTN_2_5DB = 1
+    ATTN_6DB = 2
+    ATTN_11DB = 3
+
+    def __init__(self, pin):
+        self.pin = pin
+        self.raw = 2048  # Set by the simulator
+        self.reads = 0
+        adcs[pin.id] = self
+
+    def atten(self, attenuation):
+        self.attenuation = attenuation
+
+    def width(self, width):
+        pass
+
+    def read(self):
+        self.reads += 1
+        return self.raw
+
+    def read_u16(self):
+        return self.read() << 4
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id=-1):
+        self.id = id
+        self.generation = 0
+        self.period_us = 0
+        self.periodic = False
+        self.callback = None
+        self.fired = 0
+        if id >= 0:
+            # Same hardware timer: taking it over stops whatever it was doing before
+            if id in timers:
+                timers[id].deinit()
+            timers[id] = self
+
+    def init(self, mode=PERIODIC, period=-1, freq=-1, callback=None):
+        self.deinit()
+        if freq > 0:
+            self.period_us = int(1000000 / freq)
+        else:
+            self.period_us = int(period * 1000)
+        self.periodic = mode == Timer.PERIODIC
+        self.callback = callback
+        clock.start_timer(self)
+
+    def deinit(self):
+        # Anything already queued for this timer is ignored from now on
+        self.generation += 1
+
+    def fire(self):
+        self.fired += 1
+        if self.callback:
+            self.callback(self)
+
+
+class WDT:
+    # There is only one hardware watchdog, every WDT() refers to it
+    def __new__(cls, id=0, timeout=5000):
+        if watchdogs:
+            return watchdogs[0]
+        return super().__new__(cls)
+
+    def __init__(self, id=0, timeout=5000):
+        if watchdogs:
+            return
+        self.timeout_ms = timeout
+        self.last_feed_us = clock.now_us
+        self.feeds = 0
+        self.longest_gap_us = 0
+        watchdogs.append(self)
+
+    def feed(self):
+        gap = clock.now_us - self.last_feed_us
+        if gap > self.longest_gap_us:
+            self.longest_gap_us = gap
+        self.last_feed_us = clock.now_us
+        self.feeds += 1
+
+    def expired(self):
+        return clock.now_us - self.last_feed_us > self.timeout_ms * 1000
+
+
+def reset_cause():
+    return reset_cause_value
+
+
+def reset():
+    global reset_count
+    reset_count += 1
+    raise SimulatedReset()
+
+
+def soft_reset():
+    reset()
+
+
+def disable_irq():
+    return 0
+
+
+def enable_irq(state=0):
+    pass
+
+
+def freq(value=None):
+    if value is None:
+        return 240000000
+
+
+def unique_id():
+    return b'\x00\x00\x00\x00\x00\x00'
@@ -0,0 +1,45 @@
+# Host stand-in for the micropython module. schedule() queues like the firmware's
+# scheduler does and runs the queue once the outermost interrupt callback has returned.
+from simclock import clock
+
+SCHEDULE_DEPTH = 8  # Same queue length as the ESP32 port
+
+emergency_exception_buf_size = 0
+heap_locked = 0
+
+
+def const(value):
+    return value
+
+
+def alloc_emergency_exception_buf(size):
+    global emergency_exception_buf_size
+    emergency_exception_buf_size = size
+
+
+def schedule(function, arg):
+    if len(clock.scheduled) >= SCHEDULE_DEPTH:
+        raise RuntimeError("schedule queue full")
+    clock.scheduled.append((function, arg))
+    if not clock._in_callback:
+        clock.run_scheduled()
+
+
+def heap_lock():
+    global heap_locked
+    heap_locked += 1
+    return heap_locked - 1
+
+
+def heap_unlock():
+    global heap_locked
+    heap_locked -= 1
+    return heap_locked
+
+
+def native(function):
+    return function
+
+
+def viper(function):
+    return function
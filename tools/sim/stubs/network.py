@@ -0,0 +1,49 @@
+# Host stand-in for MicroPython's network module. Connections succeed instantly
+# unless the simulator says otherwise.
+STA_IF = 0
+AP_IF = 1
+
+STAT_IDLE = 0
+STAT_CONNECTING = 1
+STAT_GOT_IP = 1010
+
+# Set to False from the simulator to take the access point away
+network_available = True
+
+interfaces = {}
+
+
+class WLAN:
+    def __init__(self, interface_id=STA_IF):
+        self.interface_id = interface_id
+        self._active = False
+        self._connected = False
+        self._config = {}
+        self.connect_attempts = 0
+        interfaces[interface_id] = self
+
+    def active(self, is_active=None):
+        if is_active is None:
+            return self._active
+        self._active = bool(is_active)
+
+    def config(self, *args, **kwargs):
+        if args:
+            return self._config.get(args[0])
+        self._config.update(kwargs)
+
+    def connect(self, ssid=None, password=None):
+        self.connect_attempts += 1
+        self._connected = self._active and network_available
+
+    def disconnect(self):
+        self._connected = False
+
+    def isconnected(self):
+        return self._connected and network_available
+
+    def status(self):
+        return STAT_GOT_IP if self.isconnected() else STAT_IDLE
+
+    def ifconfig(self):
+        return ('192.168.4.2', '255.255.255.0', '192.168.4.1', '192.168.4.1')
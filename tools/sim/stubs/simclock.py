@@ -0,0 +1,203 @@
+# Deterministic virtual clock shared by the host stand-ins for the MicroPython modules.
+#
+# Only one firmware thread runs at a time. A thread gives up the CPU when it sleeps, or
+# when it polls the time while another thread is due. Time only moves when every thread
+# is waiting, and then jumps straight to the next wake-up or timer, so the firmware runs
+# as fast as the host can execute it.
+import heapq
+
+try:
+    import threading
+except ImportError:
+    threading = None  # MicroPython unix port, single-threaded use only (tools/bench.py)
+
+
+class SimulationEnd(BaseException):
+    """
+    Raised in firmware threads to unwind them once the simulation is over. A
+    BaseException, so the firmware's own "except Exception" handlers let it through.
+    """
+
+
+class VirtualClock:
+    def __init__(self, poll_cost_us=1000):
+        # Every time query costs this much virtual time, so busy-wait loops still make progress
+        self.poll_cost_us = poll_cost_us
+        self.now_us = 0
+        self.stop_at_us = None
+        self.stopped = False
+        self.errors = []
+
+        self._seq = 0
+        self._timers = []  # Heap of (due_us, seq, timer, generation)
+        self._ready = []  # Heap of (wake_us, seq, thread_id)
+        self._running = threading.get_ident() if threading else 0
+        self._condition = threading.Condition() if threading else None
+        self._hooks = []  # Heap of (due_us, seq, period_us, callback) for the simulator itself
+        self._in_callback = 0  # Timer callbacks and hooks run like ISRs: time stands still, no switching
+        self.scheduled = []  # (function, arg) from micropython.schedule, run after the callbacks
+
+    # ┌─────────────────────┐
+    # │ Time                │
+    # └─────────────────────┘
+    def ticks_us(self):
+        self._poll()
+        return self.now_us
+
+    def _next_seq(self):
+        self._seq += 1
+        return self._seq
+
+    def _advance_to(self, target_us):
+        # Fire everything due up to target_us in time order, in the calling thread like an ISR
+        while True:
+            next_due = target_us
+            if self._timers and self._timers[0][0] <= next_due:
+                next_due = self._timers[0][0]
+            if self._hooks and self._hooks[0][0] <= next_due:
+                next_due = self._hooks[0][0]
+            if self.stop_at_us is not None and next_due > self.stop_at_us:
+                self.now_us = self.stop_at_us
+                self.stop()
+                raise SimulationEnd()
+            self.now_us = max(self.now_us, next_due)
+
+            if self._hooks and self._hooks[0][0] <= self.now_us:
+                _, _, period_us, callback = heapq.heappop(self._hooks)
+                if period_us:
+                    heapq.heappush(self._hooks, (self.now_us + period_us, self._next_seq(), period_us, callback))
+                self._run_callback(callback, self)
+            elif self._timers and self._timers[0][0] <= self.now_us:
+                _, _, timer, generation = heapq.heappop(self._timers)
+                if generation == timer.generation:
+                    if timer.period_us and timer.periodic:
+                        self._push_timer(timer, self.now_us + timer.period_us)
+                    self._run_callback(timer.fire)
+            else:
+                return
+
+    def _run_callback(self, callback, *args):
+        self._in_callback += 1
+        try:
+            callback(*args)
+        finally:
+            self._in_callback -= 1
+        if not self._in_callback and self.scheduled:
+            self.run_scheduled()
+
+    def run_scheduled(self):
+        # Scheduled functions run outside interrupt context, one at a time in order
+        while self.scheduled:
+            function, arg = self.scheduled.pop(0)
+            function(arg)
+
+    def _poll(self):
+        if self.stopped:
+            raise SimulationEnd()
+        if self._in_callback:
+            return
+        self._advance_to(self.now_us + self.poll_cost_us)
+        # Let other threads that are due run first, the way the RTOS would preempt us
+        if self._ready and self._ready[0][0] <= self.now_us:
+            self._yield_until(self.now_us)
+
+    def sleep_us(self, duration_us):
+        if self.stopped:
+            raise SimulationEnd()
+        if self._in_callback:
+            raise RuntimeError("sleep called from a timer or interrupt callback")
+        self._yield_until(self.now_us + max(int(duration_us), 0))
+
+    def block_us(self, duration_us):
+        """
+        A blocking call, e.g. a socket connect: time passes in the calling thread, timers and
+        hooks fire, but no other thread gets the CPU.
+        """
+        if self.stopped:
+            raise SimulationEnd()
+        if not self._in_callback:
+            self._advance_to(self.now_us + max(int(duration_us), 0))
+
+    # ┌─────────────────────┐
+    # │ Timers and hooks    │
+    # └─────────────────────┘
+    def _push_timer(self, timer, due_us):
+        heapq.heappush(self._timers, (due_us, self._next_seq(), timer, timer.generation))
+
+    def start_timer(self, timer):
+        self._push_timer(timer, self.now_us + timer.period_us)
+
+    def every(self, period_s, callback):
+        """
+        Call callback(clock) every period_s of virtual time, for plant models and probes.
+        """
+        period_us = int(period_s * 1000000)
+        heapq.heappush(self._hooks, (self.now_us + period_us, self._next_seq(), period_us, callback))
+
+    def at(self, time_s, callback):
+        """
+        Call callback(clock) once at time_s of virtual time, for scripted scenario events.
+        """
+        heapq.heappush(self._hooks, (int(time_s * 1000000), self._next_seq(), 0, callback))
+
+    # ┌─────────────────────┐
+    # │ Threads             │
+    # └─────────────────────┘
+    def _yield_until(self, wake_us):
+        me = threading.get_ident()
+        with self._condition:
+            heapq.heappush(self._ready, (wake_us, self._next_seq(), me))
+            self._switch()
+            while self._running != me and not self.stopped:
+                self._condition.wait()
+        if self.stopped and self._running != me:
+            raise SimulationEnd()
+
+    def _switch(self):
+        # Hand the CPU to whichever thread wakes first, moving time forward if needed
+        wake_us, _, thread_id = heapq.heappop(self._ready)
+        try:
+            self._advance_to(wake_us)
+        except SimulationEnd:
+            self._condition.notify_all()
+            raise
+        self._running = thread_id
+        self._condition.notify_all()
+
+    def start_thread(self, function, args):
+        def run():
+            me = threading.get_ident()
+            with self._condition:
+                while self._running != me and not self.stopped:
+                    self._condition.wait()
+            try:
+                if not self.stopped:
+                    function(*args)
+            except SimulationEnd:
+                return
+            except BaseException as e:
+                self.errors.append((function.__name__, e))
+            with self._condition:
+                # The thread is done, pass the CPU on
+                if self._running == me and self._ready and not self.stopped:
+                    try:
+                        self._switch()
+                    except SimulationEnd:
+                        pass
+
+        thread = threading.Thread(target=run, daemon=True)
+        with self._condition:
+            thread.start()
+            heapq.heappush(self._ready, (self.now_us, self._next_seq(), thread.ident))
+        return thread.ident
+
+    def stop(self):
+        if self._condition is None:
+            self.stopped = True
+            return
+        with self._condition:
+            self.stopped = True
+            self._condition.notify_all()
+
+
+clock = VirtualClock()
@@ -0,0 +1,116 @@
+# Host stand-in for umqtt.simple with an in-memory broker, so the firmware's MQTT code
+# can run in the simulator without a network. The client talks to the broker over the
+# stand-in sockets in usocket.py, so connecting and subscribing take the broker's round
+# trip of virtual time, and block while the broker is down.
+import usocket
+from simclock import clock
+
+
+class MQTTException(Exception):
+    pass
+
+
+class Broker:
+    def __init__(self):
+        self.available = True
+        self.latency = 0.005  # s, one round trip to the broker
+        self.clients = []
+        self.published = []  # (topic, msg) from every client, in order
+
+    def publish(self, topic, msg):
+        """
+        Deliver a message to every subscribed client, e.g. a command from the simulator. It
+        arrives half a round trip later.
+        """
+        if isinstance(topic, str):
+            topic = topic.encode()
+        if isinstance(msg, str):
+            msg = msg.encode()
+        self.published.append((topic, msg))
+
+        def deliver(_):
+            for client in self.clients:
+                if client.connected and topic in client.subscriptions:
+                    client.inbox.append((topic, msg))
+
+        if self.latency:
+            clock.at(clock.now_us / 1000000 + self.latency / 2, deliver)
+        else:
+            deliver(None)
+
+
+broker = Broker()
+
+
+class MQTTClient:
+    def __init__(self, client_id, server, port=0, user=None, password=None, keepalive=0, ssl=False,
+                 ssl_params=None):
+        self.client_id = client_id
+        self.server = server
+        self.port = port or 1883
+        self.keepalive = keepalive
+        self.sock = None
+        self.connected = False
+        self.subscriptions = set()
+        self.inbox = []
+        self.cb = None
+        self.connects = 0
+        self.subscribe_calls = 0
+        self.pings = 0
+
+    def _check(self):
+        if not self.connected or not broker.available or self.sock is None or self.sock.closed:
+            self.connected = False
+            raise OSError(-1)
+
+    def connect(self, clean_session=True, timeout=None):
+        self.connected = False
+        self.sock = usocket.socket()
+        self.sock.settimeout(timeout)
+        self.sock.connect(usocket.getaddrinfo(self.server, self.port)[0][-1])
+        clock.block_us(broker.latency * 1000000)  # CONNECT and CONNACK
+        self.sock.client = self
+        self.connected = True
+        self.connects += 1
+        if clean_session:
+            self.subscriptions = set()
+            self.inbox = []
+        if self not in broker.clients:
+            broker.clients.append(self)
+        return 0
+
+    def disconnect(self):
+        self.connected = False
+        if self.sock is not None:
+            self.sock.close()
+
+    def ping(self):
+        self._check()
+        self.pings += 1
+
+    def set_callback(self, f):
+        self.cb = f
+
+    def subscribe(self, topic, qos=0):
+        self._check()
+        clock.block_us(broker.latency * 1000000)  # Waits for the SUBACK
+        if isinstance(topic, str):
+            topic = topic.encode()
+        self.subscriptions.add(topic)
+        self.subscribe_calls += 1
+
+    def publish(self, topic, msg, retain=False, qos=0):
+        self._check()
+        broker.publish(topic, msg)
+
+    def wait_msg(self):
+        self._check()
+        if not self.inbox:
+            return None
+        topic, msg = self.inbox.pop(0)
+        if self.cb:
+            self.cb(topic, msg)
+        return topic
+
+    def check_msg(self):
+        return self.wait_msg()
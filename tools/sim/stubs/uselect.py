@@ -0,0 +1,45 @@
+# Host stand-in for MicroPython's uselect, for the stand-in sockets in usocket.py. A poll
+# that has to wait holds up the calling thread on the virtual clock, like on the board.
+from simclock import clock
+from usocket import POLLIN, POLLOUT, POLLERR, POLLHUP  # noqa: F401
+
+WAIT_STEP_US = 1000
+
+
+class poll:
+    def __init__(self):
+        self.registered = []  # [socket, event mask]
+
+    def register(self, obj, eventmask=POLLIN | POLLOUT):
+        for entry in self.registered:
+            if entry[0] is obj:
+                entry[1] = eventmask
+                return
+        self.registered.append([obj, eventmask])
+
+    def modify(self, obj, eventmask):
+        self.register(obj, eventmask)
+
+    def unregister(self, obj):
+        self.registered = [entry for entry in self.registered if entry[0] is not obj]
+
+    def _ready(self):
+        ready = []
+        for obj, mask in self.registered:
+            # Errors and hang-ups are always reported, whatever the mask
+            found = obj.events() & (mask | POLLERR | POLLHUP)
+            if found:
+                ready.append((obj, found))
+        return ready
+
+    def poll(self, timeout=-1):
+        waited_us = 0
+        while True:
+            ready = self._ready()
+            if ready or (timeout >= 0 and waited_us >= timeout * 1000):
+                return ready
+            clock.block_us(WAIT_STEP_US)
+            waited_us += WAIT_STEP_US
+
+    def ipoll(self, timeout=-1, flags=0):
+        return iter(self.poll(timeout))
@@ -0,0 +1,97 @@
+# Host stand-in for MicroPython's usocket. The only peer is the broker stand-in in
+# umqtt/simple.py, so nothing goes out on the real network. Connecting takes the broker's
+# round trip of virtual time, or, while it is down, never completes: a blocking connect
+# then holds up the calling thread until its timeout, like lwIP does.
+import errno
+from simclock import clock
+
+AF_INET = 2
+SOCK_STREAM = 1
+
+DEFAULT_CONNECT_TIMEOUT = 30  # s a blocking connect without a timeout waits for a host that doesn't answer
+
+# uselect flags, here so uselect and umqtt.simple don't import each other
+POLLIN = 0x001
+POLLOUT = 0x004
+POLLERR = 0x008
+POLLHUP = 0x010
+
+
+def _broker():
+    from umqtt.simple import broker
+    return broker
+
+
+class Resolver:
+    """
+    The DNS server. Looking up a name holds up the calling thread for latency, an IP
+    address comes straight back, like lwIP does.
+    """
+    def __init__(self):
+        self.latency = 0.02  # s
+        self.address = '10.0.0.2'  # What every name resolves to
+        self.lookups = 0  # Names looked up
+
+    def lookup(self, host):
+        parts = host.split('.')
+        if len(parts) == 4 and all(part.isdigit() for part in parts):
+            return host
+        self.lookups += 1
+        clock.block_us(self.latency * 1000000)
+        return self.address
+
+
+resolver = Resolver()
+
+
+def getaddrinfo(host, port, af=0, type=0, proto=0, flags=0):
+    return [(AF_INET, SOCK_STREAM, 0, '', (resolver.lookup(host), port))]
+
+
+class socket:
+    def __init__(self, af=AF_INET, type=SOCK_STREAM, proto=0):
+        self.timeout = None  # None blocks, 0 doesn't
+        self.connect_started_us = None
+        self.connected = False
+        self.closed = False
+        self.client = None  # The umqtt.simple client whose messages arrive on this socket
+
+    def setblocking(self, flag):
+        self.timeout = None if flag else 0
+
+    def settimeout(self, value):
+        self.timeout = value
+
+    def connect(self, address):
+        broker = _broker()
+        self.connect_started_us = clock.now_us
+        if self.timeout == 0:
+            raise OSError(errno.EINPROGRESS)
+        if broker.available:
+            clock.block_us(broker.latency * 1000000)
+            self.connected = True
+            return
+        clock.block_us((DEFAULT_CONNECT_TIMEOUT if self.timeout is None else self.timeout) * 1000000)
+        raise OSError(errno.ETIMEDOUT)
+
+    def events(self):
+        """
+        The uselect flags that are set on this socket right now.
+        """
+        broker = _broker()
+        if self.closed:
+            return POLLHUP
+        if not self.connected:
+            if self.connect_started_us is None or not broker.available:
+                return 0
+            if clock.now_us - self.connect_started_us < broker.latency * 1000000:
+                return 0
+            self.connected = True
+        flags = POLLOUT
+        if self.client is not None and (self.client.inbox or not self.client.connected):
+            flags |= POLLIN
+        return flags
+
+    def close(self):
+        self.closed = True
+        self.connected = False
@@ -0,0 +1,42 @@
+# Host stand-in for MicroPython's utime, running on the simulator's virtual clock.
+from simclock import clock
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_HALF = _TICKS_PERIOD // 2
+
+
+def ticks_us():
+    return clock.ticks_us() % _TICKS_PERIOD
+
+
+def ticks_ms():
+    return (clock.ticks_us() // 1000) % _TICKS_PERIOD
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) % _TICKS_PERIOD
+
+
+def ticks_diff(ticks1, ticks2):
+    # Same wrap-around behaviour as the firmware's ticks
+    return ((ticks1 - ticks2 + _TICKS_HALF) % _TICKS_PERIOD) - _TICKS_HALF
+
+
+def time():
+    return clock.ticks_us() // 1000000
+
+
+def time_ns():
+    return clock.ticks_us() * 1000
+
+
+def sleep(seconds):
+    clock.sleep_us(seconds * 1000000)
+
+
+def sleep_ms(ms):
+    clock.sleep_us(ms * 1000)
+
+
+def sleep_us(us):
+    clock.sleep_us(us)
@@ -0,0 +1,30 @@
+# Run the firmware on the host against a simulated heater, faster than real time.
+#
+# Usage: python tools/simulate.py [--duration 3600] [--on 5] [--off 2400] [--verbose]
+#                                 [--set Section.KEY=value ...]
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim'))
+
+from scenario import parse_overrides, run_cycle  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the firmware against a simulated heater.")
+    parser.add_argument('--duration', type=float, default=3600, help='virtual seconds to run at most')
+    parser.add_argument('--on', type=float, default=5, help='when to switch the heater on')
+    parser.add_argument('--off', type=float, default=2400, help='when to switch the heater off')
+    parser.add_argument('--set', action='append', default=[], metavar='Section.KEY=value',
+                        help='override a config.json value')
+    parser.add_argument('--verbose', action='store_true', help='show the firmware log')
+    args = parser.parse_args()
+
+    sim = run_cycle(args.duration, args.on, args.off, parse_overrides(args.set), quiet=not args.verbose)
+    print(sim.report())
+    sys.exit(1 if sim.errors else 0)
+
+
+if __name__ == "__main__":
+    main()
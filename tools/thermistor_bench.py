@@ -0,0 +1,78 @@
+# Compare the thermistor lookup tables against the Beta formula they replace.
+# Checks accuracy over every ADC code and times both conversions.
+#
+# Usage: python tools/thermistor_bench.py [max_error_c]
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lib import thermistor  # noqa: E402
+
+# Only readings in this range matter to the controller, the rest is an open/shorted sensor
+USEFUL_RANGE_C = (-40.0, 300.0)
+DEFAULT_MAX_ERROR_C = 0.1
+
+
+def sensors_to_check():
+    with open(os.path.join(ROOT, 'config.json')) as f:
+        settings = json.load(f)['SensorSettings']
+    sensors = {
+        (settings['OUTPUT_SENSOR_TYPE'], settings['OUTPUT_SENSOR_BETA']),
+        (settings['EXHAUST_SENSOR_TYPE'], settings['EXHAUST_SENSOR_BETA']),
+    }
+    for sensor_type in thermistor.common_thermistors:
+        sensors.add((sensor_type, 3950))
+    return sorted(sensors)
+
+
+def check_accuracy(sensor_type, sensor_beta):
+    table = thermistor.build_table(sensor_type, sensor_beta)
+    worst_error = 0.0
+    worst_code = None
+    for code in range(1, thermistor.ADC_MAX):
+        expected = thermistor.beta_temperature(code, sensor_type, sensor_beta)
+        if not USEFUL_RANGE_C[0] <= expected <= USEFUL_RANGE_C[1]:
+            continue
+        error = abs(thermistor.lookup(table, code) - expected)
+        if error > worst_error:
+            worst_error = error
+            worst_code = code
+    return worst_error, worst_code
+
+
+def time_per_call(func, rounds=20):
+    codes = range(1, thermistor.ADC_MAX)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for code in codes:
+            func(code)
+    return (time.perf_counter() - start) / (rounds * len(codes)) * 1e9
+
+
+def main():
+    max_error = float(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_MAX_ERROR_C
+    failed = False
+
+    print(f"{'sensor':<10} {'beta':>5} {'max err C':>10} {'at code':>8} {'formula ns':>11} {'table ns':>9}")
+    for sensor_type, sensor_beta in sensors_to_check():
+        table = thermistor.build_table(sensor_type, sensor_beta)
+        worst_error, worst_code = check_accuracy(sensor_type, sensor_beta)
+        formula_ns = time_per_call(lambda code: thermistor.beta_temperature(code, sensor_type, sensor_beta))
+        table_ns = time_per_call(lambda code: thermistor.lookup(table, code))
+        print(f"{sensor_type:<10} {sensor_beta:>5} {worst_error:>10.4f} {str(worst_code):>8} "
+              f"{formula_ns:>11.0f} {table_ns:>9.0f}")
+        if worst_error > max_error:
+            failed = True
+
+    if failed:
+        print(f"FAIL: lookup error above {max_error}C")
+        sys.exit(1)
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
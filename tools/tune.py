@@ -0,0 +1,207 @@
+# Sweep config.json parameters against the simulated heater and write the best config.
+#
+# Every candidate runs the unmodified firmware through one on/off cycle in
+# tools/sim/simulator.py, spread over a process pool. Candidates are ranked by
+# time-to-RUNNING, temperature overshoot, fuel used and the number of start cycles, and
+# the winner is written out as a complete config.json that can be uploaded to the board.
+#
+# Usage: python tools/tune.py [--random 32 | --grid] [--workers 4] [--seed 1]
+#                             [--param Section.KEY=v1,v2,...] [--set Section.KEY=value]
+#                             [--ambient 5] [--off 3600] [--output tuned_config.json]
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sim'))
+
+from scenario import parse_overrides, merged, run_cycle, failed  # noqa: E402
+from simulator import ROOT  # noqa: E402
+from lib.plant import HeaterPlant  # noqa: E402
+
+# The control mode and flame-out detector the search space is for, every candidate runs
+# with them, so none of the parameters below is left unused
+PINNED = {
+    'TemperatureControl': {'CONTROL_MODE': 'modulating'},
+    'FlameOutDetection': {'FLAME_OUT_DETECTOR': 'slope'},
+}
+
+# Values tried for each parameter, as Section.KEY from config.json
+SEARCH_SPACE = {
+    'TemperatureControl.HEAT_KP': [2.5, 5.0, 10.0],
+    'TemperatureControl.HEAT_KI': [0.0025, 0.005, 0.01],
+    'TemperatureControl.FUEL_AIR_MAP': [
+        "0:1.0:20,25:2.0:30,50:3.0:40,75:4.0:50,100:5.0:60",
+        "0:1.0:25,25:2.0:35,50:3.0:45,75:4.0:55,100:5.0:65",  # More air
+        "0:0.8:20,25:1.8:30,50:2.8:40,75:3.8:50,100:5.0:60",  # Leaner at part load
+    ],
+    'FuelPumpControl.MIN_PUMP_FREQUENCY': [0.8, 1.0, 1.5],
+    'FuelPumpControl.MAX_PUMP_FREQUENCY': [4.0, 5.0],
+    'FanControl.MIN_FAN_PERCENTAGE': [20, 30],
+    'FanControl.MAX_FAN_PERCENTAGE': [60, 80],
+    'FlameOutDetection.FLAME_OUT_WINDOW': [5, 6, 8],
+    'FlameOutDetection.FLAME_OUT_SLOPE': [0.4, 0.6, 0.8],
+    'FlameOutDetection.FLAME_OUT_T': [3.0, 4.0, 5.0],
+    'StartupSettings.RAMP_FAN_STEP_PERCENTAGE': [10, 20],
+    'StartupSettings.RAMP_PUMP_STEP_FREQUENCY': [0.5, 1.0],
+    'StartupSettings.RAMP_SAMPLE_COUNT': [10, 20],
+    'StartupSettings.RAMP_MIN_TEMP_RISE': [3.0, 5.0],
+    'StartupSettings.RAMP_RISE_RATE': [0.2, 0.3, 0.5],
+    'StartupSettings.GLOW_PLUG_MIN_HEAT_UP_TIME': [15, 20, 30],
+}
+
+# Score weights, lower scores rank higher
+WEIGHT_TIME_TO_RUNNING = 1 / 60  # per second
+WEIGHT_OVERSHOOT = 1.0  # per degree over TARGET_TEMP
+WEIGHT_FUEL = 1 / 100  # per ml
+WEIGHT_CYCLES = 2.0  # per STARTING after the first one
+
+PULSE_ML = 0.022
+GRID_LIMIT = 2000
+
+
+def candidate_overrides(candidate, fixed):
+    overrides = json.loads(json.dumps(fixed))
+    for key, value in candidate.items():
+        section, name = key.split('.', 1)
+        overrides.setdefault(section, {})[name] = value
+    return overrides
+
+
+def score(sim, switch_on):
+    """
+    Boil one simulation down to the numbers the candidates are ranked by.
+    """
+    target = sim.settings['TemperatureControl']['TARGET_TEMP']
+    states = [state for _, state in sim.timeline]
+    running_at = next((when for when, state in sim.timeline if state == 'RUNNING'), None)
+    peak = max((sample[2] for sample in sim.samples if running_at is not None and sample[0] >= running_at),
+               default=None)
+    result = {
+        'time_to_running': None if running_at is None else running_at - switch_on,
+        'overshoot': None if peak is None else max(peak - target, 0.0),
+        'fuel_ml': sim.fuel_pulses * PULSE_ML,
+        'cycles': states.count('STARTING'),
+        'failed': failed(sim),
+    }
+    if running_at is None or result['failed']:
+        result['score'] = float('inf')
+    else:
+        result['score'] = (WEIGHT_TIME_TO_RUNNING * result['time_to_running'] +
+                           WEIGHT_OVERSHOOT * result['overshoot'] +
+                           WEIGHT_FUEL * result['fuel_ml'] +
+                           WEIGHT_CYCLES * max(result['cycles'] - 1, 0))
+    return result
+
+
+def evaluate(job):
+    candidate, fixed, ambient, switch_on, switch_off = job
+    plant = HeaterPlant(ambient=ambient)
+    sim = run_cycle(switch_off + 1200, switch_on, switch_off, candidate_overrides(candidate, fixed), plant=plant)
+    result = score(sim, switch_on)
+    result['candidate'] = candidate
+    return result
+
+
+def make_candidates(space, mode, count, seed):
+    keys = list(space)
+    if mode == 'grid':
+        total = 1
+        for key in keys:
+            total *= len(space[key])
+        if total > GRID_LIMIT:
+            raise SystemExit(f"Grid has {total} candidates, narrow it down with --param or use --random")
+        return [dict(zip(keys, values)) for values in itertools.product(*(space[key] for key in keys))]
+
+    rng = random.Random(seed)
+    candidates = []
+    seen = set()
+    for _ in range(count * 20):
+        if len(candidates) >= count:
+            break
+        values = tuple(rng.choice(space[key]) for key in keys)
+        if values not in seen:
+            seen.add(values)
+            candidates.append(dict(zip(keys, values)))
+    return candidates
+
+
+def write_config(path, candidate, fixed):
+    # Start from the repo's config.json, not the simulator's, so the web server and
+    # network settings stay as they are on the board
+    with open(os.path.join(ROOT, 'config.json')) as f:
+        settings = json.load(f)
+    for section, values in candidate_overrides(candidate, fixed).items():
+        settings.setdefault(section, {}).update(values)
+    # The board's own layout, so the file diffs cleanly against config.json. hardwareConfig
+    # reads config.json from the current directory when helpers imports it.
+    cwd = os.getcwd()
+    os.chdir(ROOT)
+    try:
+        from lib import helpers
+    finally:
+        os.chdir(cwd)
+    with open(path, 'w') as f:
+        f.write(helpers.pretty_print_json(settings) + "\n")
+
+
+def format_value(value, unit=''):
+    return '-' if value is None else f"{value:.1f}{unit}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tune config.json parameters against the simulated heater.")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--grid', action='store_true', help='try every combination of the search space')
+    mode.add_argument('--random', type=int, default=32, metavar='N', help='try N random combinations (default)')
+    parser.add_argument('--seed', type=int, default=1, help='seed for --random')
+    parser.add_argument('--param', action='append', default=[], metavar='Section.KEY=v1,v2,...',
+                        help='search these values for a parameter, replacing or adding to the default space')
+    parser.add_argument('--only', action='store_true', help='search only the parameters given with --param')
+    parser.add_argument('--set', action='append', default=[], metavar='Section.KEY=value',
+                        help='fix a config.json value for every candidate')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='simulations to run in parallel')
+    parser.add_argument('--ambient', type=float, default=5.0, help='ambient temperature of the simulated heater')
+    parser.add_argument('--on', type=float, default=5, help='when to switch the heater on')
+    parser.add_argument('--off', type=float, default=3600, help='when to switch the heater off')
+    parser.add_argument('--top', type=int, default=10, help='how many candidates to list')
+    parser.add_argument('--output', default='tuned_config.json', help='where to write the best config')
+    args = parser.parse_args()
+
+    space = {} if args.only else dict(SEARCH_SPACE)
+    for item in args.param:
+        key, values = item.split('=', 1)
+        space[key] = [json.loads(value) for value in values.split(',')]
+    fixed = merged(PINNED, parse_overrides(args.set))
+
+    candidates = make_candidates(space, 'grid' if args.grid else 'random', args.random, args.seed)
+    # The config as it is today is always in the running, as the bar to beat
+    candidates.insert(0, {})
+    print(f"Simulating {len(candidates)} candidates on {args.workers} worker(s)")
+
+    jobs = [(candidate, fixed, args.ambient, args.on, args.off) for candidate in candidates]
+    # One simulation per worker process, the firmware keeps its state in module globals
+    with ProcessPoolExecutor(max_workers=args.workers, max_tasks_per_child=1) as pool:
+        results = list(pool.map(evaluate, jobs))
+
+    results.sort(key=lambda result: result['score'])
+    print(f"{'rank':>4} {'score':>7} {'to RUN':>8} {'over':>6} {'fuel':>8} {'starts':>6}  changes")
+    for rank, result in enumerate(results[:args.top], 1):
+        changes = ', '.join(f"{key.split('.', 1)[1]}={value}" for key, value in result['candidate'].items())
+        print(f"{rank:>4} {result['score']:>7.2f} {format_value(result['time_to_running'], 's'):>8} "
+              f"{format_value(result['overshoot'], 'C'):>6} {format_value(result['fuel_ml'], 'ml'):>8} "
+              f"{result['cycles']:>6}  {changes or '(current config.json)'}")
+
+    best = results[0]
+    if best['score'] == float('inf'):
+        print("No candidate reached RUNNING without failing, nothing written")
+        sys.exit(1)
+    write_config(args.output, best['candidate'], fixed)
+    print(f"Wrote {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,17 @@
 import network
-import socket
 import machine
 import json
-import utime
+from lib import autotune, eventLog
+from states import emergencyStop
+from lib.helpers import pretty_print_json
+
+try:
+    import uasyncio as asyncio
+except ImportError:
+    import asyncio  # CPython, for running the firmware on a PC
+
+# Listening server, kept so it isn't garbage collected
+server = None
 
 
 def unquote_plus(string):
@@ -55,6 +64,18 @@ HTML_PAGE = """
             {} <!-- Form fields will be injected here -->
             <input type="submit" value="Save">
         </form>
+        <form action="/autotune" method="post">
+            <h2>Autotune</h2>
+            <p>{}</p>
+            <button type="submit" name="loop" value="fan">Tune fan (OFF or STANDBY)</button>
+            <button type="submit" name="loop" value="temperature">Tune temperature (RUNNING)</button>
+            <button type="submit" name="loop" value="stop">Stop tuning</button>
+        </form>
+        <form action="/emergency_reset" method="post">
+            <h2>Emergency Stop</h2>
+            <p>{}</p>
+            <input type="submit" value="Reset emergency stop">
+        </form>
         <form action="/restart" method="post">
             <input type="submit" value="Restart ESP32" class="restart-btn">
         </form>
@@ -73,6 +94,13 @@ def read_config_params():
         return {}
 
 
+def emergency_status():
+    status = emergencyStop.status()
+    if not status['latched']:
+        return "not latched"
+    return f"latched for {status['seconds']}s: {status['reason']}"
+
+
 # Generate HTML page based on config.json
 def generate_html_page(params):
     input_fields = ""
@@ -82,18 +110,7 @@ def generate_html_page(params):
             safe_key = escape_html(key)
             safe_value = escape_html(str(value))
             input_fields += f'{safe_key}: <input type="text" name="{section}.{safe_key}" value="{safe_value}"><br>'
-    return HTML_PAGE.format(input_fields)
-
-
-# Custom pretty-print function for JSON-like dictionaries
-def pretty_print_json(data, indent=4, level=0):
-    if not isinstance(data, dict):  # if the data is not a dictionary, just return it as a string
-        return str(data)
-    items = []
-    for key, value in data.items():
-        items.append(' ' * (level * indent) + f'"{key}": ' + (
-            pretty_print_json(value, indent, level + 1) if isinstance(value, dict) else json.dumps(value)))
-    return "{\n" + ",\n".join(items) + "\n" + ' ' * (level - 1) * indent + "}"
+    return HTML_PAGE.format(input_fields, escape_html(autotune.status()), escape_html(emergency_status()))
 
 
 def handle_post_data(data):
@@ -126,32 +143,53 @@ def handle_post_data(data):
     return params  # Returning params is optional, depending on whether you want to use it after calling this function
 
 
-# Web server function
-def web_server():
-    addr = socket.getaddrinfo('0.0.0.0', 80)[0][-1]
-    s = socket.socket()
-    s.bind(addr)
-    s.listen(1)
-
-    while True:
-        conn, addr = s.accept()
-        request = conn.recv(1024)
+# Serve one HTTP request
+async def handle_client(reader, writer):
+    try:
+        request = await reader.read(1024)
         request_str = str(request, 'utf-8')
 
         if request_str.startswith('POST'):
             post_data = request_str.split('\r\n\r\n')[-1]
             if "/restart" in request_str:
-                conn.sendall("HTTP/1.1 200 OK\r\n\r\nRestarting...".encode('utf-8'))
-                conn.close()
-                utime.sleep(1)  # Delay to ensure the response is sent before resetting
+                eventLog.events.record(eventLog.RESTART)
+                writer.write("HTTP/1.1 200 OK\r\n\r\nRestarting...".encode('utf-8'))
+                await writer.drain()
+                writer.close()
+                await asyncio.sleep(1)  # Delay to ensure the response is sent before resetting
                 machine.reset()
+            elif "/emergency_reset" in request_str:
+                print(f"Emergency stop: {emergencyStop.reset()}")
+                writer.write("HTTP/1.1 303 See Other\r\nLocation: /\r\n\r\n".encode('utf-8'))
+            elif "/autotune" in request_str:
+                loop = post_data.split('=')[-1].strip()
+                if loop == 'stop':
+                    autotune.stop()
+                else:
+                    autotune.start(loop)
+                writer.write("HTTP/1.1 303 See Other\r\nLocation: /\r\n\r\n".encode('utf-8'))
             else:
                 handle_post_data(post_data)
                 # Redirect to root
-                conn.sendall("HTTP/1.1 303 See Other\r\nLocation: /\r\n\r\n".encode('utf-8'))
+                writer.write("HTTP/1.1 303 See Other\r\nLocation: /\r\n\r\n".encode('utf-8'))
+        elif request_str.startswith('GET /events'):
+            # Binary records, oldest first, for tools/decode_events.py
+            writer.write("HTTP/1.1 200 OK\r\nContent-Type: application/octet-stream\r\n\r\n".encode('utf-8'))
+            for data in eventLog.events.chunks():
+                writer.write(data)
+                await writer.drain()
         else:
             params = read_config_params()
             html_page = generate_html_page(params)
-            conn.sendall("HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n".encode('utf-8') + html_page.encode('utf-8'))
-
-        conn.close()
+            writer.write("HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n".encode('utf-8') + html_page.encode('utf-8'))
+        await writer.drain()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+# Web server, runs as part of the main event loop
+async def start_server():
+    global server
+    server = await asyncio.start_server(handle_client, '0.0.0.0', 80)
+    return server